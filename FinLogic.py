@@ -1,407 +1,550 @@
-import requests
-from bs4 import BeautifulSoup
-import yfinance as yf
-import numpy as np
-import pandas as pd
+import argparse
+import csv
 from datetime import datetime, timedelta
-from pypfopt import EfficientFrontier, risk_models, expected_returns, objective_functions
 import warnings
-import json
 import os
-import ta
-import cvxpy as cp
+
+from instrumentation import METRICS, logger, run_session
+
+# Тяжёлые зависимости (pandas, numpy, yfinance, cvxpy, bs4) импортируются внутри
+# методов, которым они нужны: импорт модуля не загружает их и ничего не выполняет
 
 warnings.filterwarnings("ignore")
 
 class FinLogic:
-    def __init__(self, data_dir='data', portfolio_file='portfolio.csv', cache_file='cache.json'):
-        self.cache_file = cache_file
-        self.cache = self.load_cache()
+    def __init__(self, data_dir='data', portfolio_file='portfolio.csv', cache_file='cache.json', provider=None, incremental=False, batch_size=50, solver='auto', cov_method='sample',
+                 interactive=True, allow=None, deny=None, auto_confirm=False, availability_ttl=30 * 24 * 3600,
+                 currency='KZT', min_lot=5000, rebalance=False, transaction_cost=0.001, turnover_penalty=0.0):
         self.data_dir = data_dir
+        # Файл кэшей (SQLite): для cache.json — cache.db рядом с ним, старый JSON с ответами переносится туда
+        self.cache_file = cache_file
+        self.availability_ttl = availability_ttl
+        self.kv_store = None  # Открывается при первом обращении
+        self._cache = None
         self.portfolio_file = portfolio_file
+        self.current_quantities = {}  # Количества из колонки Quantity (в старых файлах её нет)
         self.current_portfolio = self.load_portfolio()
         self.default_start_date = (datetime.today() - timedelta(days=3*365)).strftime('%Y-%m-%d')
         self.end_date = datetime.today().strftime('%Y-%m-%d')
         self.data_store = {}
+        self._price_store = None
+        if provider is None:
+            from providers import YFinanceProvider
+            provider = YFinanceProvider()
+        self.provider = provider
+        self.incremental = incremental  # Дозагружать хвост истории для тикеров из хранилища
+        self.batch_size = batch_size
+        self.solver = solver  # 'auto', 'heuristic' или имя решателя cvxpy
+        self.currency = currency  # Валюта суммы инвестиций и отчёта
+        self.min_lot = min_lot  # Минимальная покупка в валюте currency
+        # Ребалансировка от текущих позиций вместо распределения только новых денег
+        self.rebalance = rebalance
+        self.transaction_cost = transaction_cost  # Комиссия как доля суммы сделки
+        self.turnover_penalty = turnover_penalty  # Штраф целевой функции за каждый $ оборота
+        self.conversion_rate = None
+        self.fx = None
+        self.cov_method = cov_method  # 'sample', 'ledoit_wolf' или 'ewma'
+        self.covariance_service = None
+        self.ticker_sources = None
+        self.fundamentals = None
+        # Без интерактива вопросы заменяются политикой: списки allow/deny и auto_confirm
+        self.interactive = interactive
+        self.allow = set(allow or [])
+        self.deny = set(deny or [])
+        self.auto_confirm = auto_confirm
         # self.load_data(list(self.current_portfolio.keys()))
 
+    @classmethod
+    def from_args(cls, args):
+        """Экземпляр по общим параметрам командной строки (см. common_arguments)."""
+        return cls(args.data_dir, args.portfolio, args.cache, incremental=args.incremental,
+                   solver=args.solver, cov_method=args.cov_method, interactive=not args.non_interactive,
+                   allow=args.allow, deny=args.deny, auto_confirm=args.auto_confirm,
+                   currency=args.currency, min_lot=args.min_lot, rebalance=args.rebalance,
+                   transaction_cost=args.transaction_cost, turnover_penalty=args.turnover_penalty)
+
     def load_portfolio(self):
-        print("Загрузка портфеля...")
-        portfolio = pd.read_csv(self.portfolio_file, index_col='Ticker').to_dict()['Value']
-        print("Портфель загружен.")
+        logger.info("Загрузка портфеля...")
+        portfolio = {}
+        with open(self.portfolio_file, newline='') as file:
+            for row in csv.DictReader(file):
+                portfolio[row['Ticker']] = float(row['Value'])
+                if row.get('Quantity'):
+                    self.current_quantities[row['Ticker']] = float(row['Quantity'])
+        logger.info("Портфель загружен.")
         return portfolio
 
-    def fetch_data(self, tickers):
-        print(f"Загрузка данных для тикеров: {tickers}...")
-        data = yf.download(tickers, start=self.default_start_date, end=self.end_date)['Close']
-        print(f"Данные для тикеров {tickers} загружены.")
+    def holding_quantities(self, tickers, prices):
+        """
+        Текущие количества по тикерам. Для файлов без колонки Quantity количество
+        оценивается как Value / текущая цена (для акций — до целого).
+        """
+        quantities = []
+        for ticker, price in zip(tickers, prices):
+            if ticker in self.current_quantities:
+                quantities.append(self.current_quantities[ticker])
+            elif ticker in self.current_portfolio and price > 0:
+                quantity = self.current_portfolio[ticker] / price
+                quantities.append(quantity if ticker.endswith("-USD") else float(round(quantity)))
+            else:
+                quantities.append(0.0)
+        return quantities
+
+    def save_portfolio(self, holdings):
+        """
+        Атомарно перезаписывает файл портфеля: полный список позиций с суммой и количеством.
+        :param holdings: Список (тикер, сумма в $, количество); None — количество неизвестно
+        """
+        directory = os.path.dirname(os.path.abspath(self.portfolio_file))
+        tmp_path = os.path.join(directory, f'.{os.path.basename(self.portfolio_file)}.{os.getpid()}.tmp')
+        with open(tmp_path, 'w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(['Ticker', 'Value', 'Quantity'])
+            for ticker, value, quantity in holdings:
+                writer.writerow([ticker, round(value, 2), round(quantity, 8) if quantity is not None else ''])
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, self.portfolio_file)
+        self.current_portfolio = {ticker: round(value, 2) for ticker, value, _ in holdings}
+        self.current_quantities = {ticker: quantity for ticker, _, quantity in holdings if quantity is not None}
+
+    def fetch_data(self, tickers, start=None):
+        logger.info(f"Загрузка данных для тикеров: {tickers}...")
+        data = self.provider.download(tickers, start=start or self.default_start_date, end=self.end_date)
+        logger.info(f"Данные для тикеров {tickers} загружены.")
         return data
 
+    @property
+    def price_store(self):
+        if self._price_store is None:
+            from price_store import PriceStore, import_csv_dir
+            self._price_store = PriceStore(os.path.join(self.data_dir, 'store'))
+            if not self._price_store.exists:
+                logger.info("Импорт CSV-файлов в хранилище цен...")
+                imported = import_csv_dir(self._price_store, self.data_dir)
+                logger.info(f"Импортировано тикеров: {len(imported)}")
+        return self._price_store
+
     def load_data(self, tickers):
-        print(f"Загрузка данных для тикеров: {tickers}...")
-        full_index = pd.date_range(start=self.default_start_date, end=self.end_date)
+        from price_store import read_price_csv
+        from providers import fetch_batches, update_store
+        logger.info(f"Загрузка данных для тикеров: {tickers}...")
+        store = self.price_store
+        if self.incremental:
+            cached = [ticker for ticker in tickers if ticker in store]
+            appended = update_store(store, self.provider, cached, self.end_date,
+                                    keep_from=self.default_start_date, batch_size=self.batch_size)
+            logger.info(f"Дозагружено строк: {sum(appended.values())}")
+        store.ensure_range(self.default_start_date, self.end_date)
+        missing = []
         for ticker in tickers:
+            if ticker in store:
+                continue
             data_path = os.path.join(self.data_dir, f'{ticker}.csv')
             if os.path.exists(data_path):
-                print(f"Загрузка данных из файла для {ticker}...")
-                data = pd.read_csv(data_path, index_col='Date', parse_dates=True)
+                logger.debug(f"Загрузка данных из файла для {ticker}...")
+                with METRICS.timer('ticker_seconds', op='csv', ticker=ticker):
+                    series = read_price_csv(data_path)
+                store.write(ticker, series)
             else:
-                data = self.fetch_data([ticker])
-                data.to_csv(data_path)
-            data = data.loc[~data.index.duplicated(keep='first')]
-            data = data.reindex(full_index).fillna(method='ffill').fillna(method='bfill')
-            self.data_store[ticker] = data
-            print(f"Данные для {ticker} загружены.")
-        print("Все данные загружены.")
+                missing.append(ticker)
+        if missing:
+            # Все промахи кэша загружаются пакетами и записываются одним проходом
+            fetched = fetch_batches(self.fetch_data, missing, self.batch_size)
+            for ticker, series in fetched.items():
+                store.write(ticker, series)
+        store.commit()
+        for ticker in tickers:
+            if ticker not in store:
+                logger.warning(f"Нет данных для {ticker}.")
+                continue
+            # View на memmap-матрицу: без повторного парсинга и выравнивания
+            self.data_store[ticker] = store.frame(ticker, self.default_start_date, self.end_date)
+            logger.debug(f"Данные для {ticker} загружены.")
+        logger.info("Все данные загружены.")
+
+    def get_fx(self):
+        if self.fx is None:
+            from fx import FXService
+            self.fx = FXService(self.get_kv_store(), self.provider)
+        return self.fx
 
     def get_conversion_rate(self):
-        print("Получение курса конверсии USD to KZT...")
-        url = 'https://api.exchangerate-api.com/v4/latest/USD'
-        response = requests.get(url)
-        data = response.json()
-        rate = data['rates']['KZT']
-        print(f"Курс конверсии: 1 USD = {rate} KZT")
+        logger.info(f"Получение курса конверсии USD to {self.currency}...")
+        rate = self.get_fx().spot(self.currency)
+        logger.info(f"Курс конверсии: 1 USD = {rate} {self.currency}")
         return rate
 
-    def optimize_portfolio(self, new_investment):
-        print("Оптимизация портфеля...")
-        self.conversion_rate = self.get_conversion_rate()
-
-        all_tickers = self.get_all_tickers()
-        filtered_tickers = self.filter_tickers(all_tickers, new_investment)
-        
-        top_4_tickers = self.get_top_4_by_sortino(filtered_tickers)
-        
-        if not top_4_tickers:
-            print("Нет доступных тикеров для оптимизации.")
-            return
-        
-        stock_tickers = [ticker for ticker in top_4_tickers if not ticker.endswith("-USD")]
-        crypto_tickers = [ticker for ticker in top_4_tickers if ticker.endswith("-USD")]
-        
-        self.load_data(top_4_tickers)
-        
-        data_stocks = pd.concat([self.data_store[ticker] for ticker in stock_tickers], axis=1)
-        data_crypto = pd.concat([self.data_store[ticker] for ticker in crypto_tickers], axis=1)
-
-        returns_stocks = data_stocks.pct_change().dropna()
-        returns_crypto = data_crypto.pct_change().dropna()
-
-        mean_returns_stocks = returns_stocks.mean().values
-        mean_returns_crypto = returns_crypto.mean().values
-
-        cov_matrix_stocks = returns_stocks.cov().values
-        cov_matrix_crypto = returns_crypto.cov().values
-
-        num_assets_stocks = len(stock_tickers)
-        num_assets_crypto = len(crypto_tickers)
-
-        shares_stocks = cp.Variable(num_assets_stocks, integer=True)
-        shares_crypto = cp.Variable(num_assets_crypto)
-
-        binary_stocks = cp.Variable(num_assets_stocks, boolean=True)
-        binary_crypto = cp.Variable(num_assets_crypto, boolean=True)
-
-        current_prices_stocks = data_stocks.iloc[-1].values
-        current_prices_crypto = data_crypto.iloc[-1].values
-
-        objective = cp.Maximize(mean_returns_stocks @ shares_stocks + mean_returns_crypto @ shares_crypto)
-
-        risk_tolerance = 0.02  # Примерное допустимое значение стандартного отклонения (2%)
-
-        constraints = [
-            shares_stocks >= 0,
-            shares_crypto >= 0,
-            shares_stocks <= binary_stocks * 1e6,  # Устанавливаем верхнюю границу для акций
-            shares_crypto <= binary_crypto * 1e6,  # Устанавливаем верхнюю границу для криптовалют
-            shares_stocks @ current_prices_stocks + shares_crypto @ current_prices_crypto == new_investment / self.conversion_rate,
-            shares_stocks @ current_prices_stocks >= binary_stocks * 5000 / self.conversion_rate,
-            shares_crypto @ current_prices_crypto >= binary_crypto * 5000 / self.conversion_rate,
-            cp.quad_form(shares_stocks, cov_matrix_stocks) + cp.quad_form(shares_crypto, cov_matrix_crypto) <= risk_tolerance
-        ]
-
-        problem = cp.Problem(objective, constraints)
-        problem.solve(solver=cp.GUROBI)
-
-        investment_amounts_stocks = shares_stocks.value * current_prices_stocks
-        investment_amounts_crypto = shares_crypto.value * current_prices_crypto
-
-        stocks_allocations = {}
-        crypto_allocations = {}
-        stock_quantities = {}
-        crypto_quantities = {}
-        
-        for ticker, num_shares, investment in zip(stock_tickers, shares_stocks.value, investment_amounts_stocks):
-            if num_shares > 0:
-                stocks_allocations[ticker] = investment
-                stock_quantities[ticker] = num_shares
-                
-        for ticker, num_shares, investment in zip(crypto_tickers, shares_crypto.value, investment_amounts_crypto):
-            if num_shares > 0:
-                crypto_allocations[ticker] = investment
-                crypto_quantities[ticker] = num_shares
-
-        def print_allocations(allocations, quantities, category):
-            total_value = sum(allocations.values())
-            print(f"\n{category} инвестиции:")
-            for ticker, investment in allocations.items():
-                investment_KZT = investment * self.conversion_rate
-                change = round(investment - self.current_portfolio.get(ticker, 0), 2)
-                final_value_rounded = round(investment, 2)
-                final_value_usd = round(final_value_rounded, 2)
-                change_usd = round(change, 2)
-                quantity = quantities[ticker]
-                print(f"{ticker}: {quantity} единиц, {final_value_rounded}$ ({investment_KZT:.2f}₸) \033[92m{'+' if change >= 0 else ''}{change_usd}$ ({change * self.conversion_rate:.2f}₸)\033[0m")
-            print(f"Общая сумма в {category.lower()}: {round(total_value, 2)}$ ({round(total_value * self.conversion_rate, 2)}₸)")
-
-        print_allocations(stocks_allocations, stock_quantities, "Акции")
-        print_allocations(crypto_allocations, crypto_quantities, "Криптовалюты")
-
-        total_investment_value = sum(investment_amounts_stocks) + sum(investment_amounts_crypto)
-        print(f"\nОбщий объем инвестиций: {round(total_investment_value, 2)}$ ({round(total_investment_value * self.conversion_rate, 2)}₸)")
-
-        if input("Перезаписать portfolio.csv новыми значениями? (y/n): ").lower() == 'y':
-            new_portfolio = pd.DataFrame(list(stocks_allocations.items()) + list(crypto_allocations.items()), columns=['Ticker', 'Value'])
-            new_portfolio['Value'] = new_portfolio['Value'].round(2)  # Округление значений
-            new_portfolio.to_csv(self.portfolio_file, index=False)
-            print("Файл portfolio.csv обновлен.")
+    def get_covariance_service(self):
+        if self.covariance_service is None:
+            from covariance import CovarianceService
+            self.covariance_service = CovarianceService(self.price_store, os.path.join(self.data_dir, 'store', 'covariance'),
+                                                        features=self.get_feature_index)
+        return self.covariance_service
+
+    def get_feature_index(self):
+        # Признаки (доходности, SMA, RSI) считаются один раз за день по всему хранилищу
+        # и пересобираются, только если хранилище изменилось
+        from features import open_features
+        return open_features(self.price_store, os.path.join(self.data_dir, 'store', 'features'))
+
+    def prepare_allocation_inputs(self, stock_tickers, crypto_tickers):
+        import numpy as np
+        # Общая ковариация по акциям и криптовалютам: перекрёстные ковариации не теряются
+        ordered_tickers = stock_tickers + crypto_tickers
+        mean_returns, cov_matrix = self.get_covariance_service().get(
+            ordered_tickers, self.default_start_date, self.end_date, method=self.cov_method)
+        current_prices = np.array([self.data_store[ticker]['Close'].iloc[-1] for ticker in ordered_tickers])
+        return ordered_tickers, mean_returns, cov_matrix, current_prices
+
+    def what_if(self, tickers, investments, risk_tolerances, processes=None, as_of=None):
+        """
+        Пакетный неинтерактивный расчёт: доходности и ковариация считаются один раз,
+        затем решается сетка сценариев сумма инвестиций × допустимый риск.
+        :param tickers: Тикеры для распределения
+        :param investments: Суммы инвестиций в валюте currency
+        :param risk_tolerances: Допустимые значения риска
+        :param processes: Число процессов для параллельного решения
+        :param as_of: Дата курса пересчёта (по умолчанию текущий курс)
+        :return: DataFrame с распределением и количеством по каждому сценарию
+        """
+        from whatif import grid_to_frame, solve_grid
+        logger.info(f"Расчет сценариев: {len(investments)} сумм × {len(risk_tolerances)} уровней риска...")
+        if as_of is not None:
+            rate = self.get_fx().rate_at(self.currency, as_of)
         else:
-            print("Обновление файла отменено.")
-
-
-    def get_coinmarketcap_tickers(self):
-        print("Получение трендовых криптовалют с CoinMarketCap...")
-        url = 'https://coinmarketcap.com/trending-cryptocurrencies/'
-        response = requests.get(url)
-        if response.status_code != 200:
-            print(f"Error: Unable to fetch the page, status code: {response.status_code}")
-            return []
-
-        soup = BeautifulSoup(response.content, 'html.parser')
-        tickers = []
-        
-        table = soup.find('table')
-        if not table:
-            print("Error: Table not found.")
-            return []
-
-        for row in table.find('tbody').find_all('tr'):
-            ticker_element = row.select_one('td:nth-child(3) > a > div > div > div > p')
-            if ticker_element:
-                tickers.append(ticker_element.text.strip() + "-USD")
-
-        print(f"Тикеры с CoinMarketCap: {tickers}")
-        return tickers
-
-    def get_yahoo_tickers(self):
-        print("Получение трендовых акций с Yahoo Finance...")
-        url = 'https://finance.yahoo.com/trending-tickers/'
-        response = requests.get(url)
-        if response.status_code != 200:
-            print(f"Error: Unable to fetch the page, status code: {response.status_code}")
-            return []
-
-        soup = BeautifulSoup(response.content, 'html.parser')
-        tickers = []
-
-        table = soup.find('tbody')
-        if not table:
-            print("Error: Table with ID 'list-res-table' not found.")
-            return []
-
-        for row in table.find_all('tr'):
-            ticker = row.find('td', {'aria-label': 'Symbol'}).text.strip()
-            tickers.append(ticker)
-
-        print(f"Тикеры с Yahoo Finance: {tickers}")
-        return tickers
-
-    def get_yahoo_tickers1(self):
-        print("Получение трендовых акций с Yahoo Finance...")
-        url = 'https://finance.yahoo.com/crypto?offset=0&count=100'
-        response = requests.get(url)
-        if response.status_code != 200:
-            print(f"Error: Unable to fetch the page, status code: {response.status_code}")
-            return []
-
-        soup = BeautifulSoup(response.content, 'html.parser')
-        tickers = []
-
-        table = soup.find('tbody')
-        if not table:
-            print("Error: Table with ID 'list-res-table' not found.")
-            return []
-
-        for row in table.find_all('tr'):
-            ticker = row.find('td', {'aria-label': 'Symbol'}).text.strip()
-            tickers.append(ticker)
-
-        print(f"Тикеры с Yahoo Finance: {tickers}")
-        return tickers
-
-    def get_yahoo_tickers2(self):
-        print("Получение трендовых акций с Yahoo Finance...")
-        url = 'https://finance.yahoo.com/most-active?offset=0&count=100'
-        response = requests.get(url)
-        if response.status_code != 200:
-            print(f"Error: Unable to fetch the page, status code: {response.status_code}")
-            return []
-
-        soup = BeautifulSoup(response.content, 'html.parser')
-        tickers = []
-
-        table = soup.find('tbody')
-        if not table:
-            print("Error: Table with ID 'list-res-table' not found.")
-            return []
-
-        for row in table.find_all('tr'):
-            ticker = row.find('td', {'aria-label': 'Symbol'}).text.strip()
-            tickers.append(ticker)
-
-        print(f"Тикеры с Yahoo Finance: {tickers}")
-        return tickers
+            if self.conversion_rate is None:
+                self.conversion_rate = self.get_conversion_rate()
+            rate = self.conversion_rate
+        stock_tickers = [ticker for ticker in tickers if not ticker.endswith("-USD")]
+        crypto_tickers = [ticker for ticker in tickers if ticker.endswith("-USD")]
+        self.load_data(stock_tickers + crypto_tickers)
+
+        ordered_tickers, mean_returns, cov_matrix, current_prices = self.prepare_allocation_inputs(stock_tickers, crypto_tickers)
+        budgets = [investment / rate for investment in investments]
+        results = solve_grid(mean_returns, cov_matrix, current_prices, len(stock_tickers), budgets, risk_tolerances,
+                             min_lot=self.min_lot / rate, backend=self.solver, processes=processes)
+        return grid_to_frame(results, ordered_tickers, current_prices, rate)
+
+    def backtest(self, investment, start=None, end=None, tickers=None, **kwargs):
+        """
+        Бэктест отбора и оптимизации по хранилищу цен с пересчётом по историческому курсу currency.
+        :param tickers: Тикеры вселенной (по умолчанию все тикеры хранилища, кроме deny)
+        :param kwargs: Параметры backtest.run_backtest (lookback, freq, risk_tolerance, processes)
+        :return: BacktestResult
+        """
+        from backtest import run_backtest
+        store = self.price_store
+        tickers = [ticker for ticker in (tickers or store.tickers) if ticker in store and ticker not in self.deny]
+        values, mask, dates = store.matrix(tickers, None, end)
+        logger.info(f"Бэктест: {len(tickers)} тикеров, {len(dates)} дней...")
+        try:
+            rates = self.get_fx().history(self.currency, dates[0], dates[-1])
+        except KeyError:
+            logger.warning(f"Нет истории курса {self.currency}, используется текущий курс.")
+            rates = self.get_conversion_rate()
+        kwargs.setdefault('min_lot', self.min_lot)
+        kwargs.setdefault('cov_method', self.cov_method)
+        kwargs.setdefault('backend', self.solver)
+        kwargs.setdefault('features', self.get_feature_index())
+        return run_backtest(values, mask, dates, tickers, investment, rates, start=start, end=end, **kwargs)
+
+    def signal_stream(self, tickers=None, **kwargs):
+        """
+        Потоковые сигналы по тикерам (по умолчанию — позициям портфеля): состояние
+        индикаторов строится один раз по дневной истории до вчерашнего дня, дальше
+        обновляется котировками (см. streaming.SignalStream.consume).
+        """
+        from streaming import SignalStream
+        tickers = list(tickers or self.current_portfolio)
+        self.load_data(tickers)
+        stream = SignalStream(**kwargs)
+        today = datetime.today().date()
+        for ticker in tickers:
+            if ticker not in self.price_store:
+                continue
+            values, mask, dates = self.price_store.matrix([ticker], self.default_start_date, self.end_date)
+            # Только реальные наблюдения; сегодняшний бар придёт из потока
+            observed = mask[0] & (dates.date < today)
+            stream.seed(ticker, values[0, observed], dates[observed][-1].date() if observed.any() else None)
+        return stream
+
+    def optimize_portfolio(self, new_investment, resume=False):
+        """
+        Этапы discover → filter → rank → load → solve → write (см. pipeline.Pipeline).
+        Результаты этапов сохраняются в data/pipeline; при resume=True повторный запуск
+        продолжает с первого устаревшего этапа.
+        """
+        from pipeline import Pipeline
+        logger.info("Оптимизация портфеля...")
+        update = Pipeline(self, new_investment).run(resume=resume)
+        return update.allocations if update is not None else None
+
+    def write_allocation(self, tickers, n_stocks, quantities, prices, holdings=None, leftover=None, untraded=None):
+        """
+        Печатает распределение и по подтверждению перезаписывает файл портфеля.
+        :param holdings: Количества до ребалансировки (печатаются сделки, оборот и комиссия)
+        :param leftover: Нераспределённый остаток бюджета в $ (SolveResult.leftover)
+        :param untraded: Позиции без цен (тикер, сумма в $, количество), сохраняемые в файле без изменений
+        :return: (словарь {тикер: сумма в $}, был ли файл перезаписан)
+        """
+        import numpy as np
+        import pandas as pd
+        from fx import currency_symbol
+        symbol = currency_symbol(self.currency)
+        table = pd.DataFrame({'quantity': np.asarray(quantities, dtype=float)}, index=list(tickers))
+        table['category'] = ['Акции'] * n_stocks + ['Криптовалюты'] * (len(tickers) - n_stocks)
+        table['price'] = np.asarray(prices, dtype=float)
+        table['value'] = table['quantity'] * table['price']
+        current = pd.Series(self.current_portfolio, dtype=float).reindex(table.index).fillna(0)
+        table['change'] = (table['value'] - current).round(2)
+        # Пересчёт в местную валюту одной операцией для всей таблицы по курсу запуска
+        local = self.get_fx().convert(table[['value', 'change']], self.currency, rate=self.conversion_rate)
+        table['value_local'], table['change_local'] = local['value'], local['change']
+        held = table[table['quantity'] > 0]
+
+        for category in ("Акции", "Криптовалюты"):
+            group = held[held['category'] == category]
+            logger.info(f"\n{category} инвестиции:")
+            for ticker, row in group.iterrows():
+                change = row['change']
+                logger.info(f"{ticker}: {row['quantity']} единиц, {round(row['value'], 2)}$ ({row['value_local']:.2f}{symbol}) \033[92m{'+' if change >= 0 else ''}{change}$ ({row['change_local']:.2f}{symbol})\033[0m")
+            logger.info(f"Общая сумма в {category.lower()}: {round(group['value'].sum(), 2)}$ ({round(group['value_local'].sum(), 2)}{symbol})")
+
+        logger.info(f"\nОбщий объем инвестиций: {round(table['value'].sum(), 2)}$ ({round(table['value_local'].sum(), 2)}{symbol})")
+        if leftover is not None and leftover >= 0.01:
+            leftover_local = self.get_fx().convert(leftover, self.currency, rate=self.conversion_rate)
+            logger.info(f"\033[93mНе распределено: {round(leftover, 2)}$ ({leftover_local:.2f}{symbol}) — бюджет вложен не полностью\033[0m")
+
+        if holdings is not None:
+            table['trade'] = table['quantity'] - np.asarray(holdings, dtype=float)
+            trades = table[table['trade'].abs() > 1e-9]
+            logger.info("\nСделки:")
+            for ticker, row in trades.iterrows():
+                logger.info(f"{ticker}: {'купить' if row['trade'] > 0 else 'продать'} {abs(row['trade']):g}")
+            turnover = float((trades['trade'].abs() * trades['price']).sum())
+            logger.info(f"Оборот: {round(turnover, 2)}$, комиссия: {round(turnover * self.transaction_cost, 2)}$")
+        untraded = [tuple(position) for position in untraded or []]
+        if untraded:
+            logger.info("\nБез сделок (нет цен):")
+            for ticker, value, _ in untraded:
+                logger.info(f"{ticker}: {round(value, 2)}$")
+
+        allocations = {ticker: float(value) for ticker, value in held['value'].items()}
+        if self.confirm("Перезаписать portfolio.csv новыми значениями? (y/n): "):
+            self.save_portfolio([(ticker, float(row['value']), float(row['quantity'])) for ticker, row in held.iterrows()]
+                                + untraded)
+            logger.info("Файл portfolio.csv обновлен.")
+            return allocations, True
+        logger.info("Обновление файла отменено.")
+        return allocations, False
+
+
+    def get_ticker_sources(self):
+        if self.ticker_sources is None:
+            from sources import SourceRegistry
+            from ttl_cache import TTLCache
+            self.ticker_sources = SourceRegistry(cache=TTLCache(3600, namespace='tickers', store=self.get_kv_store()))
+        return self.ticker_sources
 
     def get_all_tickers(self):
-        print("Получение всех тикеров...")
-        coinmarketcap_tickers = self.get_coinmarketcap_tickers()
-        yahoo_tickers = self.get_yahoo_tickers()
-        yahoo_tickers1 = self.get_yahoo_tickers1()
-        yahoo_tickers2 = self.get_yahoo_tickers2()
-
-
-        
-        all_tickers = list(set(coinmarketcap_tickers + yahoo_tickers + yahoo_tickers1 + yahoo_tickers2))  # Удаление дубликатов
-        print(f"Все тикеры: {all_tickers}")
+        logger.info("Получение всех тикеров...")
+        # Все источники загружаются параллельно через общую сессию реестра
+        results = self.get_ticker_sources().fetch_all()
+        all_tickers = list(set(ticker for tickers in results.values() for ticker in tickers))  # Удаление дубликатов
+        logger.info(f"Все тикеры: {all_tickers}")
         return all_tickers
 
+    def get_fundamentals(self):
+        if self.fundamentals is None:
+            from fundamentals import FundamentalsService
+            from ttl_cache import TTLCache
+            cache = TTLCache(24 * 3600, namespace='fundamentals', store=self.get_kv_store())
+            self.fundamentals = FundamentalsService(self.provider, cache)
+        return self.fundamentals
+
     def filter_tickers(self, tickers, new_investment):
-        print("Фильтрация тикеров...")
-        filtered_tickers = []
-        for ticker in tickers:
-            try:
-                stock = yf.Ticker(ticker)
-                market_cap = stock.info.get('marketCap')
-                volume = stock.info.get('volume')
-                current_price = stock.history(period="1d")['Close'].iloc[0]
-
-                # Check if the market cap and volume meet the criteria
-                if market_cap and market_cap > 1e9 and volume and volume > 1e6:
-                    # For stocks, check if the price does not exceed 40% of the new investment
-                    if not ticker.endswith("-USD") and current_price <= 0.4 * (new_investment / self.conversion_rate):
-                        filtered_tickers.append(ticker)
-                    # For cryptocurrencies, just add them without the price check
-                    elif ticker.endswith("-USD"):
-                        filtered_tickers.append(ticker)
-            except Exception as e:
-                print(f"Ошибка при обработке тикера {ticker}: {e}")
-                continue  # Игнорируем ошибки и продолжаем обработку следующих тикеров
-        print(f"Отфильтрованные тикеры: {filtered_tickers}")
+        from fundamentals import apply_filters
+        logger.info("Фильтрация тикеров...")
+        # Один запрос info и цены на тикер (пул потоков + дисковый кэш), пороги — векторно
+        table = self.get_fundamentals().fetch(tickers)
+        filtered_tickers = apply_filters(table, max_stock_price=0.4 * (new_investment / self.conversion_rate))
+        logger.info(f"Отфильтрованные тикеры: {filtered_tickers}")
         return filtered_tickers
 
-    def calculate_sortino_ratio(self, ticker, start_date):
-        print(f"Расчет коэффициента Сортино для {ticker}...")
-        stock = yf.Ticker(ticker)
-        hist = stock.history(start=start_date)
-        
-        if hist.empty or hist.index[0].tz_convert(None) > start_date + timedelta(days=5):
-            return None
-
-        returns = hist['Close'].pct_change().dropna()
-        downside_returns = returns[returns < 0]
-        expected_return = returns.mean()
-        downside_std = downside_returns.std()
-
-        if downside_std == 0:
-            return None 
-
-        sortino_ratio = expected_return / downside_std
-        print(f"Коэффициент Сортино для {ticker}: {sortino_ratio}")
-        return sortino_ratio
-
-    def calculate_technical_indicators(self, ticker, start_date):
-        print(f"Расчет технических индикаторов для {ticker}...")
-        stock = yf.Ticker(ticker)
-        hist = stock.history(start=start_date)
-        
-        if hist.empty or hist.index[0].tz_convert(None) > start_date + timedelta(days=5):
-            return None
-        hist['SMA_50'] = ta.trend.sma_indicator(hist['Close'], window=50)
-        hist['SMA_200'] = ta.trend.sma_indicator(hist['Close'], window=200)
-        hist['RSI'] = ta.momentum.rsi(hist['Close'], window=14)
-
-        print(f"Технические индикаторы для {ticker}: SMA_50 = {hist['SMA_50'].iloc[-1]}, SMA_200 = {hist['SMA_200'].iloc[-1]}, RSI = {hist['RSI'].iloc[-1]}")
-        return hist
-
     def get_top_4_by_sortino(self, filtered_tickers):
-        print("Получение топ-4 тикеров по коэффициенту Сортино с учетом технических индикаторов...")
+        import pandas as pd
+        from features import screen_features
+        from screening import select
+        logger.info("Получение топ-4 тикеров по коэффициенту Сортино с учетом технических индикаторов...")
         start_date = (datetime.now() - timedelta(days=3*365)).replace(tzinfo=None)  
-        sortino_ratios = {}
-        tech_indicators = {}
-        
-        for ticker in filtered_tickers:
-            ratio = self.calculate_sortino_ratio(ticker, start_date)
-            tech_data = self.calculate_technical_indicators(ticker, start_date)
-            
-            if ratio is not None and tech_data is not None:
-                if tech_data['SMA_50'].iloc[-1] > tech_data['SMA_200'].iloc[-1] and tech_data['RSI'].iloc[-1] < 70:
-                    sortino_ratios[ticker] = ratio
-                    tech_indicators[ticker] = tech_data.iloc[-1]  # Last row of data
-        
-        sorted_tickers = sorted(sortino_ratios.items(), key=lambda x: x[1], reverse=True)
-        
-        top_4_tickers = []
-        crypto = None
-        stocks = []
 
+        # Истории всех кандидатов, которых нет в хранилище, загружаются одним пакетом
+        store = self.price_store
+        missing = [ticker for ticker in filtered_tickers if ticker not in store]
+        if missing:
+            self.load_data(missing)
+        candidates = [ticker for ticker in filtered_tickers if ticker in store]
+        if not candidates:
+            return []
+
+        # Все метрики считаются векторно по матрице кандидатов (тикеры × дни)
+        window_start = max(pd.Timestamp(start_date).normalize(), store.start)
+        selected = self.load_screening(candidates, window_start)
+        if selected is None:
+            metrics = screen_features(self.get_feature_index(), candidates, window_start)
+            selected = select(metrics, start_date)
+            self.save_screening(candidates, window_start, selected)
+        for ticker, row in selected.iterrows():
+            logger.info(f"{ticker}: Sortino Ratio: {row['sortino']}, SMA_50: {row['SMA_50']}, SMA_200: {row['SMA_200']}, RSI: {row['RSI']}")
 
-        for ticker, ratio in sorted_tickers:
+        top_4_tickers = []
+        for ticker in selected.index:
             if self.check_asset_availability(ticker):
                 top_4_tickers.append(ticker)
+        return top_4_tickers
 
-        # for ticker, ratio in sorted_tickers:
-        #     if crypto is None and "-USD" in ticker:
-        #         if self.check_asset_availability(ticker):
-        #             crypto = ticker
-        #     elif len(stocks) < 3:
-        #         if self.check_asset_availability(ticker):
-        #             stocks.append(ticker)
-        #     if crypto and len(stocks) == 3:
-        #         break
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Закрывает хранилище кэшей (перед fork его соединения должны быть закрыты)."""
+        if self.kv_store is not None:
+            self.kv_store.close()
+
+    def get_kv_store(self):
+        # Общее хранилище кэшей (SQLite WAL): доступность активов, тикеры, фундаментальные данные, курсы, отбор
+        if self.kv_store is None:
+            from kvstore import KVStore
+            base, extension = os.path.splitext(self.cache_file)
+            self.kv_store = KVStore(self.cache_file if extension == '.db' else base + '.db')
+            self.kv_store.purge()
+            # Однократный перенос старых JSON-кэшей
+            if extension == '.json':
+                self.kv_store.import_json('availability', self.cache_file, ttl=self.availability_ttl)
+            self.kv_store.import_json('tickers', os.path.join(self.data_dir, 'tickers_cache.json'), timestamped=True)
+            self.kv_store.import_json('fundamentals', os.path.join(self.data_dir, 'fundamentals_cache.json'), timestamped=True)
+        return self.kv_store
+
+    def _screening_key(self, candidates, window_start):
+        import hashlib
+        from features import store_signature
+        digest = hashlib.md5(','.join(sorted(candidates)).encode()).hexdigest()
+        # Версия хранилища в ключе: после дозагрузки или правки цен отбор считается заново
+        return f"{digest}:{window_start.strftime('%Y-%m-%d')}:{self.end_date}:{store_signature(self.price_store)}"
+
+    def load_screening(self, candidates, window_start):
+        """Результат отбора из кэша за сегодня (DataFrame как у screening.select) или None."""
+        import pandas as pd
+        records = self.get_kv_store().get('screening', self._screening_key(candidates, window_start))
+        if records is None:
+            return None
+        logger.info("Результаты отбора взяты из кэша.")
+        return pd.DataFrame.from_records(records, index='ticker', columns=['ticker', 'sortino', 'SMA_50', 'SMA_200', 'RSI'])
 
-        # if crypto:
-        #     top_4_tickers.append(crypto)
-        # top_4_tickers.extend(stocks)
+    def save_screening(self, candidates, window_start, selected):
+        records = [{'ticker': ticker, 'sortino': row['sortino'], 'SMA_50': row['SMA_50'],
+                    'SMA_200': row['SMA_200'], 'RSI': row['RSI']} for ticker, row in selected.iterrows()]
+        self.get_kv_store().set('screening', self._screening_key(candidates, window_start), records, ttl=24 * 3600)
 
-        # for ticker in top_4_tickers:
-        #     tech_data = tech_indicators[ticker]
-        #     print(f"{ticker}: Sortino Ratio: {sortino_ratios[ticker]}, SMA_50: {tech_data['SMA_50']}, SMA_200: {tech_data['SMA_200']}, RSI: {tech_data['RSI']}")
+    @property
+    def cache(self):
+        # Ответы о доступности читаются из хранилища кэшей при первом обращении
+        if self._cache is None:
+            self._cache = self.load_cache()
+        return self._cache
 
-        return top_4_tickers
+    @cache.setter
+    def cache(self, value):
+        self._cache = value
 
     def load_cache(self):
-        if os.path.exists(self.cache_file):
-            with open(self.cache_file, 'r') as file:
-                return json.load(file)
-        return {}
+        return self.get_kv_store().get_many('availability')
 
-    def save_cache(self):
-        with open(self.cache_file, 'w') as file:
-            json.dump(self.cache, file)
+    def save_cache(self, tickers=None):
+        """Сохраняет ответы одной транзакцией: только tickers или все ответы из self.cache."""
+        tickers = list(self.cache) if tickers is None else tickers
+        self.get_kv_store().set_many('availability', {ticker: self.cache[ticker] for ticker in tickers},
+                                     ttl=self.availability_ttl)
+
+    def confirm(self, question):
+        if not self.interactive:
+            logger.info(f"{question}{'y' if self.auto_confirm else 'n'} (неинтерактивный режим)")
+            return self.auto_confirm
+        return input(question).strip().lower() == 'y'
 
     def check_asset_availability(self, ticker):
+        # Явные списки важнее кэша ответов
+        if ticker in self.deny or ticker in self.allow:
+            available = ticker in self.allow and ticker not in self.deny
+            logger.info(f"Актив {ticker} {'доступен' if available else 'недоступен'} для приобретения (по списку).")
+            return available
+
+        if ticker not in self.cache:
+            # Ответ мог появиться после загрузки кэша (другой процесс)
+            stored = self.get_kv_store().get('availability', ticker)
+            if stored is not None:
+                self.cache[ticker] = stored
         if ticker in self.cache:
             available = self.cache[ticker]
-            print(f"Актив {ticker} {'доступен' if available else 'недоступен'} для приобретения (из кэша).")
+            logger.info(f"Актив {ticker} {'доступен' if available else 'недоступен'} для приобретения (из кэша).")
             return available
 
+        if not self.interactive:
+            # Без ответа пользователя неизвестный актив не покупается и в кэш не записывается
+            logger.info(f"Актив {ticker} недоступен для приобретения (нет ответа в неинтерактивном режиме).")
+            return False
+
         response = input(f"Можете ли вы приобрести {ticker}? (y/n): ").strip().lower()
         available = response == 'y'
         self.cache[ticker] = available
-        self.save_cache()
-        print(f"Актив {ticker} {'доступен' if available else 'недоступен'} для приобретения.")
+        self.save_cache([ticker])
+        logger.info(f"Актив {ticker} {'доступен' if available else 'недоступен'} для приобретения.")
         return available
 
-fin_logic = FinLogic('data', 'portfolio.csv')
-new_investment = 355800
-final_allocations = fin_logic.optimize_portfolio(new_investment)
\ No newline at end of file
+
+def common_arguments():
+    """Общие параметры командной строки FinLogic.py и pipeline.py."""
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument('--data-dir', default='data')
+    parser.add_argument('--portfolio', default='portfolio.csv')
+    parser.add_argument('--cache', default='cache.json',
+                        help="Файл кэшей: *.db — SQLite напрямую, для *.json — одноимённый .db, куда переносятся старые ответы")
+    parser.add_argument('--solver', default='auto', help="'auto', 'heuristic' или имя решателя cvxpy")
+    parser.add_argument('--currency', default='KZT', help="Валюта суммы инвестиций и отчёта (код ISO)")
+    parser.add_argument('--min-lot', type=float, default=5000, help="Минимальная покупка в валюте --currency")
+    parser.add_argument('--rebalance', action='store_true', help="Ребалансировать текущие позиции, а не только распределять новые деньги")
+    parser.add_argument('--transaction-cost', type=float, default=0.001, help="Комиссия как доля суммы сделки")
+    parser.add_argument('--turnover-penalty', type=float, default=0.0, help="Штраф за каждый $ оборота в целевой функции")
+    parser.add_argument('--cov-method', default='sample', choices=['sample', 'ledoit_wolf', 'ewma'])
+    parser.add_argument('--incremental', action='store_true', help="Дозагружать хвост истории для тикеров из хранилища")
+    parser.add_argument('--non-interactive', action='store_true', help="Не задавать вопросов, решать по спискам и --yes")
+    parser.add_argument('--allow', nargs='*', default=[], metavar='TICKER', help="Доступные для покупки тикеры")
+    parser.add_argument('--deny', nargs='*', default=[], metavar='TICKER', help="Недоступные для покупки тикеры")
+    parser.add_argument('--yes', '--auto-confirm', dest='auto_confirm', action='store_true',
+                        help="Перезаписывать портфель без вопроса в неинтерактивном режиме")
+    parser.add_argument('--log-level', default='INFO', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'])
+    parser.add_argument('--metrics', metavar='PATH', help="Сохранить метрики запуска (.prom — формат Prometheus, иначе JSON)")
+    parser.add_argument('--profile', action='append', default=[], metavar='STAGE',
+                        help="Профилировать этап cProfile (discover, filter, rank, load, solve, write)")
+    return parser
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Оптимизация инвестиционного портфеля", parents=[common_arguments()])
+    parser.add_argument('investment', nargs='?', type=float, default=355800, help="Сумма новых инвестиций в тенге")
+    parser.add_argument('--resume', action='store_true', help="Продолжить с первого устаревшего этапа (см. pipeline.py)")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    with run_session(args.log_level, args.metrics, args.profile), FinLogic.from_args(args) as fin_logic:
+        return fin_logic.optimize_portfolio(args.investment, resume=args.resume)
+
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
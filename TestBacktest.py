@@ -0,0 +1,72 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from backtest import rebalance_columns, rolling_screen, run_backtest
+from benchmark import synthetic_universe
+from screening import screen, select
+
+
+class TestBacktest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        prices, _ = synthetic_universe(30, start='2021-01-01', end='2023-12-31', seed=3)
+        cls.tickers = list(prices.columns)
+        cls.dates = prices.index
+        cls.values = prices.values.T
+        cls.mask = ~np.isnan(cls.values)
+
+    def test_rebalance_columns(self):
+        columns = rebalance_columns(self.dates, 'M', start='2022-01-01')
+        self.assertEqual(len(columns), 24)
+        self.assertTrue((self.dates[columns].is_month_end).all())
+
+    def test_rolling_screen_matches_screen(self):
+        columns = rebalance_columns(self.dates, 'Q', start='2022-01-01')
+        frames = rolling_screen(self.values, self.mask, self.tickers, self.dates, columns, lookback=365)
+        for column, metrics in zip(columns, frames):
+            first = self.dates.searchsorted(self.dates[column] - pd.Timedelta(days=365))
+            window = slice(first, column + 1)
+            expected = screen(self.values[:, window], self.mask[:, window], self.tickers, self.dates[window])
+            for name in ('sortino', 'SMA_50', 'SMA_200', 'RSI'):
+                np.testing.assert_allclose(metrics[name].values, expected[name].values, rtol=1e-9, atol=1e-9)
+            pd.testing.assert_series_equal(metrics['first_date'], expected['first_date'])
+
+    def test_run_backtest(self):
+        rates = pd.Series(np.linspace(420.0, 480.0, len(self.dates)), index=self.dates)
+        result = run_backtest(self.values, self.mask, self.dates, self.tickers, 355800, rates,
+                              start='2022-01-01', backend='heuristic')
+        equity = result.equity
+        self.assertEqual(len(result.rebalances), 24)
+        self.assertTrue((equity['drawdown'] <= 0).all())
+        self.assertTrue(result.rebalances['turnover'].between(0, 1 + 1e-9).all())
+        # Капитал в местной валюте пересчитан по курсу своей даты
+        np.testing.assert_allclose(equity['equity_local'], equity['equity_usd'] * rates.reindex(equity.index))
+        self.assertAlmostEqual(equity['equity_local'].iloc[0], 355800, delta=1e-6)
+        summary = result.summary()
+        self.assertEqual(summary['rebalances'], 24)
+        self.assertLessEqual(summary['max_drawdown'], 0)
+
+        parallel = run_backtest(self.values, self.mask, self.dates, self.tickers, 355800, rates,
+                                start='2022-01-01', backend='heuristic', processes=2)
+        pd.testing.assert_frame_equal(parallel.equity, equity)
+
+    def test_matches_production_selection(self):
+        result = run_backtest(self.values, self.mask, self.dates, self.tickers, 355800,
+                              start='2022-01-01', freq='Q', backend='auto')
+        columns = rebalance_columns(self.dates, 'Q', start='2022-01-01')
+        frames = rolling_screen(self.values, self.mask, self.tickers, self.dates, columns, lookback=365)
+        for column, metrics, tickers in zip(columns, frames, result.rebalances['tickers']):
+            # Все тикеры, прошедшие select, без ограничения числа и добавленных в обход фильтров
+            window_start = self.dates[self.dates.searchsorted(self.dates[column] - pd.Timedelta(days=365))]
+            self.assertEqual(sorted(tickers), sorted(select(metrics, window_start).index))
+        summary = result.summary()
+        solved = result.rebalances[result.rebalances['solver'].notna()]
+        self.assertAlmostEqual(summary['fallback_share'], (solved['solver'] == 'heuristic').mean())
+        self.assertAlmostEqual(summary['failed_share'], 1 - solved['status'].isin(['heuristic', 'optimal', 'optimal_inaccurate']).mean())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from benchmark import STAGES, compare, run_universe, synthetic_universe
+from providers import FrameProvider
+
+
+class TestBenchmark(unittest.TestCase):
+
+    def test_synthetic_universe(self):
+        prices, fundamentals = synthetic_universe(50, seed=1)
+        again, _ = synthetic_universe(50, seed=1)
+        self.assertEqual(prices.shape[1], 50)
+        self.assertEqual(sum(ticker.endswith('-USD') for ticker in prices.columns), 5)
+        self.assertTrue(prices.equals(again))
+        self.assertEqual(set(fundamentals), set(prices.columns))
+        # Акции не торгуются по выходным, криптовалюты — ежедневно
+        weekend = prices.index.dayofweek >= 5
+        self.assertTrue(prices.loc[weekend, 'S00000'].isna().all())
+        self.assertFalse(np.isnan(prices.loc[weekend, 'C00000-USD'].values[-10:]).any())
+
+    def test_run_universe_offline(self):
+        prices, fundamentals = synthetic_universe(40)
+        provider = FrameProvider(prices, fundamentals)
+        workdir = tempfile.mkdtemp()
+        try:
+            timings, n_selected = run_universe(provider, list(prices.columns), '2021-07-16', '2024-07-16', workdir,
+                                               backend='heuristic')
+        finally:
+            shutil.rmtree(workdir)
+        self.assertEqual(list(timings), STAGES)
+        self.assertGreater(n_selected, 0)
+        self.assertTrue(all(calls[0] != 'info' for calls in provider.calls))
+
+    def test_compare(self):
+        baseline = {'synthetic-100': {'load': 1.0, 'screen': 0.01}}
+        current = {'synthetic-100': {'load': 1.5, 'screen': 0.03}, 'synthetic-1000': {'load': 9.0}}
+        regressions = compare(current, baseline, tolerance=0.25, min_seconds=0.05)
+        # Короткий этап в пределах шума и новая вселенная без базы не считаются регрессией
+        self.assertEqual(len(regressions), 1)
+        self.assertTrue(regressions[0].startswith('synthetic-100/load'))
+        self.assertEqual(compare({'synthetic-100': {'load': 1.1}}, baseline), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
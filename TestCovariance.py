@@ -0,0 +1,146 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+import pandas as pd
+
+from covariance import CovarianceEngine, CovarianceService, store_returns
+from price_store import PriceStore, import_csv_dir
+
+
+def reference_ledoit_wolf(X):
+    """Формула sklearn.covariance.ledoit_wolf (assume_centered=False) напрямую по данным."""
+    X = X - X.mean(axis=0)
+    n, p = X.shape
+    emp_cov = X.T @ X / n
+    mu = np.trace(emp_cov) / p
+    X2 = X ** 2
+    beta_ = np.sum(X2.T @ X2)
+    delta_ = np.sum(emp_cov ** 2)
+    beta = (beta_ / n - delta_) / (p * n)
+    delta = (delta_ - 2 * mu * np.trace(emp_cov) + p * mu ** 2) / p
+    shrinkage = min(beta, delta) / delta
+    return (1 - shrinkage) * emp_cov + shrinkage * mu * np.eye(p), shrinkage
+
+
+class TestCovarianceEngine(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(1)
+        dates = pd.date_range('2023-01-01', periods=400)
+        self.returns = pd.DataFrame(rng.normal(0.001, 0.02, size=(400, 6)) @ rng.normal(size=(6, 6)) * 0.3,
+                                    index=dates, columns=list('ABCDEF'))
+
+    def test_sample_and_ledoit_wolf(self):
+        engine = CovarianceEngine.from_returns(self.returns)
+        np.testing.assert_allclose(engine.sample(), self.returns.cov().values, rtol=1e-9)
+        expected, expected_shrinkage = reference_ledoit_wolf(self.returns.values)
+        shrunk, shrinkage = engine.ledoit_wolf()
+        np.testing.assert_allclose(shrunk, expected, rtol=1e-7)
+        self.assertAlmostEqual(shrinkage, expected_shrinkage, places=9)
+
+    def test_incremental_window_matches_full_recompute(self):
+        engine = CovarianceEngine.from_returns(self.returns.iloc[:300])
+        engine.append(self.returns.iloc[300:].values, self.returns.index[300:])
+        engine.drop_before(self.returns.index[100])
+
+        window = self.returns.iloc[100:]
+        np.testing.assert_allclose(engine.mean(), window.mean().values, rtol=1e-9)
+        np.testing.assert_allclose(engine.sample(), window.cov().values, rtol=1e-8)
+        np.testing.assert_allclose(engine.ledoit_wolf()[0], reference_ledoit_wolf(window.values)[0], rtol=1e-6)
+
+    def test_ewma_matches_pandas(self):
+        engine = CovarianceEngine.from_returns(self.returns, ewma_span=60)
+        expected = self.returns.ewm(span=60, adjust=False).cov(bias=True).iloc[-6:].values
+        np.testing.assert_allclose(engine.ewma(), expected, rtol=1e-8)
+
+
+class TestCovarianceService(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.store = PriceStore(os.path.join(self.tmp_dir, 'store'))
+        import_csv_dir(self.store, 'data')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_cross_asset_covariance_and_incremental_update(self):
+        tickers = ['AAPL', 'MSFT', 'SOL-USD']
+        service = CovarianceService(self.store, cache_dir=os.path.join(self.tmp_dir, 'cov'))
+        mean, cov = service.get(tickers, '2022-01-01', '2024-06-01')
+        returns = store_returns(self.store, tickers, '2022-01-01', '2024-06-01')
+        np.testing.assert_allclose(cov, returns.cov().values, rtol=1e-9)
+        self.assertNotEqual(cov[0, 2], 0.0)
+
+        # Окно сдвигается на месяц вперёд: тот же движок, только новые дни
+        engine = service.engines[tuple(tickers)]
+        mean, cov = service.get(tickers, '2022-02-01', '2024-07-01')
+        self.assertIs(service.engines[tuple(tickers)], engine)
+        returns = store_returns(self.store, tickers, '2022-02-01', '2024-07-01')
+        np.testing.assert_allclose(cov, returns.cov().values, rtol=1e-8)
+        np.testing.assert_allclose(mean, returns.mean().values, rtol=1e-8)
+
+        # Новый сервис читает результат с диска
+        cached = CovarianceService(self.store, cache_dir=os.path.join(self.tmp_dir, 'cov'))
+        np.testing.assert_allclose(cached.get(tickers, '2022-02-01', '2024-07-01')[1], cov)
+        self.assertEqual(cached.engines, {})
+
+    def test_store_update_invalidates_cache(self):
+        tickers = ['AAPL', 'MSFT']
+        cache_dir = os.path.join(self.tmp_dir, 'cov')
+        service = CovarianceService(self.store, cache_dir=cache_dir)
+        _, cov = service.get(tickers, '2022-01-01', '2024-06-01')
+
+        # Правка цены внутри окна без новых дней (повторный запуск после закрытия торгов)
+        day = pd.Timestamp('2024-05-31')
+        price = self.store.frame('AAPL', day, day)['Close'].iloc[0]
+        self.store.write('AAPL', pd.Series([price * 1.5], index=[day]))
+        self.store.commit()
+        _, updated = service.get(tickers, '2022-01-01', '2024-06-01')
+        expected = store_returns(self.store, tickers, '2022-01-01', '2024-06-01').cov().values
+        np.testing.assert_allclose(updated, expected, rtol=1e-9)
+        self.assertFalse(np.allclose(updated, cov))
+        # Дисковый кэш прежней версии хранилища тоже не используется
+        fresh = CovarianceService(self.store, cache_dir=cache_dir)
+        np.testing.assert_allclose(fresh.get(tickers, '2022-01-01', '2024-06-01')[1], expected, rtol=1e-9)
+
+    def test_store_append_keeps_engine(self):
+        tickers = ['AAPL', 'MSFT']
+        service = CovarianceService(self.store)
+        end = self.store.dates[-1]
+        service.get(tickers, '2022-01-01', end)
+        engine = service.engines[tuple(tickers)]
+        revision = self.store.revision
+
+        # Дозагрузка новых дней через хранилище: движок только дописывает их
+        days = pd.date_range(end + pd.Timedelta(days=1), periods=5)
+        for ticker, step in zip(tickers, (1.01, 0.995)):
+            last = self.store.frame(ticker, end, end)['Close'].iloc[0]
+            self.store.write(ticker, pd.Series(last * step ** np.arange(1, 6), index=days))
+        self.store.commit()
+        # Переписаны только новые дни, заполненные ffill при расширении календаря, — после конца движка
+        self.assertGreater(self.store.rewritten_since(revision), end)
+        with patch.object(CovarianceEngine, 'from_returns', side_effect=AssertionError("движок пересобран")):
+            mean, cov = service.get(tickers, '2022-01-01', days[-1])
+        self.assertIs(service.engines[tuple(tickers)], engine)
+        self.assertEqual(engine.last_date, days[-1])
+        returns = store_returns(self.store, tickers, '2022-01-01', days[-1])
+        np.testing.assert_allclose(cov, returns.cov().values, rtol=1e-8)
+        np.testing.assert_allclose(mean, returns.mean().values, rtol=1e-8)
+
+        # Правка уже вошедшего в движок дня — движок строится заново
+        self.store.write('MSFT', pd.Series([400.0], index=[days[2]]))
+        self.store.commit()
+        self.assertEqual(self.store.rewritten_since(self.store.revision - 1), days[2])
+        _, cov = service.get(tickers, '2022-01-01', days[-1])
+        self.assertIsNot(service.engines[tuple(tickers)], engine)
+        expected = store_returns(self.store, tickers, '2022-01-01', days[-1]).cov().values
+        np.testing.assert_allclose(cov, expected, rtol=1e-9)
+
+
+if __name__ == '__main__':
+    unittest.main()
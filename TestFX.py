@@ -0,0 +1,79 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from fx import FXService, currency_symbol
+from kvstore import KVStore
+from providers import FrameProvider
+
+
+class TestFX(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.store = KVStore(os.path.join(self.tmp_dir, 'cache.db'))
+        self.fetches = []
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def fetch(self, base):
+        self.fetches.append(base)
+        return {'USD': 1, 'KZT': 470.0, 'EUR': 0.9}
+
+    def test_spot_cached(self):
+        fx = FXService(self.store, fetch=self.fetch)
+        self.assertEqual(fx.spot('KZT'), 470.0)
+        # Один запрос на все валюты ответа
+        self.assertEqual(fx.spot('EUR'), 0.9)
+        self.assertEqual(fx.spot('USD'), 1.0)
+        self.assertEqual(self.fetches, ['USD'])
+        self.assertEqual(len(self.store.get_many('fx_history:USD/KZT')), 1)
+
+    def test_spot_stale_fallback(self):
+        FXService(self.store, fetch=self.fetch).spot('KZT')
+
+        def offline(base):
+            raise ConnectionError('нет сети')
+
+        fx = FXService(self.store, fetch=offline, ttl=0)
+        self.assertEqual(fx.spot('KZT'), 470.0)
+        with self.assertRaises(ConnectionError):
+            fx.spot('RUB')
+
+    def test_history_backfill_and_convert(self):
+        days = pd.bdate_range('2024-01-01', '2024-01-31')
+        rates = pd.DataFrame({'KZT=X': np.linspace(450.0, 480.0, len(days))}, index=days)
+        provider = FrameProvider(rates)
+        fx = FXService(self.store, provider=provider, fetch=self.fetch)
+
+        history = fx.history('KZT', '2024-01-05', '2024-01-14')
+        self.assertEqual(len(history), 10)
+        # Выходные берут курс пятницы
+        self.assertEqual(history['2024-01-06'], history['2024-01-05'])
+        self.assertEqual(fx.rate_at('KZT', '2024-01-02'), rates['KZT=X'].iloc[1])
+        calls = len(provider.calls)
+        fx.history('KZT', '2024-01-08', '2024-01-12')
+        self.assertEqual(len(provider.calls), calls)  # Уже сохранено локально
+
+        frame = pd.DataFrame({'value': [1.0, 2.0], 'change': [0.5, -1.0]},
+                             index=pd.to_datetime(['2024-01-02', '2024-01-10']))
+        local = fx.convert(frame, 'KZT', dates=frame.index)
+        expected = rates['KZT=X'].reindex(frame.index).values
+        np.testing.assert_allclose(local['value'].values, [1.0, 2.0] * expected)
+        np.testing.assert_allclose(fx.convert(np.ones((2, 3)), 'KZT', dates=frame.index), np.repeat(expected[:, None], 3, axis=1))
+        np.testing.assert_allclose(fx.convert(np.array([1.0, 2.0]), 'EUR'), [0.9, 1.8])
+        self.assertEqual(fx.convert(2.0, 'KZT', rate=500.0), 1000.0)
+
+    def test_currency_symbol(self):
+        self.assertEqual(currency_symbol('KZT'), '₸')
+        self.assertEqual(currency_symbol('CHF'), 'CHF')
+
+
+if __name__ == '__main__':
+    unittest.main()
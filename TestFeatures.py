@@ -0,0 +1,81 @@
+import os
+import pickle
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from backtest import run_backtest
+from benchmark import synthetic_universe
+from covariance import store_returns
+from features import open_features, screen_features
+from price_store import PriceStore
+from screening import screen
+
+
+class TestFeatures(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        prices, _ = synthetic_universe(20, start='2021-01-01', end='2023-12-31', seed=7)
+        self.store = PriceStore(os.path.join(self.tmp.name, 'store'))
+        for ticker in prices.columns:
+            self.store.write(ticker, prices[ticker])
+        self.store.commit()
+        self.root = os.path.join(self.tmp.name, 'features')
+        self.index = open_features(self.store, self.root, day='2024-01-02')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_returns_match_store(self):
+        tickers = self.store.tickers[:5]
+        expected = store_returns(self.store, tickers, '2022-01-01', '2023-06-30')
+        actual = self.index.returns_frame(tickers, '2022-01-01', '2023-06-30')
+        pd.testing.assert_index_equal(actual.index, expected.index)
+        # Входы ковариации для решателя не теряют точности: доходности совпадают побитово
+        np.testing.assert_array_equal(actual.values, expected.values)
+        self.assertEqual(self.index['returns'].dtype, np.float64)
+        self.assertEqual(self.index['SMA_50'].dtype, np.float32)
+
+    def test_screen_matches_screen(self):
+        tickers = self.store.tickers
+        values, mask, dates = self.store.matrix(tickers, '2022-01-01')
+        expected = screen(values, mask, tickers, dates)
+        actual = screen_features(self.index, tickers, '2022-01-01')
+        for name in ('sortino', 'SMA_50', 'SMA_200'):
+            np.testing.assert_allclose(actual[name].values, expected[name].values, rtol=1e-5)
+        # RSI по всей истории: вклад дней до окна затухает как (13/14) ** n_obs
+        np.testing.assert_allclose(actual['RSI'].values, expected['RSI'].values, atol=1e-3)
+        pd.testing.assert_series_equal(actual['first_date'], expected['first_date'])
+        np.testing.assert_array_equal(actual['n_obs'].values, expected['n_obs'].values)
+
+        parallel = screen_features(self.index, tickers, '2022-01-01', processes=2)
+        pd.testing.assert_frame_equal(parallel, actual)
+
+    def test_attach_by_path(self):
+        # В пул процессов передаётся только путь, а не матрицы
+        self.assertLess(len(pickle.dumps(self.index)), 1024)
+        self.assertIs(pickle.loads(pickle.dumps(self.index)), self.index)
+        # Тот же день и неизменное хранилище — индекс не пересобирается
+        self.assertIs(open_features(self.store, self.root, day='2024-01-02'), self.index)
+        self.store.write('NEW', pd.Series([1.0, 1.1], index=pd.to_datetime(['2023-12-28', '2023-12-29'])))
+        self.store.commit()
+        rebuilt = open_features(self.store, self.root, day='2024-01-02')
+        self.assertIn('NEW', rebuilt)
+        self.assertEqual(os.listdir(self.root), [os.path.basename(rebuilt.path)])
+
+    def test_backtest_workers_attach(self):
+        tickers = self.store.tickers
+        values, mask, dates = self.store.matrix(tickers)
+        options = dict(start='2022-01-01', freq='Q', backend='heuristic')
+        sequential = run_backtest(values, mask, dates, tickers, 355800, features=self.index, **options)
+        parallel = run_backtest(values, mask, dates, tickers, 355800, features=self.index, processes=2, **options)
+        pd.testing.assert_frame_equal(parallel.equity, sequential.equity)
+        plain = run_backtest(values, mask, dates, tickers, 355800, **options)
+        self.assertEqual(list(plain.rebalances['tickers']), list(sequential.rebalances['tickers']))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,39 +1,157 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
 import unittest
 from unittest.mock import patch
+import numpy as np
 import pandas as pd
 from datetime import datetime, timedelta
-from FinLogic import FinLogic  # Импортируем ваш класс FinLogic
+from FinLogic import FinLogic, build_parser  # Импортируем ваш класс FinLogic
+from providers import FrameProvider
 
 class TestFinLogic(unittest.TestCase):
     
+    @patch('requests.Session.request', side_effect=AssertionError("Тест не должен обращаться к сети"))
     @patch.object(FinLogic, 'fetch_data')
     @patch.object(FinLogic, 'get_conversion_rate')
-    @patch.object(FinLogic, 'get_coinmarketcap_tickers')
-    @patch.object(FinLogic, 'get_yahoo_tickers')
-    def test_optimize_portfolio(self, mock_yahoo_tickers, mock_coinmarketcap_tickers, mock_conversion_rate, mock_fetch_data):
+    @patch('sources.SourceRegistry.fetch_all')
+    def test_optimize_portfolio(self, mock_fetch_all, mock_conversion_rate, mock_fetch_data, mock_request):
         # Определяем фиктивные значения, которые будут возвращены заглушками
-        mock_yahoo_tickers.return_value = ['AAPL', 'MSFT', 'GOOGL']
-        mock_coinmarketcap_tickers.return_value = ['BTC-USD', 'ETH-USD']
+        mock_fetch_all.return_value = {'yahoo_trending': ['AAPL', 'MSFT', 'GOOGL'], 'coinmarketcap': ['BTC-USD', 'ETH-USD'],
+                                       'yahoo_crypto': [], 'yahoo_most_active': []}
         mock_conversion_rate.return_value = 425.0  # Пример: 1 USD = 425 KZT
         
-        # Создаем фиктивные данные для fetch_data
-        date_range = pd.date_range(start='2020-01-01', end='2023-01-01')
+        # Создаем фиктивные данные для fetch_data: случайное блуждание с ростом,
+        # заканчивающееся сегодня, чтобы трёхлетнее окно было заполнено
+        date_range = pd.date_range(end=datetime.today().strftime('%Y-%m-%d'), periods=3 * 365 + 30)
+        rng = np.random.default_rng(0)
+        start_prices = {'AAPL': 150, 'MSFT': 200, 'GOOGL': 2500, 'BTC-USD': 50000, 'ETH-USD': 3000}
         mock_data = pd.DataFrame(index=date_range, data={
-            'AAPL': 150 + 0.01 * range(len(date_range)),
-            'MSFT': 200 + 0.01 * range(len(date_range)),
-            'GOOGL': 2500 + 0.01 * range(len(date_range)),
-            'BTC-USD': 50000 + 10 * range(len(date_range)),
-            'ETH-USD': 3000 + 1 * range(len(date_range)),
+            ticker: price * np.exp(np.cumsum(rng.normal(0.001, 0.02, len(date_range))))
+            for ticker, price in start_prices.items()
         })
         mock_fetch_data.return_value = mock_data
+        # Капитализация и объём для filter_tickers отдаёт локальный поставщик вместо yf.Ticker
+        provider = FrameProvider(mock_data, {ticker: {'marketCap': 1e12, 'volume': 1e8} for ticker in start_prices})
 
         # Создаем экземпляр FinLogic и тестируем метод optimize_portfolio
-        fin_logic = FinLogic(data_dir='data', portfolio_file='portfolio.csv')
-        new_investment = 140000
-        fin_logic.optimize_portfolio(new_investment)
+        with tempfile.TemporaryDirectory() as tmp:
+            portfolio_file = os.path.join(tmp, 'portfolio.csv')
+            shutil.copy('portfolio.csv', portfolio_file)
+            fin_logic = FinLogic(data_dir=os.path.join(tmp, 'data'), portfolio_file=portfolio_file, cache_file=os.path.join(tmp, 'cache.json'),
+                                 provider=provider, interactive=False, allow=list(start_prices))
+            self.addCleanup(fin_logic.close)
+            new_investment = 1400000
+            allocations = fin_logic.optimize_portfolio(new_investment)
 
-        # Здесь вы можете добавить дополнительные проверки для проверки корректности оптимизации
-        # Например, проверка финальных аллокаций, сохранения файла и т.д.
+            # Распределение не превышает бюджет и состоит только из известных тикеров
+            self.assertTrue(allocations)
+            self.assertLessEqual(set(allocations), set(start_prices))
+            self.assertLessEqual(sum(allocations.values()), new_investment / 425.0 * (1 + 1e-6))
+            self.assertTrue(all(value >= 5000 / 425.0 - 1e-6 for value in allocations.values()))
+            # Без подтверждения файл портфеля не перезаписывается
+            with open('portfolio.csv') as original, open(portfolio_file) as copy:
+                self.assertEqual(original.read(), copy.read())
+        mock_request.assert_not_called()
+
+    def test_import_has_no_side_effects(self):
+        # Импорт модуля не загружает тяжёлые зависимости и не запускает оптимизацию
+        code = ("import sys, FinLogic; "
+                "print(sorted(m for m in ('pandas', 'numpy', 'cvxpy', 'yfinance', 'ta', 'bs4') if m in sys.modules))")
+        output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+        self.assertEqual(output.strip().splitlines()[-1], '[]')
+
+    def test_non_interactive_policy(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            cache_file = os.path.join(tmp, 'cache.json')
+            fin_logic = FinLogic(data_dir=os.path.join(tmp, 'data'), portfolio_file='portfolio.csv', cache_file=cache_file, provider=object(),
+                                 interactive=False, allow=['AAPL'], deny=['BTC-USD'])
+            self.addCleanup(fin_logic.close)
+            fin_logic.cache = {'MSFT': True, 'BTC-USD': True}
+            with patch('builtins.input', side_effect=AssertionError("input() в неинтерактивном режиме")):
+                self.assertTrue(fin_logic.check_asset_availability('AAPL'))
+                self.assertFalse(fin_logic.check_asset_availability('BTC-USD'))
+                self.assertTrue(fin_logic.check_asset_availability('MSFT'))
+                self.assertFalse(fin_logic.check_asset_availability('GOOGL'))
+                self.assertFalse(fin_logic.confirm("Перезаписать? "))
+                fin_logic.auto_confirm = True
+                self.assertTrue(fin_logic.confirm("Перезаписать? "))
+            self.assertNotIn('GOOGL', fin_logic.cache)
+
+    def test_availability_cache_store(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            cache_file = os.path.join(tmp, 'cache.json')
+            with open(cache_file, 'w') as file:
+                file.write('{"AAPL": true, "SHIB-USD": false}')
+            fin_logic = FinLogic(data_dir=tmp, portfolio_file='portfolio.csv', cache_file=cache_file, provider=object())
+            self.addCleanup(fin_logic.close)
+            # Старый JSON перенесён в общее хранилище
+            self.assertEqual(fin_logic.cache, {'AAPL': True, 'SHIB-USD': False})
+            self.assertFalse(os.path.exists(cache_file))
+            with patch('builtins.input', return_value='y'):
+                self.assertTrue(fin_logic.check_asset_availability('MSFT'))
+            # Ответ сохранён одной записью и виден новому экземпляру, вопрос не повторяется
+            other = FinLogic(data_dir=tmp, portfolio_file='portfolio.csv', cache_file=cache_file, provider=object())
+            self.addCleanup(other.close)
+            with patch('builtins.input', side_effect=AssertionError("Повторный вопрос")):
+                self.assertTrue(other.check_asset_availability('MSFT'))
+                self.assertFalse(other.check_asset_availability('SHIB-USD'))
+
+    def test_cache_store_is_lazy(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            cache_file = os.path.join(tmp, 'answers.json')
+            with open(cache_file, 'w') as file:
+                file.write('{"AAPL": true}')
+            fin_logic = FinLogic(data_dir=tmp, portfolio_file='portfolio.csv', cache_file=cache_file, provider=object())
+            self.addCleanup(fin_logic.close)
+            # Конструктор не создаёт базу и не переносит JSON
+            self.assertEqual(sorted(os.listdir(tmp)), ['answers.json'])
+            # --cache выбирает, где хранятся ответы
+            self.assertEqual(fin_logic.cache, {'AAPL': True})
+            self.assertIn('answers.db', os.listdir(tmp))
+            self.assertNotIn('answers.json', os.listdir(tmp))
+
+    def test_screening_key_follows_store(self):
+        import pandas as pd
+        with tempfile.TemporaryDirectory() as tmp:
+            fin_logic = FinLogic(data_dir=tmp, portfolio_file='portfolio.csv', cache_file=os.path.join(tmp, 'cache.json'),
+                                 provider=object())
+            self.addCleanup(fin_logic.close)
+            fin_logic.price_store.write('AAA', pd.Series([1.0, 2.0], index=pd.to_datetime(['2024-01-01', '2024-01-02'])))
+            window_start = pd.Timestamp('2024-01-01')
+            key = fin_logic._screening_key(['AAA'], window_start)
+            fin_logic.price_store.write('AAA', pd.Series([2.5], index=pd.to_datetime(['2024-01-02'])))
+            self.assertNotEqual(fin_logic._screening_key(['AAA'], window_start), key)
+
+    def test_cli_arguments(self):
+        args = build_parser().parse_args(['140000', '--non-interactive', '--allow', 'AAPL', 'MSFT', '--deny', 'ETH-USD', '--yes'])
+        self.assertEqual(args.investment, 140000)
+        self.assertTrue(args.non_interactive and args.auto_confirm)
+        self.assertEqual(args.allow, ['AAPL', 'MSFT'])
+        self.assertEqual(args.deny, ['ETH-USD'])
+
+    def test_portfolio_ledger(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            portfolio_file = os.path.join(tmp, 'portfolio.csv')
+            shutil.copy('portfolio.csv', portfolio_file)
+            fin_logic = FinLogic(data_dir=tmp, portfolio_file=portfolio_file, cache_file=os.path.join(tmp, 'cache.json'),
+                                 provider=object())
+            self.addCleanup(fin_logic.close)
+            # Старый файл без Quantity: количества оцениваются по стоимости
+            self.assertEqual(fin_logic.current_quantities, {})
+            self.assertEqual(fin_logic.holding_quantities(['NVDA', 'SOL-USD', 'AAPL'], [120.0, 82.77, 200.0]), [3.0, 1.0, 0.0])
+
+            fin_logic.save_portfolio([('NVDA', 360.0, 3.0), ('SOL-USD', 41.387, 0.5)])
+            self.assertEqual(os.listdir(tmp).count('portfolio.csv'), 1)
+            self.assertFalse([name for name in os.listdir(tmp) if name.endswith('.tmp')])
+            reloaded = FinLogic(data_dir=tmp, portfolio_file=portfolio_file, cache_file=os.path.join(tmp, 'cache.json'),
+                                provider=object())
+            self.addCleanup(reloaded.close)
+            self.assertEqual(reloaded.current_portfolio, {'NVDA': 360.0, 'SOL-USD': 41.39})
+            self.assertEqual(reloaded.current_quantities, {'NVDA': 3.0, 'SOL-USD': 0.5})
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,72 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from fundamentals import FundamentalsService, apply_filters
+from kvstore import KVStore
+from providers import CSVProvider
+from ttl_cache import TTLCache
+
+
+class TestFundamentalsService(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.cache_path = os.path.join(self.tmp_dir, 'cache.db')
+        self.provider = CSVProvider('data', fundamentals={
+            'AAPL': {'marketCap': 3.4e12, 'volume': 5e7},
+            'ELF': {'marketCap': 9e8, 'volume': 2e6},
+            'AVGO': {'marketCap': 7e11, 'volume': 3e7},
+            'SOL-USD': {'marketCap': 6e10, 'volume': 2e9},
+            'SHIB-USD': {'marketCap': 1e10, 'volume': 5e5},
+        })
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_fetches_each_ticker_once_and_caches_on_disk(self):
+        tickers = ['AAPL', 'ELF', 'AVGO', 'SOL-USD', 'SHIB-USD', 'MISSING']
+        service = FundamentalsService(self.provider, TTLCache(3600, self.cache_path))
+        table = service.fetch(tickers)
+        self.assertEqual(list(table.index), tickers)
+        self.assertEqual(table.loc['AAPL', 'marketCap'], 3.4e12)
+        self.assertTrue(table.loc['MISSING'].isna().all())
+        infos = [call for call in self.provider.calls if call[0] == 'info']
+        self.assertEqual(sorted(ticker for _, ticker in infos), sorted(tickers))
+
+        # Новый сервис читает дисковый кэш и не ходит к поставщику
+        self.provider.calls.clear()
+        service = FundamentalsService(self.provider, TTLCache(3600, self.cache_path))
+        service.fetch(['AAPL', 'SOL-USD'])
+        self.assertEqual(self.provider.calls, [])
+
+    def test_price_expires_before_info(self):
+        service = FundamentalsService(self.provider, TTLCache(3600, self.cache_path), price_ttl=0.05)
+        service.fetch(['AAPL'])
+        time.sleep(0.1)
+        self.provider.calls.clear()
+        service.fetch(['AAPL'])
+        self.assertEqual(self.provider.calls, [('price', 'AAPL')])
+
+    def test_store_entries_expire(self):
+        # Записи кэша получают срок ttl в хранилище и удаляются purge после истечения
+        with KVStore(self.cache_path) as store:
+            cache = TTLCache(0.05, namespace='fundamentals', store=store)
+            cache.set_many({'info:AAPL': {'marketCap': 3.4e12}, 'price:AAPL': 190.0})
+            self.assertEqual(cache.get('price:AAPL'), 190.0)
+            self.assertEqual(store.purge(), 0)
+            time.sleep(0.1)
+            self.assertEqual(store.purge(), 2)
+            self.assertEqual(store.get_many('fundamentals'), {})
+
+    def test_apply_filters(self):
+        service = FundamentalsService(self.provider, TTLCache(3600))
+        table = service.fetch(['AAPL', 'ELF', 'AVGO', 'SOL-USD', 'SHIB-USD', 'MISSING'])
+        # AVGO дороже лимита цены, ELF и SHIB-USD не проходят по капитализации и объёму
+        self.assertEqual(apply_filters(table, max_stock_price=500), ['AAPL', 'SOL-USD'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import json
+import os
+import tempfile
+import unittest
+
+from instrumentation import Metrics, record_response, METRICS
+
+
+class FakeResponse:
+    def __init__(self, url, status_code, content):
+        self.url = url
+        self.status_code = status_code
+        self.content = content
+
+
+class TestInstrumentation(unittest.TestCase):
+
+    def test_timers_counters_and_cache_ratio(self):
+        metrics = Metrics()
+        with metrics.timer('stage_seconds', stage='rank'):
+            pass
+        metrics.observe('stage_seconds', 2.0, stage='rank')
+        metrics.incr('http_bytes_total', 100, host='example.com')
+        metrics.incr('http_bytes_total', 50, host='example.com')
+        for hit in (True, True, True, False):
+            metrics.cache('history', hit)
+        data = metrics.to_dict()
+        timer = data['timers'][0]
+        self.assertEqual((timer['name'], timer['labels'], timer['count']), ('stage_seconds', {'stage': 'rank'}, 2))
+        self.assertGreaterEqual(timer['seconds'], 2.0)
+        self.assertEqual(timer['max_seconds'], 2.0)
+        self.assertIn({'name': 'http_bytes_total', 'labels': {'host': 'example.com'}, 'value': 150}, data['counters'])
+        self.assertEqual(data['cache_hit_ratio'], {'history': 0.75})
+
+    def test_prometheus_and_json_export(self):
+        metrics = Metrics()
+        metrics.observe('solver_seconds', 0.5, solver='SCIP', phase='solve')
+        metrics.gauge('solver_gap', 0.1, solver='SCIP')
+        text = metrics.to_prometheus()
+        self.assertIn('# TYPE finlogic_solver_seconds summary', text)
+        self.assertIn('finlogic_solver_seconds_count{phase="solve",solver="SCIP"} 1', text)
+        self.assertIn('finlogic_solver_gap{solver="SCIP"} 0.1', text)
+        with tempfile.TemporaryDirectory() as tmp:
+            metrics.export(os.path.join(tmp, 'metrics.json'))
+            metrics.export(os.path.join(tmp, 'metrics.prom'))
+            with open(os.path.join(tmp, 'metrics.json')) as file:
+                self.assertEqual(json.load(file)['gauges'][0]['value'], 0.1)
+            with open(os.path.join(tmp, 'metrics.prom')) as file:
+                self.assertEqual(file.read(), text)
+
+    def test_profile_only_selected_stage(self):
+        metrics = Metrics()
+        with tempfile.TemporaryDirectory() as tmp:
+            metrics.profile_dir = tmp
+            metrics.profile_stages = {'solve'}
+            with metrics.profile('rank'):
+                sum(range(1000))
+            with metrics.profile('solve'):
+                sum(range(1000))
+            self.assertEqual(os.listdir(tmp), ['solve.prof'])
+
+    def test_http_hook(self):
+        METRICS.reset()
+        record_response(FakeResponse('https://finance.yahoo.com/trending-tickers/', 200, b'x' * 42))
+        counters = {(item['name'], item['labels']['host']): item['value'] for item in METRICS.to_dict()['counters']}
+        self.assertEqual(counters[('http_requests_total', 'finance.yahoo.com')], 1)
+        self.assertEqual(counters[('http_bytes_total', 'finance.yahoo.com')], 42)
+
+
+if __name__ == '__main__':
+    unittest.main()
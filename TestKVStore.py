@@ -0,0 +1,101 @@
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from kvstore import KVStore
+
+
+def write_keys(path, worker, count):
+    with KVStore(path) as store:
+        for i in range(0, count, 10):
+            store.set_many('jobs', {f'{worker}:{j}': j for j in range(i, i + 10)})
+    return worker
+
+
+class TestKVStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'cache.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def open_store(self):
+        store = KVStore(self.path)
+        self.addCleanup(store.close)
+        return store
+
+    def test_namespaces_and_values(self):
+        store = self.open_store()
+        store.set('availability', 'AAPL', True)
+        store.set('fx', 'AAPL', {'rate': 1.5})
+        store.set_many('tickers', {'yahoo': ['AAPL', 'MSFT'], 'coinmarketcap': []})
+        self.assertTrue(store.get('availability', 'AAPL'))
+        self.assertEqual(store.get('fx', 'AAPL'), {'rate': 1.5})
+        self.assertEqual(store.get_many('tickers'), {'yahoo': ['AAPL', 'MSFT'], 'coinmarketcap': []})
+        self.assertEqual(store.get_many('tickers', ['yahoo', 'missing']), {'yahoo': ['AAPL', 'MSFT']})
+        self.assertIsNone(store.get('availability', 'MSFT'))
+        store.delete('tickers')
+        self.assertEqual(store.get_many('tickers'), {})
+        # Данные видны новому экземпляру (другому процессу)
+        self.assertTrue(self.open_store().get('availability', 'AAPL'))
+
+    def test_ttl_and_max_age(self):
+        store = self.open_store()
+        store.set('fx', 'USD/KZT', 470.0, ttl=0.05)
+        store.set('fx', 'USD/EUR', 0.9)
+        self.assertEqual(store.get('fx', 'USD/KZT'), 470.0)
+        time.sleep(0.1)
+        self.assertIsNone(store.get('fx', 'USD/KZT'))
+        self.assertIsNone(store.get('fx', 'USD/EUR', max_age=0.05))
+        self.assertEqual(store.get('fx', 'USD/EUR'), 0.9)
+        self.assertEqual(store.purge(), 1)
+
+    def test_concurrent_writers(self):
+        with KVStore(self.path):
+            pass
+        # spawn: дочерние процессы не наследуют открытые соединения SQLite тестового процесса
+        with ProcessPoolExecutor(max_workers=4, mp_context=multiprocessing.get_context('spawn')) as pool:
+            list(pool.map(write_keys, [self.path] * 4, range(4), [100] * 4))
+        store = self.open_store()
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            list(pool.map(lambda worker: write_keys(self.path, worker, 50), range(4, 8)))
+        self.assertEqual(len(store.get_many('jobs')), 4 * 100 + 4 * 50)
+
+    def test_close_reopens_lazily(self):
+        store = self.open_store()
+        store.set('fx', 'USD/KZT', 470.0)
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            self.assertEqual(list(pool.map(lambda _: store.get('fx', 'USD/KZT'), range(2))), [470.0, 470.0])
+        self.assertGreaterEqual(len(store.connections), 2)
+        store.close()
+        self.assertEqual(store.connections, [])
+        # После закрытия хранилище открывает соединение заново при первом обращении
+        self.assertEqual(store.get('fx', 'USD/KZT'), 470.0)
+
+    def test_import_json(self):
+        legacy = os.path.join(self.tmp_dir, 'cache.json')
+        with open(legacy, 'w') as file:
+            json.dump({'AAPL': True, 'SHIB-USD': False}, file)
+        store = self.open_store()
+        self.assertEqual(store.import_json('availability', legacy), 2)
+        self.assertFalse(os.path.exists(legacy))
+        self.assertEqual(store.get_many('availability'), {'AAPL': True, 'SHIB-USD': False})
+        self.assertEqual(store.import_json('availability', legacy), 0)
+
+        timestamped = os.path.join(self.tmp_dir, 'tickers_cache.json')
+        with open(timestamped, 'w') as file:
+            json.dump({'tickers:yahoo': [time.time() - 7200, ['AAPL']]}, file)
+        store.import_json('tickers', timestamped, timestamped=True)
+        self.assertIsNone(store.get('tickers', 'tickers:yahoo', max_age=3600))
+        self.assertEqual(store.get('tickers', 'tickers:yahoo'), ['AAPL'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,185 @@
+import csv
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime
+from unittest.mock import patch
+
+import numpy as np
+import pandas as pd
+
+from FinLogic import FinLogic
+from pipeline import STAGES, Pipeline
+from providers import FrameProvider
+
+
+class FakeFinLogic:
+    """Минимальная замена FinLogic: считает вызовы этапов и не ходит в сеть."""
+
+    def __init__(self, data_dir):
+        self.data_dir = data_dir
+        self.portfolio_file = os.path.join(data_dir, 'portfolio.csv')
+        self.default_start_date = '2021-01-01'
+        self.end_date = '2024-01-01'
+        self.cov_method = 'sample'
+        self.solver = 'heuristic'
+        self.allow, self.deny = set(), set()
+        self.currency, self.min_lot = 'KZT', 5000
+        self.rebalance, self.transaction_cost, self.turnover_penalty = False, 0.001, 0.0
+        self.current_portfolio, self.current_quantities = {}, {}
+        self.data_store = {}
+        self.conversion_rate = None
+        self.calls = []
+
+    def get_conversion_rate(self):
+        self.calls.append('rate')
+        return 500.0
+
+    def get_all_tickers(self):
+        self.calls.append('tickers')
+        return ['AAA', 'BBB', 'CCC-USD']
+
+    def filter_tickers(self, tickers, new_investment):
+        self.calls.append('filter')
+        return tickers
+
+    def get_top_4_by_sortino(self, tickers):
+        self.calls.append('rank')
+        return tickers
+
+    def load_data(self, tickers):
+        self.calls.append('load')
+        self.data_store.update({ticker: None for ticker in tickers})
+
+    def prepare_allocation_inputs(self, stock_tickers, crypto_tickers):
+        tickers = stock_tickers + crypto_tickers
+        return tickers, np.array([0.002, 0.001, 0.003]), np.diag([1e-4, 2e-4, 4e-4]), np.array([50.0, 20.0, 100.0])
+
+    def holding_quantities(self, tickers, prices):
+        return [self.current_quantities.get(ticker, 0.0) for ticker in tickers]
+
+    def write_allocation(self, tickers, n_stocks, quantities, prices, holdings=None, leftover=None, untraded=None):
+        self.calls.append('write')
+        self.written_holdings = holdings
+        self.written_leftover = leftover
+        return {ticker: quantity * price for ticker, quantity, price in zip(tickers, quantities, prices) if quantity > 0}, False
+
+
+class TestPipeline(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.fin_logic = FakeFinLogic(self.tmp.name)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_full_run_writes_checkpoints(self):
+        update = Pipeline(self.fin_logic, 100000).run()
+        self.assertEqual(self.fin_logic.calls, ['rate', 'tickers', 'filter', 'rank', 'load', 'write'])
+        self.assertAlmostEqual(sum(update.allocations.values()), 100000 / 500.0)
+        self.assertAlmostEqual(self.fin_logic.written_leftover, 0.0, places=6)
+        self.assertTrue(all(fresh for _, fresh in Pipeline(self.fin_logic, 100000).status()))
+
+    def test_resume_skips_fresh_stages(self):
+        Pipeline(self.fin_logic, 100000).run()
+        self.fin_logic.calls.clear()
+        Pipeline(self.fin_logic, 100000).run()
+        self.assertEqual(self.fin_logic.calls, ['write'])
+        self.assertEqual(self.fin_logic.conversion_rate, 500.0)
+
+    def test_changed_input_resumes_from_first_stale_stage(self):
+        Pipeline(self.fin_logic, 100000).run()
+        self.fin_logic.calls.clear()
+        # Сумма инвестиций влияет на фильтр, поэтому тикеры не собираются заново
+        Pipeline(self.fin_logic, 120000).run()
+        self.assertEqual(self.fin_logic.calls, ['filter', 'rank', 'load', 'write'])
+        self.fin_logic.calls.clear()
+        self.fin_logic.end_date = '2024-01-02'
+        Pipeline(self.fin_logic, 120000).run()
+        self.assertEqual(self.fin_logic.calls[:2], ['rate', 'tickers'])
+
+    def test_solver_failure_keeps_upstream_work(self):
+        self.fin_logic.solver = 'NO_SUCH_SOLVER'
+        self.assertIsNone(Pipeline(self.fin_logic, 100000).run())
+        self.assertFalse(dict(Pipeline(self.fin_logic, 100000).status())['solve'])
+        self.fin_logic.calls.clear()
+        self.fin_logic.solver = 'heuristic'
+        update = Pipeline(self.fin_logic, 100000).run()
+        self.assertEqual(self.fin_logic.calls, ['write'])
+        self.assertTrue(update.allocations)
+
+    def test_invalidate_and_until(self):
+        pipeline = Pipeline(self.fin_logic, 100000)
+        inputs = pipeline.run(until='load')
+        self.assertEqual(inputs.tickers, ['AAA', 'BBB', 'CCC-USD'])
+        self.assertEqual(inputs.n_stocks, 2)
+        pipeline.invalidate('rank')
+        status = dict(pipeline.status())
+        self.assertEqual([stage for stage in STAGES if status[stage]], ['discover', 'filter'])
+        self.fin_logic.calls.clear()
+        pipeline.run()
+        self.assertEqual(self.fin_logic.calls, ['rank', 'load', 'write'])
+
+    def test_rebalance_solves_from_holdings(self):
+        self.fin_logic.rebalance = True
+        self.fin_logic.current_portfolio = {'AAA': 500.0, 'CCC-USD': 100.0}
+        self.fin_logic.current_quantities = {'AAA': 10.0, 'CCC-USD': 1.0}
+        pipeline = Pipeline(self.fin_logic, 0)
+        update = pipeline.run()
+        inputs = pipeline.outputs['load']
+        self.assertEqual(inputs.holdings, [10.0, 0.0, 1.0])
+        self.assertEqual(self.fin_logic.written_holdings, inputs.holdings)
+        # Без новых денег итоговая стоимость не больше текущей
+        self.assertLessEqual(sum(update.allocations.values()), 600.0 + 1e-6)
+        # Изменение позиций делает устаревшими этапы начиная с фильтра
+        self.fin_logic.calls.clear()
+        self.fin_logic.current_quantities['AAA'] = 12.0
+        Pipeline(self.fin_logic, 0).run()
+        self.assertEqual(self.fin_logic.calls, ['filter', 'rank', 'load', 'write'])
+
+    @patch('requests.Session.request', side_effect=AssertionError("Тест не должен обращаться к сети"))
+    @patch.object(FinLogic, 'get_conversion_rate', return_value=425.0)
+    @patch('sources.SourceRegistry.fetch_all')
+    def test_rebalance_keeps_unpriced_holdings(self, mock_fetch_all, mock_conversion_rate, mock_request):
+        # В portfolio.csv есть позиции без истории цен (VKTX, NVDA, ET, IBM и др.)
+        mock_fetch_all.return_value = {'yahoo_trending': ['AAPL', 'MSFT', 'GOOGL'], 'coinmarketcap': ['BTC-USD', 'ETH-USD']}
+        dates = pd.date_range(end=datetime.today().strftime('%Y-%m-%d'), periods=3 * 365 + 30)
+        rng = np.random.default_rng(0)
+        start_prices = {'AAPL': 150, 'MSFT': 200, 'GOOGL': 2500, 'BTC-USD': 50000, 'ETH-USD': 3000, 'SOL-USD': 80}
+        prices = pd.DataFrame({ticker: price * np.exp(np.cumsum(rng.normal(0.001, 0.02, len(dates))))
+                               for ticker, price in start_prices.items()}, index=dates)
+        provider = FrameProvider(prices, {ticker: {'marketCap': 1e12, 'volume': 1e8} for ticker in start_prices})
+        portfolio_file = os.path.join(self.tmp.name, 'portfolio.csv')
+        shutil.copy('portfolio.csv', portfolio_file)
+        fin_logic = FinLogic(data_dir=os.path.join(self.tmp.name, 'data'), portfolio_file=portfolio_file,
+                             cache_file=os.path.join(self.tmp.name, 'cache.json'), provider=provider, interactive=False,
+                             auto_confirm=True, rebalance=True, solver='heuristic', allow=list(start_prices))
+        self.addCleanup(fin_logic.close)
+        before = dict(fin_logic.current_portfolio)
+        pipeline = Pipeline(fin_logic, 100000)
+        update = pipeline.run()
+        self.assertTrue(update.written)
+        inputs = pipeline.outputs['load']
+        unpriced = {ticker for ticker in before if ticker not in start_prices}
+        self.assertTrue(unpriced)
+        self.assertFalse(unpriced & set(inputs.tickers))
+        self.assertEqual({ticker for ticker, _, _ in inputs.untraded}, unpriced)
+        # Позиции без цен переносятся в файл без изменений, количество остаётся неизвестным
+        with open(portfolio_file, newline='') as file:
+            rows = {row['Ticker']: row for row in csv.DictReader(file)}
+        for ticker in unpriced:
+            self.assertEqual(float(rows[ticker]['Value']), before[ticker])
+            self.assertEqual(rows[ticker]['Quantity'], '')
+        self.assertEqual(set(rows) - unpriced, set(update.allocations))
+        mock_request.assert_not_called()
+
+    def test_no_resume_recomputes(self):
+        Pipeline(self.fin_logic, 100000).run()
+        self.fin_logic.calls.clear()
+        Pipeline(self.fin_logic, 100000).run(resume=False)
+        self.assertEqual(self.fin_logic.calls, ['rate', 'tickers', 'filter', 'rank', 'load', 'write'])
+
+
+if __name__ == '__main__':
+    unittest.main()
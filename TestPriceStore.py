@@ -0,0 +1,61 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from price_store import PriceStore, import_csv_dir
+
+
+class TestPriceStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.store_dir = os.path.join(self.tmp_dir, 'store')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_import_matches_csv_alignment(self):
+        store = PriceStore(self.store_dir)
+        imported = import_csv_dir(store, 'data')
+        self.assertIn('AAPL', imported)
+
+        # Повторное открытие читает метаданные с диска
+        store = PriceStore(self.store_dir)
+        start, end = '2021-07-12', '2024-07-20'
+        store.ensure_range(start, end)
+        full_index = pd.date_range(start=start, end=end)
+        for ticker in ['AAPL', 'ELF', 'SOL-USD']:
+            # Старый путь load_data: парсинг CSV, дедупликация и выравнивание
+            data = pd.read_csv(os.path.join('data', f'{ticker}.csv'), index_col='Date', parse_dates=True)
+            data = data.loc[~data.index.duplicated(keep='first')]
+            expected = data.reindex(full_index).ffill().bfill()
+
+            frame = store.frame(ticker, start, end)
+            np.testing.assert_allclose(frame['Close'].values, expected['Close'].values)
+            self.assertTrue(np.shares_memory(frame['Close'].values, store.values))
+            self.assertEqual(store.last_date(ticker), data.index.max())
+
+    def test_write_extends_calendar_and_mask(self):
+        store = PriceStore(self.store_dir)
+        store.write('AAA', pd.Series([1.0, 2.0], index=pd.to_datetime(['2024-01-01', '2024-01-03'])))
+        store.write('BBB', pd.Series([5.0], index=pd.to_datetime(['2024-01-05'])))
+        store.commit()
+
+        values, mask, dates = store.matrix(['AAA', 'BBB'])
+        self.assertEqual(list(dates), list(pd.date_range('2024-01-01', '2024-01-05')))
+        np.testing.assert_allclose(values[0], [1.0, 1.0, 2.0, 2.0, 2.0])
+        np.testing.assert_allclose(values[1], [5.0] * 5)
+        self.assertEqual(mask.sum(), 3)
+
+        store.trim('2024-01-03')
+        store.commit()
+        store = PriceStore(self.store_dir)
+        np.testing.assert_allclose(store.frame('AAA')['Close'].values, [2.0, 2.0, 2.0])
+
+
+if __name__ == '__main__':
+    unittest.main()
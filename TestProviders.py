@@ -0,0 +1,78 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from price_store import PriceStore, read_price_csv
+from providers import CSVProvider, fetch_batches, update_store
+
+
+class FlakyProvider(CSVProvider):
+    """Падает на любом пакете, в котором больше одного тикера и есть BAD."""
+
+    def download(self, tickers, start, end=None):
+        if 'BAD' in tickers and len(tickers) > 1:
+            raise ConnectionError('batch failed')
+        return super().download(tickers, start, end)
+
+
+class TestFetchBatches(unittest.TestCase):
+
+    def test_batches_are_size_bounded(self):
+        provider = CSVProvider('data')
+        tickers = ['AAPL', 'MSFT', 'GOOGL', 'CCJ', 'SOL-USD']
+        results = fetch_batches(lambda batch: provider.download(batch, '2024-01-01'), tickers, batch_size=2)
+        self.assertEqual(sorted(results), sorted(tickers))
+        self.assertEqual([len(call[0]) for call in provider.calls], [2, 2, 1])
+
+    def test_failed_batch_falls_back_to_single_tickers(self):
+        provider = FlakyProvider('data')
+        tickers = ['AAPL', 'BAD', 'MSFT', 'CCJ']
+        results = fetch_batches(lambda batch: provider.download(batch, '2024-01-01'), tickers, batch_size=2)
+        self.assertEqual(sorted(results), ['AAPL', 'CCJ', 'MSFT'])
+        self.assertEqual([call[0] for call in provider.calls], [['MSFT', 'CCJ'], ['AAPL'], ['BAD']])
+
+
+class TestUpdateStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.store = PriceStore(os.path.join(self.tmp_dir, 'store'))
+        self.full = read_price_csv(os.path.join('data', 'AAPL.csv'))
+        self.full = self.full.loc[~self.full.index.duplicated(keep='first')]
+        # В хранилище лежит история без последних 10 торговых дней
+        self.store.write('AAPL', self.full.iloc[:-10])
+        self.store.commit()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_fetches_only_missing_tail(self):
+        provider = CSVProvider('data')
+        end = self.full.index[-1] + pd.Timedelta(days=1)
+        appended = update_store(self.store, provider, ['AAPL'], end)
+
+        self.assertEqual(appended, {'AAPL': 10})
+        self.assertEqual(len(provider.calls), 1)
+        self.assertEqual(pd.Timestamp(provider.calls[0][1]), self.full.index[-11] + pd.Timedelta(days=1))
+
+        store = PriceStore(self.store.path)
+        self.assertEqual(store.last_date('AAPL'), self.full.index[-1])
+        frame = store.frame('AAPL', self.full.index[-10], self.full.index[-1])
+        np.testing.assert_allclose(frame['Close'].dropna().loc[self.full.index[-10:]].values, self.full.iloc[-10:].values)
+
+        # Повторный запуск ничего не загружает
+        self.assertEqual(update_store(store, provider, ['AAPL'], end), {'AAPL': 0})
+        self.assertEqual(len(provider.calls), 1)
+
+    def test_trims_old_rows(self):
+        keep_from = self.full.index[0] + pd.Timedelta(days=400)
+        update_store(self.store, CSVProvider('data'), [], self.full.index[-1], keep_from=keep_from)
+        self.assertEqual(PriceStore(self.store.path).start, keep_from)
+
+
+if __name__ == '__main__':
+    unittest.main()
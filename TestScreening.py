@@ -0,0 +1,63 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+import ta
+
+from price_store import PriceStore, import_csv_dir
+from screening import screen, select
+
+
+class TestScreening(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp_dir = tempfile.mkdtemp()
+        cls.store = PriceStore(os.path.join(cls.tmp_dir, 'store'))
+        import_csv_dir(cls.store, 'data')
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp_dir)
+
+    def test_matches_per_ticker_results(self):
+        tickers = sorted(self.store.tickers)
+        values, mask, dates = self.store.matrix(tickers)
+        metrics = screen(values, mask, tickers, dates)
+
+        for i, ticker in enumerate(tickers):
+            # Прежний расчёт по одному тикеру: pandas + ta
+            close = pd.Series(values[i][mask[i]], index=dates[mask[i]])
+            returns = close.pct_change().dropna()
+            sortino = returns.mean() / returns[returns < 0].std()
+            sma_50 = ta.trend.sma_indicator(close, window=50).iloc[-1]
+            sma_200 = ta.trend.sma_indicator(close, window=200).iloc[-1]
+            rsi = ta.momentum.rsi(close, window=14).iloc[-1]
+
+            row = metrics.loc[ticker]
+            np.testing.assert_allclose(
+                [row['sortino'], row['SMA_50'], row['SMA_200'], row['RSI']],
+                [sortino, sma_50, sma_200, rsi], rtol=1e-9, err_msg=ticker)
+            self.assertEqual(row['first_date'], close.index[0])
+
+    def test_short_history_is_filtered_out(self):
+        values, mask, dates = self.store.matrix(['AAPL', 'SOL-USD'], '2024-03-01')
+        metrics = screen(values, mask, ['AAPL', 'SOL-USD'], dates)
+        self.assertTrue(metrics['SMA_200'].isna().all())
+        self.assertTrue(select(metrics).empty)
+
+    def test_select_orders_by_sortino(self):
+        metrics = pd.DataFrame({
+            'sortino': [0.1, 0.3, 0.2, np.nan],
+            'SMA_50': [2, 2, 2, 2],
+            'SMA_200': [1, 1, 3, 1],
+            'RSI': [50, 60, 50, 50],
+        }, index=['A', 'B', 'C', 'D'])
+        self.assertEqual(list(select(metrics).index), ['B', 'A'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+import unittest
+
+import cvxpy as cp
+import numpy as np
+
+from solvers import MIP_SOLVERS, get_problem, risk_factor, solve_allocation, solve_rebalance
+
+
+class TestSolvers(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(7)
+        returns = rng.normal(0.001, 0.02, size=(500, 5))
+        self.mean_returns = returns.mean(axis=0)
+        self.cov_matrix = np.cov(returns, rowvar=False)
+        self.prices = np.array([120.0, 45.0, 310.0, 150.0, 2.5])
+        self.args = dict(n_stocks=3, budget=800.0, min_lot=10.0, risk_tolerance=0.05)
+
+    def check_constraints(self, result):
+        quantities = result.quantities
+        self.assertIsNotNone(quantities)
+        self.assertTrue((quantities >= 0).all())
+        np.testing.assert_allclose(quantities[:3], np.round(quantities[:3]))
+        values = quantities * self.prices
+        self.assertTrue(((values == 0) | (values >= self.args['min_lot'] - 1e-6)).all())
+        self.assertLessEqual(values.sum(), self.args['budget'] + 1e-4)
+        self.assertLessEqual(quantities @ self.cov_matrix @ quantities, self.args['risk_tolerance'] + 1e-4)
+
+    def test_risk_factor(self):
+        factor = risk_factor(self.cov_matrix)
+        np.testing.assert_allclose(factor.T @ factor, self.cov_matrix, atol=1e-12)
+
+    def test_heuristic(self):
+        result = solve_allocation(self.mean_returns, self.cov_matrix, self.prices, backend='heuristic', **self.args)
+        self.check_constraints(result)
+        self.assertGreaterEqual(result.bound, result.objective - 1e-9)
+        self.assertIsNotNone(result.gap)
+        self.assertAlmostEqual(result.leftover, self.args['budget'] - result.quantities @ self.prices, places=6)
+
+    def test_stock_only_leftover(self):
+        # Только целые акции: бюджет нельзя потратить ровно, остаток возвращается в результате
+        args = dict(self.args, n_stocks=3, budget=803.0)
+        result = solve_allocation(self.mean_returns[:3], self.cov_matrix[:3, :3], self.prices[:3], backend='auto', **args)
+        self.assertIsNotNone(result.quantities)
+        self.assertGreater(result.leftover, 0)
+        self.assertAlmostEqual(result.leftover, args['budget'] - result.quantities @ self.prices[:3], places=6)
+        self.assertEqual(result.to_dict()['leftover'], result.leftover)
+        if set(MIP_SOLVERS[:2]) & set(cp.installed_solvers()):
+            # Модель с бюджетом «не больше» решается точно, без отката на эвристику
+            self.assertTrue(result.optimal)
+
+    @unittest.skipUnless(set(MIP_SOLVERS[:2]) & set(cp.installed_solvers()), "нет Gurobi или SCIP")
+    def test_exact_reuses_problem(self):
+        problem = get_problem(3, 2)
+        first = solve_allocation(self.mean_returns, self.cov_matrix, self.prices, **self.args)
+        self.check_constraints(first)
+        np.testing.assert_allclose((first.quantities * self.prices).sum(), self.args['budget'], rtol=1e-6)
+
+        second = solve_allocation(self.mean_returns, self.cov_matrix, self.prices * 1.1, **self.args)
+        self.assertIs(get_problem(3, 2), problem)
+        self.assertEqual(second.timings['build'], 0.0)
+        self.assertTrue(second.optimal)
+        self.assertLessEqual(second.gap, first.gap + 1.0)
+
+    def test_rebalance(self):
+        holdings = np.array([2.0, 5.0, 0.0, 1.0, 40.0])
+        # Допустимый риск выше риска текущих позиций: продавать их не обязательно
+        args = dict(n_stocks=3, min_lot=10.0, risk_tolerance=1.0)
+        for backend in ['heuristic'] + (['auto'] if set(MIP_SOLVERS[:2]) & set(cp.installed_solvers()) else []):
+            # Без денег и с запретом покупок можно только держать или продавать
+            result = solve_rebalance(self.mean_returns, self.cov_matrix, self.prices, holdings=holdings, budget=0.0,
+                                     can_buy=[False] * 5, cost=0.001, backend=backend, **args)
+            self.assertTrue((result.quantities <= holdings + 1e-6).all())
+            # Большой штраф за оборот оставляет позиции как есть
+            result = solve_rebalance(self.mean_returns, self.cov_matrix, self.prices, holdings=holdings, budget=100.0,
+                                     cost=0.001, turnover_penalty=1.0, backend=backend, **args)
+            np.testing.assert_allclose(result.quantities, holdings, atol=1e-4)
+            result = solve_rebalance(self.mean_returns, self.cov_matrix, self.prices, holdings=holdings, budget=100.0,
+                                     cost=0.001, backend=backend, **args)
+            problem = get_problem(3, 2, rebalance=True)
+            traded, cost = problem.trades(result.quantities)
+            self.assertLessEqual(result.quantities @ self.prices, holdings @ self.prices + 100.0 - cost + 1e-4)
+            np.testing.assert_allclose(result.quantities[:3], np.round(result.quantities[:3]))
+
+    def test_rebalance_keeps_sub_lot_holdings(self):
+        # Минимальный лот относится к покупке: позиции дешевле лота не продаются, если купить нечего
+        holdings = np.array([1.0, 0.0, 2.5])
+        prices = np.array([100.0, 50.0, 2.0])
+        for backend in ['heuristic'] + (['auto'] if set(MIP_SOLVERS[:2]) & set(cp.installed_solvers()) else []):
+            result = solve_rebalance([0.002, 0.001, 0.003], np.diag([1e-4, 2e-4, 4e-4]), prices, n_stocks=2, holdings=holdings,
+                                     budget=0.0, min_lot=150.0, risk_tolerance=1.0, can_buy=[False] * 3, backend=backend)
+            np.testing.assert_allclose(result.quantities, holdings, atol=1e-6)
+            self.assertAlmostEqual(result.leftover, 0.0, places=6)
+
+    def test_rebalance_gap_uses_penalized_objective(self):
+        holdings = np.array([2.0, 5.0, 0.0, 1.0, 40.0])
+        for backend in ['heuristic'] + (['auto'] if set(MIP_SOLVERS[:2]) & set(cp.installed_solvers()) else []):
+            result = solve_rebalance(self.mean_returns, self.cov_matrix, self.prices, n_stocks=3, holdings=holdings,
+                                     budget=100.0, min_lot=10.0, risk_tolerance=1.0, turnover_penalty=1e-4,
+                                     backend=backend)
+            traded, _ = get_problem(3, 2, rebalance=True).trades(result.quantities)
+            self.assertAlmostEqual(result.objective, self.mean_returns @ result.quantities - 1e-4 * traded)
+            self.assertGreaterEqual(result.bound, result.objective - 1e-7)
+            self.assertLess(result.gap, 1.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+import os
+import threading
+import time
+import unittest
+
+import requests
+
+from sources import SourceRegistry, TickerSource, parse_coinmarketcap, parse_yahoo_table
+
+
+def read_fixture(name):
+    with open(os.path.join('fixtures', name), 'rb') as file:
+        return file.read()
+
+
+class FakeResponse:
+    def __init__(self, status_code, content=b''):
+        self.status_code = status_code
+        self.content = content
+
+
+class FakeSession:
+    """Отдаёт сохранённые HTML-страницы вместо сети."""
+
+    def __init__(self, pages, delay=0.0):
+        self.pages = pages
+        self.delay = delay
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def get(self, url, timeout=None):
+        with self.lock:
+            self.calls.append(url)
+        time.sleep(self.delay)
+        page = self.pages[url]
+        if isinstance(page, Exception):
+            raise page
+        return page
+
+
+class TestParsers(unittest.TestCase):
+
+    def test_parse_coinmarketcap(self):
+        tickers = parse_coinmarketcap(read_fixture('coinmarketcap_trending.html'))
+        self.assertEqual(tickers, ['SOL-USD', 'RNDR-USD', 'FLOKI-USD'])
+
+    def test_parse_yahoo_table(self):
+        tickers = parse_yahoo_table(read_fixture('yahoo_trending.html'))
+        self.assertEqual(tickers, ['AAPL', 'MSFT', 'BTC-USD'])
+
+    def test_parse_missing_table(self):
+        self.assertEqual(parse_yahoo_table(b'<html></html>'), [])
+        self.assertEqual(parse_coinmarketcap(b'<html></html>'), [])
+
+
+class TestSourceRegistry(unittest.TestCase):
+
+    def make_registry(self, pages, delay=0.0):
+        sources = [
+            TickerSource('cmc', 'https://cmc', parse_coinmarketcap, 'cmc', retries=1),
+            TickerSource('yahoo', 'https://yahoo', parse_yahoo_table, 'yahoo', retries=1),
+            TickerSource('broken', 'https://broken', parse_yahoo_table, 'broken', retries=1),
+        ]
+        session = FakeSession(pages, delay)
+        return SourceRegistry(sources, session=session), session
+
+    def test_broken_source_does_not_break_others(self):
+        registry, session = self.make_registry({
+            'https://cmc': FakeResponse(200, read_fixture('coinmarketcap_trending.html')),
+            'https://yahoo': FakeResponse(200, read_fixture('yahoo_trending.html')),
+            'https://broken': requests.ConnectionError('down'),
+        })
+        results = registry.fetch_all()
+        self.assertEqual(results['cmc'], ['SOL-USD', 'RNDR-USD', 'FLOKI-USD'])
+        self.assertEqual(results['yahoo'], ['AAPL', 'MSFT', 'BTC-USD'])
+        self.assertEqual(results['broken'], [])
+        self.assertEqual(session.calls.count('https://broken'), 2)
+
+    def test_sources_are_fetched_concurrently_and_cached(self):
+        registry, session = self.make_registry({
+            'https://cmc': FakeResponse(200, read_fixture('coinmarketcap_trending.html')),
+            'https://yahoo': FakeResponse(200, read_fixture('yahoo_trending.html')),
+            'https://broken': FakeResponse(404),
+        }, delay=0.2)
+        started = time.perf_counter()
+        registry.fetch_all()
+        self.assertLess(time.perf_counter() - started, 0.5)
+
+        registry.fetch_all(['cmc', 'yahoo'])
+        self.assertEqual(len(session.calls), 3)
+
+    def test_empty_result_is_not_cached(self):
+        registry, session = self.make_registry({
+            'https://yahoo': FakeResponse(200, b'<html></html>'),
+        })
+        self.assertEqual(registry.fetch('yahoo'), [])
+        session.pages['https://yahoo'] = FakeResponse(200, read_fixture('yahoo_trending.html'))
+        # Сбой разбора не скрывает источник до истечения TTL
+        self.assertEqual(registry.fetch('yahoo'), ['AAPL', 'MSFT', 'BTC-USD'])
+        self.assertEqual(registry.fetch('yahoo'), ['AAPL', 'MSFT', 'BTC-USD'])
+        self.assertEqual(len(session.calls), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import asyncio
+import csv
+import math
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from screening import rolling_sma, sortino_ratio, wilder_rsi
+from streaming import CSVReplayFeed, DownsideStats, SignalStream, TickerState
+
+
+class TestStreaming(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(5)
+        self.closes = 100 * np.exp(np.cumsum(rng.normal(0.0005, 0.02, 400)))
+        self.days = pd.bdate_range('2023-01-02', periods=len(self.closes))
+
+    def expected(self, closes):
+        row = np.asarray(closes, dtype=float)[None, :]
+        return {'SMA_50': rolling_sma(row, 50)[0, -1], 'SMA_200': rolling_sma(row, 200)[0, -1],
+                'RSI': wilder_rsi(row)[0, -1], 'sortino': sortino_ratio(row)[0]}
+
+    def assert_signals(self, signals, closes):
+        for name, value in self.expected(closes).items():
+            self.assertTrue(math.isclose(signals[name], value, rel_tol=1e-9, abs_tol=1e-9), (name, signals[name], value))
+
+    def test_incremental_matches_batch(self):
+        state = TickerState('AAA')
+        state.seed(self.closes[:300], self.days[299].date())
+        self.assert_signals(state.signals(), self.closes[:300])
+        for i in range(300, len(self.closes)):
+            day = self.days[i]
+            # Несколько котировок за день: сигналы считаются по предварительной цене
+            state.update(day + pd.Timedelta(hours=10), self.closes[i] * 0.99)
+            state.update(day + pd.Timedelta(hours=15), self.closes[i])
+            self.assertTrue(state.signals()['provisional'])
+            self.assert_signals(state.signals(), self.closes[:i + 1])
+        self.assertEqual(state.n_closes, len(self.closes) - 1)
+
+    def test_downside_window(self):
+        stats = DownsideStats(window=50)
+        returns = np.diff(self.closes) / self.closes[:-1]
+        for value in returns:
+            stats.push(value)
+        self.assertTrue(math.isclose(stats.ratio(), sortino_ratio(self.closes[None, -51:])[0], rel_tol=1e-9))
+        self.assertTrue(math.isclose(stats.ratio(0.01), sortino_ratio(np.append(self.closes[-50:], self.closes[-1] * 1.01)[None, :])[0],
+                                     rel_tol=1e-9))
+
+    def test_replay_feed_and_subscribers(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'quotes.csv')
+            with open(path, 'w', newline='') as file:
+                writer = csv.writer(file)
+                writer.writerow(['Timestamp', 'Ticker', 'Price'])
+                for i in range(300, 320):
+                    for ticker in ('AAA', 'BBB'):
+                        writer.writerow([(self.days[i] + pd.Timedelta(hours=12)).isoformat(), ticker, self.closes[i]])
+            stream = SignalStream()
+            stream.seed('AAA', self.closes[:300], self.days[299].date())
+            received = []
+
+            async def collect(signals):
+                received.append(signals)
+
+            stream.subscribe(collect)
+            stream.subscribe(lambda signals: None)
+            count = asyncio.run(stream.consume(CSVReplayFeed(path), {'AAA'}))
+        self.assertEqual(count, 20)
+        self.assertEqual({signals['ticker'] for signals in received}, {'AAA'})
+        self.assert_signals(received[-1], self.closes[:320])
+        self.assert_signals(stream.snapshot()['AAA'], self.closes[:320])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,44 @@
+import unittest
+
+import numpy as np
+
+from whatif import grid_to_frame, solve_grid
+
+
+class TestWhatIf(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(3)
+        returns = rng.normal(0.001, 0.02, size=(500, 4))
+        self.mean_returns = returns.mean(axis=0)
+        self.cov_matrix = np.cov(returns, rowvar=False)
+        self.prices = np.array([120.0, 45.0, 150.0, 2.5])
+        self.budgets = [400.0, 800.0, 1200.0]
+        self.risk_tolerances = [0.01, 0.02]
+
+    def test_grid_is_complete_and_tidy(self):
+        results = solve_grid(self.mean_returns, self.cov_matrix, self.prices, 2, self.budgets,
+                             self.risk_tolerances, min_lot=10.0, backend='heuristic')
+        self.assertEqual(sorted((budget, risk) for budget, risk, _ in results),
+                         sorted((budget, risk) for budget in self.budgets for risk in self.risk_tolerances))
+
+        frame = grid_to_frame(results, ['A', 'B', 'C-USD', 'D-USD'], self.prices, conversion_rate=470.0)
+        self.assertEqual(len(frame), len(self.budgets) * len(self.risk_tolerances) * 4)
+        self.assertEqual(sorted(frame['investment'].unique()), [budget * 470.0 for budget in self.budgets])
+        totals = frame.groupby(['risk_tolerance', 'investment'])['value_usd'].sum()
+        for (_, investment), total in totals.items():
+            self.assertLessEqual(total, investment / 470.0 + 1e-6)
+
+    def test_process_pool_matches_sequential(self):
+        args = (self.mean_returns, self.cov_matrix, self.prices, 2, self.budgets, self.risk_tolerances)
+        sequential = solve_grid(*args, min_lot=10.0, backend='heuristic')
+        parallel = solve_grid(*args, min_lot=10.0, backend='heuristic', processes=2)
+        key = lambda item: (item[0], item[1])
+        for (_, _, a), (_, _, b) in zip(sorted(sequential, key=key), sorted(parallel, key=key)):
+            self.assertEqual(a.status, b.status)
+            if a.quantities is not None:
+                np.testing.assert_allclose(a.quantities, b.quantities, rtol=1e-5, atol=1e-8)
+
+
+if __name__ == '__main__':
+    unittest.main()
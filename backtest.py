@@ -0,0 +1,320 @@
+import argparse
+import logging
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from covariance import CovarianceEngine
+from instrumentation import METRICS, run_session
+from screening import right_align, select
+from solvers import solve_allocation
+
+logger = logging.getLogger('finlogic.backtest')
+
+
+def rebalance_columns(dates, freq='M', start=None, end=None):
+    """Номера столбцов последних дней каждого периода freq ('W', 'M', 'Q') в пределах [start, end]."""
+    dates = pd.DatetimeIndex(dates)
+    periods = dates.to_period(freq)
+    last = np.flatnonzero(periods[1:] != periods[:-1])
+    columns = np.append(last, len(dates) - 1) if len(dates) else last
+    keep = np.ones(len(columns), dtype=bool)
+    if start is not None:
+        keep &= dates[columns] >= pd.Timestamp(start)
+    if end is not None:
+        keep &= dates[columns] <= pd.Timestamp(end)
+    return columns[keep]
+
+
+def _prefix(values):
+    """Кумулятивные суммы по строкам с нулевым столбцом в начале: окно (q, p] — P[p + 1] - P[q + 1]."""
+    return np.concatenate([np.zeros((values.shape[0], 1)), np.cumsum(values, axis=1)], axis=1)
+
+
+def rolling_screen(values, mask, tickers, dates, columns, lookback=365, sma_short=50, sma_long=200, rsi_window=14):
+    """
+    Метрики screening.screen на каждую дату ребалансировки сразу, без пересчёта окна:
+    наблюдения каждого тикера выравниваются вправо один раз, а Сортино, SMA и RSI по окну
+    [дата - lookback, дата] получаются разностями кумулятивных сумм и рекурсии Уайлдера.
+    :param values: Матрица цен (тикеры × дни) из PriceStore.matrix
+    :param mask: Маска реальных наблюдений
+    :param columns: Номера столбцов дат ребалансировки
+    :param lookback: Длина окна в календарных днях
+    :return: Список DataFrame (как у screen) по датам columns
+    """
+    dates = pd.DatetimeIndex(dates)
+    columns = np.asarray(columns)
+    n_days = values.shape[1]
+    observed = np.asarray(mask) & ~np.isnan(values)
+    aligned, n_obs = right_align(values, observed)
+    # Для каждого наблюдения — номер его столбца, чтобы знать дату первого наблюдения в окне
+    day_index, _ = right_align(np.broadcast_to(np.arange(n_days, dtype=float), values.shape), observed)
+
+    counts = _prefix(observed.astype(float))
+    starts = dates.searchsorted(dates[columns] - pd.Timedelta(days=lookback))
+    offset = (n_days - n_obs)[:, None]
+    before = counts[:, starts]
+    last = offset + counts[:, columns + 1] - 1   # Последнее наблюдение окна (позиция в aligned)
+    first = offset + before                       # Первое наблюдение окна
+    n_window = counts[:, columns + 1] - before
+    has = n_window > 0
+    last_i = np.clip(last, 0, n_days - 1).astype(int)
+    first_i = np.clip(first, 0, n_days - 1).astype(int)
+
+    def window_sum(prefix, lo, hi):
+        # Сумма элементов с позициями (lo, hi]
+        return np.take_along_axis(prefix, hi + 1, axis=1) - np.take_along_axis(prefix, lo + 1, axis=1)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        returns = aligned[:, 1:] / aligned[:, :-1] - 1
+    returns = np.concatenate([np.full((len(aligned), 1), np.nan), returns], axis=1)
+    valid = np.isfinite(returns)
+    returns = np.where(valid, returns, 0.0)
+    downside = np.minimum(returns, 0.0)
+
+    # Сортино по доходностям внутри окна (первое наблюдение окна доходности не даёт)
+    n_returns = window_sum(_prefix(valid.astype(float)), first_i, last_i)
+    n_down = window_sum(_prefix((downside < 0).astype(float)), first_i, last_i)
+    sum_down = window_sum(_prefix(downside), first_i, last_i)
+    squares = window_sum(_prefix(downside ** 2), first_i, last_i)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = window_sum(_prefix(returns), first_i, last_i) / n_returns
+        downside_std = np.sqrt(np.maximum(squares - sum_down ** 2 / n_down, 0.0) / (n_down - 1))
+        sortino = np.where(has & (n_down > 1) & (downside_std > 0), mean / downside_std, np.nan)
+
+    prices_prefix = _prefix(np.where(np.isnan(aligned), 0.0, aligned))
+
+    def sma(window):
+        total = window_sum(prices_prefix, np.clip(last_i - window, -1, None), last_i)
+        return np.where(n_window >= window, total / window, np.nan)
+
+    # RSI: EWM Уайлдера по всей истории, вклад дней до окна вычитается с весом (1 - alpha) ** (p - q)
+    alpha = 1.0 / rsi_window
+    diff = np.diff(aligned, axis=1, prepend=np.nan)
+    diff = np.where(np.isnan(diff), 0.0, diff)
+    up, down = np.maximum(diff, 0.0), np.maximum(-diff, 0.0)
+    ewm_up, ewm_down = np.zeros(aligned.shape), np.zeros(aligned.shape)
+    state_up, state_down = np.zeros(len(aligned)), np.zeros(len(aligned))
+    for t in range(n_days):
+        state_up = (1 - alpha) * state_up + alpha * up[:, t]
+        state_down = (1 - alpha) * state_down + alpha * down[:, t]
+        ewm_up[:, t], ewm_down[:, t] = state_up, state_down
+    decay = (1 - alpha) ** (last_i - first_i)
+    avg_up = np.take_along_axis(ewm_up, last_i, axis=1) - decay * np.take_along_axis(ewm_up, first_i, axis=1)
+    avg_down = np.take_along_axis(ewm_down, last_i, axis=1) - decay * np.take_along_axis(ewm_down, first_i, axis=1)
+    avg_down = np.where(np.abs(avg_down) < 1e-12, 0.0, avg_down)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rsi = np.where(avg_down == 0, 100.0, 100.0 - 100.0 / (1.0 + avg_up / avg_down))
+    rsi = np.where(n_window >= rsi_window, rsi, np.nan)
+
+    first_day = np.take_along_axis(day_index, first_i, axis=1)
+    sma_short_values, sma_long_values = sma(sma_short), sma(sma_long)
+    frames = []
+    for k in range(len(columns)):
+        first_date = pd.Series(dates[np.nan_to_num(first_day[:, k]).astype(int)], index=tickers)
+        frames.append(pd.DataFrame({
+            'n_obs': n_window[:, k].astype(int),
+            'sortino': sortino[:, k],
+            f'SMA_{sma_short}': sma_short_values[:, k],
+            f'SMA_{sma_long}': sma_long_values[:, k],
+            'RSI': rsi[:, k],
+            'first_date': first_date.where(has[:, k]),
+        }, index=tickers))
+    return frames
+
+
+def _window_inputs(returns, rows, first, last, cov_method):
+    """Средние доходности и ковариация по столбцам [first, last) строк rows матрицы доходностей."""
+    window = pd.DataFrame(np.asarray(returns[rows, first:last], dtype=np.float64).T)
+    engine = CovarianceEngine.from_returns(window)
+    return engine.mean(), engine.estimate(cov_method)
+
+
+def _solve_dates(tasks, backend, features=None, cov_method='sample'):
+    results = []
+    for inputs, prices, n_stocks, budget, min_lot, risk_tolerance in tasks:
+        if features is not None:
+            # В задаче только номера строк и столбцов: окно читается из индекса, подключённого по пути
+            inputs = _window_inputs(features['returns'], *inputs, cov_method)
+        mean_returns, cov_matrix = inputs
+        results.append(solve_allocation(mean_returns, cov_matrix, prices, n_stocks, budget, min_lot,
+                                        risk_tolerance, backend=backend, with_bound=False))
+    return results
+
+
+class BacktestResult:
+    """
+    Результат бэктеста.
+    equity — по дням: стоимость в $ и в местной валюте, просадка;
+    rebalances — по датам ребалансировки: выбранные тикеры, статус решения, бюджет и оборот.
+    """
+
+    def __init__(self, equity, rebalances, holdings):
+        self.equity = equity
+        self.rebalances = rebalances
+        self.holdings = holdings
+
+    def summary(self):
+        equity = self.equity['equity_local']
+        if equity.empty:
+            return {}
+        years = max((equity.index[-1] - equity.index[0]).days / 365.25, 1e-9)
+        solved = self.rebalances[self.rebalances['solver'].notna()]
+        total = equity.iloc[-1] / equity.iloc[0] - 1
+        return {
+            'start': equity.index[0].strftime('%Y-%m-%d'),
+            'end': equity.index[-1].strftime('%Y-%m-%d'),
+            'total_return': float(total),
+            'cagr': float((1 + total) ** (1 / years) - 1),
+            'max_drawdown': float(self.equity['drawdown'].min()),
+            'mean_turnover': float(self.rebalances['turnover'].mean()),
+            'rebalances': len(self.rebalances),
+            # Доли ребалансировок, решённых эвристикой (при backend='auto' — откат с точных решателей)
+            # и оставшихся без решения (весь бюджет в кэше)
+            'fallback_share': float((solved['solver'] == 'heuristic').mean()) if len(solved) else 0.0,
+            'failed_share': float((~solved['status'].isin(['heuristic', 'optimal', 'optimal_inaccurate'])).mean())
+            if len(solved) else 0.0,
+        }
+
+
+def run_backtest(values, mask, dates, tickers, investment, rates=1.0, lookback=365, freq='M', start=None, end=None,
+                 risk_tolerance=0.02, min_lot=5000, cov_method='sample', backend='auto', processes=None,
+                 features=None):
+    """
+    Бэктест правил get_top_4_by_sortino и оптимизатора: на каждую дату ребалансировки
+    все тикеры, прошедшие screening.select по окну lookback, получают распределение
+    суммы investment (в местной валюте) через solve_allocation, как в Pipeline, и держатся
+    до следующей даты. Доступность активов (check_asset_availability) не проверяется.
+    :param values: Матрица цен (тикеры × дни) из PriceStore.matrix
+    :param rates: Курс местной валюты за $ — число или pd.Series по датам (исторический курс)
+    :param processes: Число процессов для решения задач по датам
+    :param features: features.FeatureIndex того же хранилища: доходности не пересчитываются, а окна
+        ковариации читают сами рабочие процессы
+    :return: BacktestResult
+    """
+    dates = pd.DatetimeIndex(dates)
+    tickers = list(tickers)
+    if start is None:
+        start = dates[0] + pd.Timedelta(days=lookback)
+    if end is None and np.asarray(mask).any():
+        end = dates[np.flatnonzero(np.asarray(mask).any(axis=0))[-1]]  # Хвост календаря без котировок
+    columns = rebalance_columns(dates, freq, start, end)
+    if isinstance(rates, pd.Series):
+        rates = rates.sort_index().reindex(rates.index.union(dates)).ffill().bfill().reindex(dates)
+    else:
+        rates = pd.Series(float(rates), index=dates)
+
+    with METRICS.timer('backtest_seconds', phase='screen'):
+        frames = rolling_screen(values, mask, tickers, dates, columns, lookback)
+    prices = pd.DataFrame(np.where(mask, values, np.nan).T, index=dates).ffill().values.T
+    if features is None:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            daily_returns = values[:, 1:] / values[:, :-1] - 1
+        daily_returns[~np.isfinite(daily_returns)] = 0.0  # Как в covariance.store_returns
+    else:
+        # Столбец j + 1 индекса — доходность дня j -> j + 1 календаря dates
+        shift = features.column(dates[0]) + 1
+
+    tasks, picks = [], []
+    for column, metrics in zip(columns, frames):
+        window_start = dates[dates.searchsorted(dates[column] - pd.Timedelta(days=lookback))]
+        ranked = list(select(metrics, window_start).index)
+        # Как в Pipeline._load: все отобранные тикеры, сначала акции, затем криптовалюты
+        stocks = [ticker for ticker in ranked if not ticker.endswith('-USD')]
+        ordered = stocks + [ticker for ticker in ranked if ticker.endswith('-USD')]
+        if not ordered:
+            picks.append(([], []))
+            continue
+        rows = [tickers.index(ticker) for ticker in ordered]
+        first = dates.searchsorted(window_start)
+        if features is None:
+            inputs = _window_inputs(daily_returns, rows, first, column, cov_method)
+        else:
+            inputs = (features.rows(ordered), first + shift, column + shift)
+        rate = rates.iloc[column]
+        tasks.append((inputs, prices[rows, column], len(stocks), investment / rate, min_lot / rate, risk_tolerance))
+        picks.append((ordered, rows))
+
+    with METRICS.timer('backtest_seconds', phase='solve'):
+        if processes and processes > 1 and len(tasks) > 1:
+            chunks = [tasks[i::processes] for i in range(processes)]
+            with ProcessPoolExecutor(max_workers=processes) as pool:
+                solved = list(pool.map(_solve_dates, chunks, [backend] * len(chunks), [features] * len(chunks),
+                                       [cov_method] * len(chunks)))
+            results = [None] * len(tasks)
+            for i, chunk in enumerate(solved):
+                results[i::processes] = chunk
+        else:
+            results = _solve_dates(tasks, backend, features, cov_method)
+
+    # Каждый период — доходность портфеля, купленного на фиксированную сумму; капитал наращивается по ним
+    growth = np.full(len(dates), np.nan)
+    equity_level, previous = 1.0, None
+    records, holdings = [], []
+    results = iter(results)
+    for k, (column, (ordered, rows)) in enumerate(zip(columns, picks)):
+        end_column = columns[k + 1] if k + 1 < len(columns) else len(dates) - 1
+        result = next(results) if ordered else None
+        budget = investment / rates.iloc[column]
+        quantities = np.zeros(len(ordered))
+        if result is not None and result.quantities is not None:
+            quantities = np.asarray(result.quantities, dtype=float)
+        period_prices = prices[rows, column:end_column + 1] if ordered else np.zeros((0, end_column - column + 1))
+        spent = float(quantities @ period_prices[:, 0]) if ordered else 0.0
+        value = budget - spent + quantities @ period_prices
+        weights = dict(zip(ordered, quantities * period_prices[:, 0] / budget))
+        weights['cash'] = (budget - spent) / budget
+        if previous is None:
+            turnover = 1.0 - weights['cash']
+        else:
+            keys = set(weights) | set(previous)
+            turnover = 0.5 * sum(abs(weights.get(key, 0.0) - previous.get(key, 0.0)) for key in keys)
+        growth[column:end_column + 1] = equity_level * value / budget
+        equity_level = growth[end_column]
+        # Веса к концу периода с учётом изменения цен — база для оборота следующей ребалансировки
+        previous = dict(zip(ordered, quantities * period_prices[:, -1] / value[-1]))
+        previous['cash'] = (budget - spent) / value[-1]
+        records.append({'date': dates[column], 'tickers': ordered, 'status': result.status if result else None,
+                        'solver': result.solver if result else None, 'budget_usd': budget, 'turnover': turnover})
+        holdings += [{'date': dates[column], 'ticker': ticker, 'quantity': quantity, 'price': price}
+                     for ticker, quantity, price in zip(ordered, quantities, period_prices[:, 0]) if quantity > 0]
+
+    index = dates[columns[0]:] if len(columns) else dates[:0]
+    growth = growth[len(dates) - len(index):]
+    start_rate = rates.iloc[columns[0]] if len(columns) else 1.0
+    equity = pd.DataFrame({'equity_usd': growth * investment / start_rate}, index=index)
+    equity['equity_local'] = equity['equity_usd'] * rates.reindex(index).values
+    equity['drawdown'] = equity['equity_local'] / equity['equity_local'].cummax() - 1
+    rebalances = pd.DataFrame(records, columns=['date', 'tickers', 'status', 'solver', 'budget_usd', 'turnover'])
+    return BacktestResult(equity, rebalances.set_index('date'), pd.DataFrame(holdings, columns=['date', 'ticker', 'quantity', 'price']))
+
+
+def main(argv=None):
+    from FinLogic import FinLogic, common_arguments
+
+    parser = argparse.ArgumentParser(description="Бэктест отбора по Сортино/SMA/RSI с оптимизацией распределения",
+                                     parents=[common_arguments()])
+    parser.add_argument('investment', nargs='?', type=float, default=355800, help="Сумма инвестиций на каждую ребалансировку")
+    parser.add_argument('--start', help="Первая дата ребалансировки (по умолчанию — начало данных + lookback)")
+    parser.add_argument('--end', help="Последняя дата")
+    parser.add_argument('--lookback', type=int, default=365, help="Окно метрик в календарных днях")
+    parser.add_argument('--freq', default='M', help="Частота ребалансировки: W, M или Q")
+    parser.add_argument('--risk-tolerance', type=float, default=0.02)
+    parser.add_argument('--processes', type=int, default=None, help="Число процессов для решения задач по датам")
+    parser.add_argument('--output', metavar='PATH', help="Сохранить кривую капитала в CSV")
+    args = parser.parse_args(argv)
+
+    with run_session(args.log_level, args.metrics, args.profile), FinLogic.from_args(args) as fin_logic:
+        result = fin_logic.backtest(
+            args.investment, start=args.start, end=args.end, lookback=args.lookback, freq=args.freq,
+            risk_tolerance=args.risk_tolerance, processes=args.processes)
+        for key, value in result.summary().items():
+            logger.info(f"{key}: {value}")
+        if args.output:
+            result.equity.to_csv(args.output)
+        return result
+
+
+if __name__ == '__main__':
+    main()
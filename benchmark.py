@@ -0,0 +1,226 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import tempfile
+import time
+from datetime import datetime
+
+from instrumentation import configure_logging, logger
+
+STAGES = ['load', 'screen', 'features', 'screen_features', 'covariance', 'solve']
+RESULTS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_results.json')
+
+# Параметры задачи как в optimize_portfolio при курсе 470 тенге за доллар
+CONVERSION_RATE = 470.0
+INVESTMENT = 355800
+RISK_TOLERANCE = 0.02
+
+
+def synthetic_universe(n_tickers, start='2021-07-16', end='2024-07-16', crypto_share=0.1, seed=0):
+    """
+    Синтетическая вселенная: геометрическое случайное блуждание для каждого тикера.
+    Акции торгуются по будним дням, криптовалюты (суффикс -USD) — ежедневно;
+    примерно у десятой части тикеров история начинается позже начала окна.
+    :return: (DataFrame цен даты × тикеры, словарь фундаментальных данных для поставщика)
+    """
+    import numpy as np
+    import pandas as pd
+
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range(start, end, freq='D')
+    n_crypto = int(round(n_tickers * crypto_share))
+    tickers = [f'S{i:05d}' for i in range(n_tickers - n_crypto)] + [f'C{i:05d}-USD' for i in range(n_crypto)]
+    is_crypto = np.array([ticker.endswith('-USD') for ticker in tickers])
+
+    volatility = np.where(is_crypto, rng.uniform(0.03, 0.06, n_tickers), rng.uniform(0.01, 0.03, n_tickers))
+    drift = rng.normal(0.0004, 0.001, n_tickers)
+    shocks = rng.standard_normal((len(dates), n_tickers)) * volatility + drift - volatility ** 2 / 2
+    prices = rng.uniform(5, 300, n_tickers) * np.exp(np.cumsum(shocks, axis=0))
+
+    weekend = dates.dayofweek >= 5
+    prices[np.ix_(weekend, ~is_crypto)] = np.nan
+    late = rng.random(n_tickers) < 0.1
+    listing = rng.integers(0, len(dates) // 2, n_tickers)
+    for column in np.flatnonzero(late):
+        prices[:listing[column], column] = np.nan
+
+    frame = pd.DataFrame(prices, index=dates, columns=tickers)
+    fundamentals = {ticker: {'marketCap': float(cap), 'volume': float(volume)}
+                    for ticker, cap, volume in zip(tickers, 10 ** rng.uniform(8, 12, n_tickers),
+                                                   10 ** rng.uniform(5, 8, n_tickers))}
+    return frame, fundamentals
+
+
+def bundled_fundamentals(data_dir='data'):
+    """Фундаментальные данные для тикеров из data/*.csv, проходящие фильтры filter_tickers."""
+    tickers = sorted(name[:-4] for name in os.listdir(data_dir) if name.endswith('.csv'))
+    return {ticker: {'marketCap': 1e11, 'volume': 1e7} for ticker in tickers}
+
+
+def run_universe(provider, tickers, start, end, workdir, backend='auto', cov_size=100, n_assets=4, batch_size=50):
+    """
+    Прогон этапов на одной вселенной.
+    :return: Словарь {этап: секунды} и число отобранных тикеров
+    """
+    import numpy as np
+
+    from covariance import CovarianceService
+    from features import open_features, screen_features
+    from price_store import PriceStore
+    from providers import fetch_batches
+    from screening import screen, select
+    from solvers import _problems, solve_allocation
+
+    timings = {}
+    begin = time.perf_counter()
+    store = PriceStore(os.path.join(workdir, 'store'))
+    store.ensure_range(start, end)
+    fetched = fetch_batches(lambda batch: provider.download(batch, start=start, end=end), tickers, batch_size)
+    for ticker, series in fetched.items():
+        store.write(ticker, series)
+    store.commit()
+    timings['load'] = time.perf_counter() - begin
+
+    begin = time.perf_counter()
+    candidates = [ticker for ticker in tickers if ticker in store]
+    values, mask, dates = store.matrix(candidates, start)
+    metrics = screen(values, mask, candidates, dates)
+    selected = select(metrics, start)
+    timings['screen'] = time.perf_counter() - begin
+
+    # Тот же отбор по индексу признаков: сборка индекса (раз в день) и чтение метрик из него
+    begin = time.perf_counter()
+    index = open_features(store, os.path.join(workdir, 'features'))
+    timings['features'] = time.perf_counter() - begin
+    begin = time.perf_counter()
+    select(screen_features(index, candidates, start), start)
+    timings['screen_features'] = time.perf_counter() - begin
+
+    ranked = list(selected.index) + list(metrics.drop(selected.index).sort_values('sortino', ascending=False).index)
+    begin = time.perf_counter()
+    service = CovarianceService(store)
+    for method in ('sample', 'ledoit_wolf'):
+        service.get(ranked[:cov_size], start, end, method=method)
+    timings['covariance'] = time.perf_counter() - begin
+
+    # Как в исходном отборе: лучшие акции и одна криптовалюта (дробная позиция закрывает бюджет)
+    stocks = [ticker for ticker in ranked if not ticker.endswith('-USD')][:n_assets - 1]
+    ordered = stocks + [ticker for ticker in ranked if ticker.endswith('-USD')][:1]
+    mean_returns, cov_matrix = service.get(ordered, start, end)
+    prices = np.array([store.frame(ticker, start, end)['Close'].iloc[-1] for ticker in ordered])
+    _problems.clear()  # Время построения модели входит в замер
+    begin = time.perf_counter()
+    solve_allocation(mean_returns, cov_matrix, prices, len(stocks), budget=INVESTMENT / CONVERSION_RATE,
+                     min_lot=5000 / CONVERSION_RATE, risk_tolerance=RISK_TOLERANCE, backend=backend)
+    timings['solve'] = time.perf_counter() - begin
+    return timings, len(selected)
+
+
+def run_benchmarks(sizes=(100, 1000, 10000), repeat=3, backend='auto', include_bundled=True, data_dir='data'):
+    """
+    Прогоняет все вселенные repeat раз и берёт минимальное время каждого этапа.
+    :return: {вселенная: {этап: секунды}}
+    """
+    from providers import CSVProvider, FrameProvider
+
+    universes = []
+    if include_bundled:
+        provider = CSVProvider(data_dir, bundled_fundamentals(data_dir))
+        universes.append(('bundled', lambda: (provider, sorted(provider.fundamentals)), '2021-07-12', '2024-07-11'))
+    for size in sizes:
+        def make(size=size):
+            prices, fundamentals = synthetic_universe(size)
+            return FrameProvider(prices, fundamentals), list(prices.columns)
+        universes.append((f'synthetic-{size}', make, '2021-07-16', '2024-07-16'))
+
+    results = {}
+    for name, make, start, end in universes:
+        provider, tickers = make()
+        best = {}
+        for _ in range(repeat):
+            workdir = tempfile.mkdtemp(prefix='finlogic-bench-')
+            try:
+                timings, n_selected = run_universe(provider, tickers, start, end, workdir, backend=backend)
+            finally:
+                shutil.rmtree(workdir, ignore_errors=True)
+            for stage, seconds in timings.items():
+                best[stage] = min(best.get(stage, seconds), seconds)
+        results[name] = best
+        logger.info(f"{name}: {len(tickers)} тикеров, отобрано {n_selected}; "
+                    + ", ".join(f"{stage} {best[stage]:.3f}s" for stage in STAGES))
+    return results
+
+
+def compare(current, baseline, tolerance=0.25, min_seconds=0.05):
+    """
+    Сравнивает замеры с базовыми. Регрессия — этап медленнее базового больше чем на
+    tolerance и больше чем на min_seconds (чтобы не реагировать на шум коротких этапов).
+    :return: Список строк с описанием регрессий
+    """
+    regressions = []
+    for universe, stages in current.items():
+        for stage, seconds in stages.items():
+            before = baseline.get(universe, {}).get(stage)
+            if before is None:
+                continue
+            if seconds > before * (1 + tolerance) and seconds - before > min_seconds:
+                regressions.append(f"{universe}/{stage}: {before:.3f}s -> {seconds:.3f}s (+{seconds / before - 1:.0%})")
+    return regressions
+
+
+def load_results(path=RESULTS_FILE):
+    if not os.path.exists(path):
+        return {'runs': []}
+    with open(path, 'r') as file:
+        return json.load(file)
+
+
+def save_results(history, path=RESULTS_FILE):
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w') as file:
+        json.dump(history, file, indent=2)
+    os.replace(tmp_path, path)
+
+
+def current_label():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return datetime.now().strftime('%Y%m%d%H%M%S')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Офлайн-бенчмарк этапов FinLogic на синтетических вселенных")
+    parser.add_argument('--sizes', nargs='*', type=int, default=[100, 1000, 10000], help="Размеры синтетических вселенных")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--solver', default='auto', help="'auto', 'heuristic' или имя решателя cvxpy")
+    parser.add_argument('--no-bundled', action='store_true', help="Не прогонять вселенную из data/*.csv")
+    parser.add_argument('--output', default=RESULTS_FILE, help="Файл истории замеров (локальный для машины, в git не хранится)")
+    parser.add_argument('--label', default=None, help="Метка прогона (по умолчанию — хэш коммита)")
+    parser.add_argument('--baseline', default=None, help="Метка базового прогона (по умолчанию — последний сохранённый)")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="Допустимое относительное замедление")
+    parser.add_argument('--no-save', action='store_true', help="Только сравнить, не сохранять прогон")
+    args = parser.parse_args(argv)
+    configure_logging('INFO')
+
+    results = run_benchmarks(args.sizes, args.repeat, args.solver, not args.no_bundled)
+    history = load_results(args.output)
+    runs = [run for run in history['runs'] if args.baseline is None or run['label'] == args.baseline]
+    regressions = compare(results, runs[-1]['results'], args.tolerance) if runs else []
+    if runs:
+        logger.info(f"Сравнение с прогоном {runs[-1]['label']}: "
+                    + ("регрессий нет" if not regressions else "; ".join(regressions)))
+    if not args.no_save:
+        history['runs'].append({'label': args.label or current_label(), 'date': datetime.now().isoformat(timespec='seconds'),
+                                'python': platform.python_version(), 'machine': platform.machine(),
+                                'solver': args.solver, 'results': results})
+        save_results(history, args.output)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
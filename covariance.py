@@ -0,0 +1,214 @@
+import hashlib
+import os
+
+import numpy as np
+import pandas as pd
+
+from features import store_signature
+from instrumentation import METRICS
+
+
+class CovarianceEngine:
+    """
+    Оценки ковариации по выровненной матрице доходностей (дни × тикеры).
+
+    Хранит достаточные статистики окна (суммы x, x², xx', x²x и x²x²), поэтому
+    добавление нового дня и удаление старого стоят O(p²), а выборочная оценка и
+    оценка Ледуа-Вольфа считаются без прохода по всему окну. EWMA обновляется
+    рекурсивно по мере добавления дней.
+    """
+
+    def __init__(self, tickers, ewma_span=180):
+        self.tickers = list(tickers)
+        p = len(self.tickers)
+        self.n = 0
+        self.s1 = np.zeros(p)
+        self.s2 = np.zeros(p)
+        self.s11 = np.zeros((p, p))
+        self.s21 = np.zeros((p, p))
+        self.s22 = np.zeros((p, p))
+        self.rows = []
+        self.dates = []
+        self.ewma_alpha = 2.0 / (ewma_span + 1)
+        self.ewma_mean = None
+        self.ewma_cov = np.zeros((p, p))
+
+    @classmethod
+    def from_returns(cls, returns, **kwargs):
+        engine = cls(returns.columns, **kwargs)
+        engine.append(returns.values, returns.index)
+        return engine
+
+    @property
+    def last_date(self):
+        return self.dates[-1] if self.dates else None
+
+    def _accumulate(self, rows, sign):
+        squares = rows ** 2
+        self.n += sign * len(rows)
+        self.s1 += sign * rows.sum(axis=0)
+        self.s2 += sign * squares.sum(axis=0)
+        self.s11 += sign * rows.T @ rows
+        self.s21 += sign * squares.T @ rows
+        self.s22 += sign * squares.T @ squares
+
+    def append(self, rows, dates):
+        """Добавляет новые дни доходностей (обновление статистик без пересчёта окна)."""
+        rows = np.atleast_2d(np.asarray(rows, dtype=float))
+        if not len(rows):
+            return
+        self._accumulate(rows, +1)
+        self.rows.extend(rows)
+        self.dates.extend(pd.DatetimeIndex(dates))
+        for row in rows:
+            if self.ewma_mean is None:
+                self.ewma_mean = row.copy()
+                continue
+            deviation = row - self.ewma_mean
+            self.ewma_mean += self.ewma_alpha * deviation
+            self.ewma_cov = (1 - self.ewma_alpha) * (self.ewma_cov + self.ewma_alpha * np.outer(deviation, deviation))
+
+    def drop_before(self, start):
+        """Удаляет из окна дни раньше start."""
+        start = pd.Timestamp(start)
+        count = 0
+        while count < len(self.dates) and self.dates[count] < start:
+            count += 1
+        if count:
+            self._accumulate(np.array(self.rows[:count]), -1)
+            del self.rows[:count]
+            del self.dates[:count]
+
+    def mean(self):
+        return self.s1 / self.n
+
+    def sample(self, ddof=1):
+        """Выборочная ковариация (как DataFrame.cov при ddof=1)."""
+        mean = self.mean()
+        return (self.s11 - self.n * np.outer(mean, mean)) / (self.n - ddof)
+
+    def ledoit_wolf(self):
+        """
+        Сжатие Ледуа-Вольфа к масштабированной единичной матрице, как sklearn.covariance.ledoit_wolf
+        (его использует pypfopt.risk_models.CovarianceShrinkage), но из накопленных статистик.
+        :return: (ковариация, коэффициент сжатия)
+        """
+        n, p = self.n, len(self.tickers)
+        m = self.mean()
+        emp_cov = self.sample(ddof=0)
+        emp_trace = np.diag(emp_cov)
+        mu = emp_trace.sum() / p
+
+        # Сумма по дням (x_i - m_i)²(x_j - m_j)² через центральные моменты до четвёртого порядка
+        a, b = m[:, None], m[None, :]
+        centered22 = (self.s22 - 2 * b * self.s21 - 2 * a * self.s21.T + 4 * a * b * self.s11
+                      + b ** 2 * self.s2[:, None] + a ** 2 * self.s2[None, :]
+                      - 2 * a * b ** 2 * self.s1[:, None] - 2 * a ** 2 * b * self.s1[None, :]
+                      + n * a ** 2 * b ** 2)
+        delta_ = np.sum(emp_cov ** 2)
+        beta_ = np.sum(centered22)
+        beta = (beta_ / n - delta_) / (p * n)
+        delta = (delta_ - 2 * mu * emp_trace.sum() + p * mu ** 2) / p
+        beta = min(beta, delta)
+        shrinkage = 0.0 if beta == 0 else beta / delta
+        return (1 - shrinkage) * emp_cov + shrinkage * mu * np.eye(p), shrinkage
+
+    def ewma(self):
+        """Экспоненциально взвешенная ковариация (рекурсия RiskMetrics с EWMA-средним)."""
+        return self.ewma_cov.copy()
+
+    def estimate(self, method='sample'):
+        if method == 'sample':
+            return self.sample()
+        if method == 'ledoit_wolf':
+            return self.ledoit_wolf()[0]
+        if method == 'ewma':
+            return self.ewma()
+        raise ValueError(f"Неизвестный метод оценки ковариации: {method}")
+
+
+def store_returns(store, tickers, start=None, end=None):
+    """Дневные доходности выровненной матрицы хранилища (дни × тикеры)."""
+    values, _, dates = store.matrix(tickers, start, end)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        returns = values[:, 1:] / values[:, :-1] - 1
+    # Нулевые цены в исходных данных (например, FLOKI-USD) дают бесконечную доходность
+    returns[~np.isfinite(returns)] = 0.0
+    return pd.DataFrame(returns.T, index=dates[1:], columns=list(tickers))
+
+
+class CovarianceService:
+    """
+    Кэш оценок ковариации по набору тикеров, дате и версии хранилища (features.store_signature).
+    Для каждого набора тикеров держит CovarianceEngine и при сдвиге окна только дописывает
+    новые дни. Дописывание новых дней в хранилище движок переживает; если переписаны дни,
+    уже вошедшие в движок (PriceStore.rewritten_since), он строится заново.
+    features — функция, возвращающая актуальный features.FeatureIndex: тогда доходности
+    читаются из предрасчитанного индекса, а не пересчитываются по ценам.
+    """
+
+    def __init__(self, store, cache_dir=None, features=None):
+        self.store = store
+        self.cache_dir = cache_dir
+        self.features = features
+        self.engines = {}
+        self.synced = {}  # Версия хранилища, по которой движок набора тикеров получил последние дни
+        self.results = {}
+        self.signature = None
+
+    def _cache_path(self, key):
+        digest = hashlib.md5(','.join(key[0]).encode()).hexdigest()[:16]
+        name = f"{digest}-{key[1]}-{key[2]}-{key[3]}-{key[4]}.npz"
+        return os.path.join(self.cache_dir, name)
+
+    def returns(self, tickers, start, end):
+        if self.features is not None:
+            return self.features().returns_frame(tickers, start, end)
+        return store_returns(self.store, tickers, start, end)
+
+    def get(self, tickers, start, end, method='sample'):
+        """
+        :return: (средние доходности, ковариация) по окну [start, end]
+        """
+        tickers = tuple(tickers)
+        start, end = pd.Timestamp(start).normalize(), pd.Timestamp(end).normalize()
+        signature = store_signature(self.store)
+        if signature != self.signature:
+            # Хранилище изменилось: результаты устарели, движки проверяются при обращении
+            self.results, self.signature = {}, signature
+        key = (tickers, method, start.strftime('%Y%m%d'), end.strftime('%Y%m%d'), signature)
+        if key in self.results:
+            METRICS.cache('covariance', True)
+            return self.results[key]
+        if self.cache_dir and os.path.exists(self._cache_path(key)):
+            with np.load(self._cache_path(key)) as data:
+                if list(data['tickers']) == list(tickers):
+                    METRICS.cache('covariance', True)
+                    self.results[key] = (data['mean'], data['cov'])
+                    return self.results[key]
+        METRICS.cache('covariance', False)
+
+        engine = self.engines.get(tickers)
+        if engine is not None and engine.last_date is not None and self.synced[tickers] != self.store.revision:
+            rewritten = self.store.rewritten_since(self.synced[tickers])
+            if rewritten is not None and rewritten <= engine.last_date:
+                engine = None
+        if (engine is None or engine.last_date is None or engine.last_date > end
+                or engine.dates[0] > start + pd.Timedelta(days=1)):
+            engine = CovarianceEngine.from_returns(self.returns(tickers, start, end))
+            self.engines[tickers] = engine
+        else:
+            # Инкрементально: только новые дни после последней даты окна
+            first_new = engine.last_date + pd.Timedelta(days=1)
+            if first_new <= end:
+                new_returns = self.returns(tickers, engine.last_date, end)
+                engine.append(new_returns.values, new_returns.index)
+            engine.drop_before(start + pd.Timedelta(days=1))
+        self.synced[tickers] = self.store.revision
+
+        result = (engine.mean(), engine.estimate(method))
+        self.results[key] = result
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            np.savez(self._cache_path(key), tickers=np.array(tickers), mean=result[0], cov=result[1])
+        return result
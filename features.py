@@ -0,0 +1,238 @@
+import hashlib
+import json
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import METRICS
+from screening import right_align, rolling_sma, wilder_rsi
+
+# Индексы, уже открытые в этом процессе (рабочие процессы подключаются по пути один раз)
+_ATTACHED = {}
+
+
+def compute_features(values, mask, sma_windows=(50, 200), rsi_window=14):
+    """
+    Признаки по выровненной матрице хранилища (тикеры × дни).
+    returns — доходность к предыдущему дню календаря (как covariance.store_returns, первый столбец 0),
+    log_returns и downside — её логарифм и отрицательная часть; SMA_* и RSI — значения по
+    всей истории наблюдений на дату столбца (между наблюдениями держится последнее значение).
+    :return: dict имя → матрица float64
+    """
+    values = np.asarray(values, dtype=np.float64)
+    observed = np.asarray(mask) & ~np.isnan(values)
+    n_days = values.shape[1]
+    returns = np.zeros(values.shape)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        returns[:, 1:] = values[:, 1:] / values[:, :-1] - 1
+        returns[~np.isfinite(returns)] = 0.0
+        log_returns = np.log1p(returns)
+    log_returns[~np.isfinite(log_returns)] = 0.0
+    features = {'returns': returns, 'log_returns': log_returns, 'downside': np.minimum(returns, 0.0)}
+
+    # Позиция последнего наблюдения на каждую дату в выровненной вправо строке
+    aligned, n_obs = right_align(values, observed)
+    counts = np.cumsum(observed, axis=1)
+    position = np.clip((n_days - n_obs)[:, None] + counts - 1, 0, max(n_days - 1, 0))
+
+    def as_of(series):
+        return np.where(counts > 0, np.take_along_axis(series, position, axis=1), np.nan)
+
+    for window in sma_windows:
+        features[f'SMA_{window}'] = as_of(rolling_sma(aligned, window))
+    features['RSI'] = as_of(wilder_rsi(aligned, rsi_window))
+    return features
+
+
+def store_signature(store):
+    """Отпечаток содержимого хранилища: меняется при любой записи (новые тикеры, дни или правка цен)."""
+    meta = store.meta or {}
+    key = json.dumps({name: meta.get(name) for name in ('generation', 'revision', 'start', 'n_days', 'tickers', 'last_date')},
+                     sort_keys=True)
+    return hashlib.md5(key.encode()).hexdigest()[:12]
+
+
+class FeatureIndex:
+    """
+    Компактный индекс предрасчитанных признаков: матрицы float32 (тикеры × дни) на календаре
+    PriceStore в файлах .npy и meta.json с тикерами и календарём. Доходности хранятся в float64:
+    по ним считается ковариация для решателя, и они совпадают с covariance.store_returns.
+    Открывается только для чтения через np.memmap, поэтому процессы делят страницы файла,
+    а при передаче в ProcessPoolExecutor сериализуется только путь к каталогу.
+    """
+
+    META_FILE = 'meta.json'
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, self.META_FILE), 'r') as file:
+            self.meta = json.load(file)
+        self.tickers = self.meta['tickers']
+        self.start = pd.Timestamp(self.meta['start'])
+        self.n_days = self.meta['n_days']
+        self.dates = pd.date_range(start=self.start, periods=self.n_days)
+        self._index = {ticker: i for i, ticker in enumerate(self.tickers)}
+        self.arrays = {name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r') for name in self.meta['arrays']}
+        self.mask = np.load(os.path.join(path, 'mask.npy'), mmap_mode='r')
+
+    def __reduce__(self):
+        return attach, (self.path,)
+
+    def __getitem__(self, name):
+        return self.arrays[name]
+
+    def __contains__(self, ticker):
+        return ticker in self._index
+
+    def row(self, ticker):
+        return self._index[ticker]
+
+    def rows(self, tickers):
+        return [self._index[ticker] for ticker in tickers]
+
+    def column(self, date):
+        return (pd.Timestamp(date).normalize() - self.start).days
+
+    def _window(self, start, end):
+        first = 0 if start is None else self.column(start)
+        last = self.n_days if end is None else self.column(end) + 1
+        if first < 0 or last > self.n_days:
+            raise KeyError(f"Диапазон {start} - {end} вне календаря индекса признаков")
+        return first, last
+
+    def window(self, name, tickers=None, start=None, end=None):
+        """Матрица признака name по окну; для всех тикеров — view на memmap, для подмножества — копия."""
+        first, last = self._window(start, end)
+        rows = slice(0, len(self.tickers)) if tickers is None else self.rows(tickers)
+        return self.arrays[name][rows, first:last]
+
+    def returns_frame(self, tickers, start=None, end=None):
+        """Дневные доходности (дни × тикеры) в формате covariance.store_returns."""
+        first, last = self._window(start, end)
+        data = np.asarray(self.arrays['returns'][self.rows(tickers), first + 1:last], dtype=np.float64)
+        return pd.DataFrame(data.T, index=self.dates[first + 1:last], columns=list(tickers))
+
+    @classmethod
+    def build(cls, store, path, **kwargs):
+        """
+        Считает признаки по всему хранилищу и публикует каталог path атомарно
+        (запись во временный каталог и переименование).
+        :param kwargs: Параметры compute_features
+        """
+        if store.exists:
+            values, mask, _ = store.matrix()
+        else:
+            values, mask = np.zeros((0, 0)), np.zeros((0, 0), dtype=bool)
+        tmp_path = f'{path}.tmp-{os.getpid()}'
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        features = compute_features(values, mask, **kwargs)
+        for name, array in features.items():
+            np.save(os.path.join(tmp_path, f'{name}.npy'), array if name == 'returns' else array.astype(np.float32))
+        np.save(os.path.join(tmp_path, 'mask.npy'), np.ascontiguousarray(mask))
+        meta = {
+            'tickers': list(store.tickers),
+            'start': store.start.strftime('%Y-%m-%d') if store.exists else None,
+            'n_days': store.n_days,
+            'signature': store_signature(store),
+            'arrays': list(features),
+        }
+        with open(os.path.join(tmp_path, cls.META_FILE), 'w') as file:
+            json.dump(meta, file)
+        try:
+            os.rename(tmp_path, path)
+        except OSError:
+            # Тот же индекс уже опубликован другим процессом
+            shutil.rmtree(tmp_path, ignore_errors=True)
+        return attach(path)
+
+
+def attach(path):
+    """Открывает индекс по пути (один раз на процесс)."""
+    index = _ATTACHED.get(path)
+    if index is None:
+        index = _ATTACHED[path] = FeatureIndex(path)
+    return index
+
+
+def open_features(store, root, day=None):
+    """
+    Индекс признаков хранилища на торговый день day (по умолчанию сегодня).
+    Собирается при первом обращении за день или после изменения хранилища;
+    индексы прошлых дней и прошлых версий хранилища удаляются.
+    :param store: PriceStore
+    :param root: Каталог индексов
+    """
+    day = pd.Timestamp(day or datetime.today()).strftime('%Y-%m-%d')
+    name = f'{day}-{store_signature(store)}'
+    path = os.path.join(root, name)
+    if os.path.exists(os.path.join(path, FeatureIndex.META_FILE)):
+        METRICS.cache('features', True)
+        return attach(path)
+    METRICS.cache('features', False)
+    os.makedirs(root, exist_ok=True)
+    with METRICS.timer('features_build_seconds'):
+        index = FeatureIndex.build(store, path)
+    for other in os.listdir(root):
+        if other != name and '.tmp-' not in other:
+            _ATTACHED.pop(os.path.join(root, other), None)
+            shutil.rmtree(os.path.join(root, other), ignore_errors=True)
+    return index
+
+
+def _screen_chunk(index, tickers, start, end, sma_short, sma_long, rsi_window):
+    first, last = index._window(start, end)
+    rows = index.rows(tickers)
+    observed = np.asarray(index.mask[rows, first:last])
+    n_obs = observed.sum(axis=1)
+    first_obs = np.argmax(observed, axis=1)
+    # Как в screening.screen: доходность первого наблюдения окна (от цены до окна) не учитывается
+    valid = observed.copy()
+    valid[np.arange(len(rows)), first_obs] = False
+    returns = np.where(valid, np.asarray(index['returns'][rows, first:last], dtype=np.float64), 0.0)
+    downside = np.minimum(returns, 0.0)
+    n_down = (downside < 0).sum(axis=1)
+    sum_down = downside.sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = returns.sum(axis=1) / valid.sum(axis=1)
+        squares = np.einsum('ij,ij->i', downside, downside) - sum_down ** 2 / n_down
+        downside_std = np.sqrt(np.maximum(squares, 0.0) / (n_down - 1))
+        sortino = np.where((n_down > 1) & (downside_std > 0), mean / downside_std, np.nan)
+
+    def last_value(name, window):
+        # Значение на конец окна, если все его наблюдения лежат внутри окна
+        value = np.asarray(index[name][rows, last - 1], dtype=np.float64)
+        return np.where(n_obs >= window, value, np.nan)
+
+    metrics = pd.DataFrame({
+        'n_obs': n_obs,
+        'sortino': sortino,
+        f'SMA_{sma_short}': last_value(f'SMA_{sma_short}', sma_short),
+        f'SMA_{sma_long}': last_value(f'SMA_{sma_long}', sma_long),
+        'RSI': last_value('RSI', rsi_window),
+    }, index=list(tickers))
+    metrics['first_date'] = index.dates[first + first_obs].where(n_obs > 0)
+    return metrics
+
+
+def screen_features(index, tickers, start=None, end=None, sma_short=50, sma_long=200, rsi_window=14, processes=None):
+    """
+    Метрики screening.screen по индексу признаков без пересчёта индикаторов.
+    RSI берётся по всей истории: отличие от RSI окна убывает как (1 - 1/rsi_window) ** n_obs.
+    :param index: FeatureIndex
+    :param processes: Число процессов; рабочие процессы подключаются к индексу по пути
+    :return: DataFrame как у screening.screen
+    """
+    tickers = list(tickers)
+    options = (start, end, sma_short, sma_long, rsi_window)
+    if not processes or processes <= 1 or len(tickers) < 2:
+        return _screen_chunk(index, tickers, *options)
+    size = -(-len(tickers) // processes)
+    chunks = [tickers[i:i + size] for i in range(0, len(tickers), size)]
+    with ProcessPoolExecutor(max_workers=len(chunks)) as pool:
+        parts = list(pool.map(_screen_chunk, [index] * len(chunks), chunks, *[[option] * len(chunks) for option in options]))
+    return pd.concat(parts)
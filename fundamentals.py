@@ -0,0 +1,85 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import METRICS
+
+logger = logging.getLogger('finlogic.fundamentals')
+
+
+class FundamentalsService:
+    """
+    Капитализация, объём и последняя цена тикеров.
+
+    Каждый тикер запрашивается у поставщика не более одного раза: info и цена
+    загружаются ограниченным пулом потоков и кэшируются на диске с разным временем
+    жизни (фундаментальные данные — сутки, цена — внутри дня).
+    """
+
+    def __init__(self, provider, cache, max_workers=16, info_ttl=24 * 3600, price_ttl=15 * 60):
+        self.provider = provider
+        self.cache = cache
+        self.max_workers = max_workers
+        self.info_ttl = info_ttl
+        self.price_ttl = price_ttl
+
+    def _fetch_one(self, ticker, need_info, need_price):
+        result = {}
+        with METRICS.timer('ticker_seconds', op='fundamentals', ticker=ticker):
+            try:
+                if need_info:
+                    result['info'] = self.provider.info(ticker)
+                if need_price:
+                    result['price'] = self.provider.last_price(ticker)
+            except Exception as e:
+                logger.warning(f"Ошибка при обработке тикера {ticker}: {e}")
+        return result
+
+    def fetch(self, tickers):
+        """
+        :param tickers: Список тикеров
+        :return: DataFrame (индекс — тикер) с колонками marketCap, volume, price
+        """
+        rows = {}
+        todo = []
+        for ticker in tickers:
+            info = self.cache.get(f'info:{ticker}', ttl=self.info_ttl)
+            price = self.cache.get(f'price:{ticker}', ttl=self.price_ttl)
+            rows[ticker] = {'info': info, 'price': price}
+            if info is None or price is None:
+                todo.append(ticker)
+
+        if todo:
+            logger.info(f"Загрузка фундаментальных данных для {len(todo)} тикеров...")
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(todo))) as pool:
+                fetched = list(pool.map(
+                    lambda ticker: self._fetch_one(ticker, rows[ticker]['info'] is None, rows[ticker]['price'] is None),
+                    todo))
+            updates = {}
+            for ticker, result in zip(todo, fetched):
+                if 'info' in result:
+                    rows[ticker]['info'] = updates[f'info:{ticker}'] = result['info']
+                if 'price' in result:
+                    rows[ticker]['price'] = updates[f'price:{ticker}'] = result['price']
+            if updates:
+                self.cache.set_many(updates)
+
+        table = pd.DataFrame({
+            'marketCap': [(rows[t]['info'] or {}).get('marketCap') for t in tickers],
+            'volume': [(rows[t]['info'] or {}).get('volume') for t in tickers],
+            'price': [rows[t]['price'] for t in tickers],
+        }, index=pd.Index(tickers, name='Ticker'), dtype=float)
+        return table
+
+
+def apply_filters(table, max_stock_price, min_market_cap=1e9, min_volume=1e6):
+    """
+    Векторные пороги filter_tickers: капитализация и объём для всех тикеров,
+    ограничение цены — только для акций (криптовалюты с суффиксом -USD без проверки цены).
+    """
+    is_crypto = table.index.str.endswith('-USD')
+    keep = (table['marketCap'] > min_market_cap) & (table['volume'] > min_volume) & table['price'].notna()
+    keep &= is_crypto | (table['price'] <= max_stock_price)
+    return list(table.index[np.asarray(keep)])
@@ -0,0 +1,145 @@
+import logging
+from datetime import datetime, timedelta
+
+from instrumentation import METRICS, record_response
+
+logger = logging.getLogger('finlogic.fx')
+
+SYMBOLS = {'KZT': '₸', 'USD': '$', 'EUR': '€', 'RUB': '₽', 'GBP': '£', 'CNY': '¥', 'JPY': '¥', 'TRY': '₺', 'UZS': 'сўм'}
+
+
+def currency_symbol(currency):
+    return SYMBOLS.get(currency, currency)
+
+
+def fetch_exchangerate_api(base='USD', timeout=10):
+    """Курсы всех валют к base с exchangerate-api.com: {валюта: курс}."""
+    import requests
+    response = requests.get(f'https://api.exchangerate-api.com/v4/latest/{base}', timeout=timeout,
+                            hooks={'response': record_response})
+    response.raise_for_status()
+    return response.json()['rates']
+
+
+class FXService:
+    """
+    Курсы валют к доллару.
+
+    Спот-курс кэшируется в KVStore на ttl секунд; если источник недоступен, отдаётся
+    последнее сохранённое значение. Каждый полученный спот-курс дописывается в дневную
+    историю, а недостающие дни истории догружаются у поставщика котировок (тикеры вида
+    KZT=X в yfinance), чтобы бэктесты и сценарии пересчитывались по курсу своей даты.
+    """
+
+    def __init__(self, store, provider=None, fetch=None, ttl=3600, base='USD'):
+        """
+        :param store: KVStore
+        :param provider: Поставщик котировок с методом download (для истории)
+        :param fetch: Функция fetch(base) -> {валюта: курс}, по умолчанию exchangerate-api
+        """
+        self.store = store
+        self.provider = provider
+        self.fetch = fetch or fetch_exchangerate_api
+        self.ttl = ttl
+        self.base = base
+
+    def _pair(self, currency):
+        return f'{self.base}/{currency}'
+
+    def spot(self, currency='KZT'):
+        if currency == self.base:
+            return 1.0
+        rate = self.store.get('fx', self._pair(currency), max_age=self.ttl)
+        if rate is not None:
+            METRICS.cache('fx', True)
+            return rate
+        METRICS.cache('fx', False)
+        try:
+            rates = self.fetch(self.base)
+        except Exception as e:
+            stale = self.store.get('fx', self._pair(currency))
+            if stale is None:
+                raise
+            logger.warning(f"Не удалось получить курс {self._pair(currency)} ({e}), используется сохранённый: {stale}")
+            return stale
+        if currency not in rates:
+            raise KeyError(f"Нет курса для валюты {currency}")
+        # Курсы всех валют ответа сохраняются сразу: запрос один на все пары
+        today = datetime.today().strftime('%Y-%m-%d')
+        self.store.set_many('fx', {self._pair(code): float(value) for code, value in rates.items()})
+        self.store.set(f'fx_history:{self._pair(currency)}', today, float(rates[currency]))
+        return float(rates[currency])
+
+    def history(self, currency, start, end=None):
+        """
+        Дневные курсы за [start, end] (календарные дни, пропуски заполнены предыдущим курсом).
+        :return: pd.Series с индексом дат
+        """
+        import pandas as pd
+
+        start = pd.Timestamp(start).normalize()
+        end = pd.Timestamp(end or datetime.today()).normalize()
+        days = pd.date_range(start, end, freq='D')
+        if currency == self.base:
+            return pd.Series(1.0, index=days)
+
+        namespace = f'fx_history:{self._pair(currency)}'
+        stored = self.store.get_many(namespace)
+        known = pd.Series(stored, dtype=float)
+        known.index = pd.DatetimeIndex(known.index)
+        covered = known[(known.index >= start - timedelta(days=7)) & (known.index <= end)]
+        if self.provider is not None and (covered.empty or covered.index[0] > start or covered.index[-1] < end - timedelta(days=3)):
+            fetched = self._backfill(currency, start - timedelta(days=7), end)
+            if not fetched.empty:
+                self.store.set_many(namespace, {day.strftime('%Y-%m-%d'): float(rate) for day, rate in fetched.items()})
+                known = fetched.combine_first(known)
+
+        known = known.sort_index()
+        if known.empty:
+            raise KeyError(f"Нет истории курса {self._pair(currency)}")
+        # Дни до первого известного курса заполняются ближайшим известным
+        return known.reindex(known.index.union(days)).ffill().bfill().reindex(days)
+
+    def _backfill(self, currency, start, end):
+        import pandas as pd
+
+        ticker = f'{currency}=X' if self.base == 'USD' else f'{self.base}{currency}=X'
+        try:
+            data = self.provider.download([ticker], start=start.strftime('%Y-%m-%d'),
+                                          end=(end + timedelta(days=1)).strftime('%Y-%m-%d'))
+        except Exception as e:
+            logger.warning(f"Не удалось загрузить историю курса {ticker}: {e}")
+            return pd.Series(dtype=float)
+        if ticker not in getattr(data, 'columns', []):
+            return pd.Series(dtype=float)
+        series = data[ticker].dropna()
+        series.index = pd.DatetimeIndex(series.index).tz_localize(None).normalize()
+        return series[~series.index.duplicated(keep='last')]
+
+    def rate_at(self, currency, date):
+        """Курс на дату (последний известный не позже неё)."""
+        return float(self.history(currency, date, date).iloc[-1])
+
+    def convert(self, values, currency, dates=None, rate=None):
+        """
+        Пересчёт сумм в долларах в currency одной векторной операцией.
+        :param values: Число, массив, Series или DataFrame
+        :param dates: Даты строк (по умолчанию индекс values) для пересчёта по историческому курсу;
+            без dates и rate используется спот-курс
+        :param rate: Явный курс (например, зафиксированный на этапе discover)
+        """
+        import numpy as np
+        import pandas as pd
+
+        if rate is not None:
+            return values * rate
+        if dates is None:
+            return values * self.spot(currency)
+        dates = pd.DatetimeIndex(dates).normalize()
+        rates = self.history(currency, dates.min(), dates.max()).reindex(dates).values
+        if isinstance(values, pd.DataFrame):
+            return values.mul(rates, axis=0)
+        if isinstance(values, pd.Series):
+            return values * rates
+        values = np.asarray(values, dtype=float)
+        return values * (rates[:, None] if values.ndim == 2 else rates)
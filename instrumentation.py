@@ -0,0 +1,179 @@
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger('finlogic')
+
+
+def configure_logging(level='INFO'):
+    """Вывод сообщений finlogic в stdout без префиксов, как прежние print."""
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    root = logging.getLogger('finlogic')
+    root.handlers[:] = [handler]
+    root.setLevel(level.upper() if isinstance(level, str) else level)
+    root.propagate = False
+
+
+class Metrics:
+    """
+    Метрики запуска: таймеры (число, сумма и максимум секунд), счётчики и значения,
+    каждое с набором меток. Потокобезопасно, выгружается в JSON и текстовый формат Prometheus.
+    """
+
+    def __init__(self, prefix='finlogic'):
+        self.prefix = prefix
+        self.lock = threading.Lock()
+        self.profile_stages = set()
+        self.profile_dir = '.'
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.timers = {}
+            self.counters = {}
+            self.gauges = {}
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+    def observe(self, name, seconds, **labels):
+        key = self._key(name, labels)
+        with self.lock:
+            count, total, longest = self.timers.get(key, (0, 0.0, 0.0))
+            self.timers[key] = (count + 1, total + seconds, max(longest, seconds))
+
+    @contextmanager
+    def timer(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def incr(self, name, value=1, **labels):
+        key = self._key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def gauge(self, name, value, **labels):
+        with self.lock:
+            self.gauges[self._key(name, labels)] = value
+
+    def cache(self, name, hit):
+        self.incr('cache_hits_total' if hit else 'cache_misses_total', cache=name)
+
+    def cache_ratios(self):
+        """:return: {кэш: доля попаданий}"""
+        hits, misses = {}, {}
+        with self.lock:
+            for (name, labels), value in self.counters.items():
+                if name in ('cache_hits_total', 'cache_misses_total'):
+                    target = hits if name == 'cache_hits_total' else misses
+                    target[dict(labels)['cache']] = value
+        return {cache: hits.get(cache, 0) / (hits.get(cache, 0) + misses.get(cache, 0))
+                for cache in set(hits) | set(misses)}
+
+    def to_dict(self):
+        with self.lock:
+            timers = [{'name': name, 'labels': dict(labels), 'count': count, 'seconds': total, 'max_seconds': longest}
+                      for (name, labels), (count, total, longest) in sorted(self.timers.items())]
+            counters = [{'name': name, 'labels': dict(labels), 'value': value}
+                        for (name, labels), value in sorted(self.counters.items())]
+            gauges = [{'name': name, 'labels': dict(labels), 'value': value}
+                      for (name, labels), value in sorted(self.gauges.items())]
+        return {'timers': timers, 'counters': counters, 'gauges': gauges, 'cache_hit_ratio': self.cache_ratios()}
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), indent=2, ensure_ascii=False)
+
+    def to_prometheus(self):
+        lines = []
+
+        def labels_text(labels):
+            if not labels:
+                return ''
+            escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"') for value in labels.values())
+            return '{' + ','.join(f'{key}="{value}"' for key, value in zip(labels, escaped)) + '}'
+
+        data = self.to_dict()
+        typed = set()
+        for timer in data['timers']:
+            name = f"{self.prefix}_{timer['name']}"
+            if name not in typed:
+                lines.append(f'# TYPE {name} summary')
+                typed.add(name)
+            lines.append(f"{name}_count{labels_text(timer['labels'])} {timer['count']}")
+            lines.append(f"{name}_sum{labels_text(timer['labels'])} {timer['seconds']:.6f}")
+        for kind, metric_type in (('counters', 'counter'), ('gauges', 'gauge')):
+            for item in data[kind]:
+                name = f"{self.prefix}_{item['name']}"
+                if name not in typed:
+                    lines.append(f'# TYPE {name} {metric_type}')
+                    typed.add(name)
+                lines.append(f"{name}{labels_text(item['labels'])} {item['value']}")
+        return '\n'.join(lines) + '\n'
+
+    def export(self, path):
+        """Сохраняет метрики: .prom — формат Prometheus, иначе JSON."""
+        text = self.to_prometheus() if path.endswith('.prom') else self.to_json()
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as file:
+            file.write(text)
+        os.replace(tmp_path, path)
+        logger.info(f"Метрики сохранены в {path}")
+
+    @contextmanager
+    def profile(self, stage):
+        """Профилирует блок cProfile, если этап указан в profile_stages (результат — <этап>.prof)."""
+        if stage not in self.profile_stages:
+            yield
+            return
+        import cProfile
+        import io
+        import pstats
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            path = os.path.join(self.profile_dir, f'{stage}.prof')
+            profiler.dump_stats(path)
+            summary = io.StringIO()
+            pstats.Stats(profiler, stream=summary).sort_stats('cumulative').print_stats(15)
+            logger.info(f"Профиль этапа {stage} сохранён в {path}\n{summary.getvalue()}")
+
+
+METRICS = Metrics()
+
+
+def record_response(response, *args, **kwargs):
+    """Хук requests: число HTTP-запросов и байт по хосту."""
+    host = response.url.split('/')[2] if '://' in response.url else response.url
+    METRICS.incr('http_requests_total', host=host, status=response.status_code)
+    METRICS.incr('http_bytes_total', len(response.content), host=host)
+
+
+@contextmanager
+def run_session(log_level='INFO', metrics_path=None, profile_stages=(), profile_dir='.'):
+    """Настройка логирования и профилирования на время запуска из командной строки, затем выгрузка метрик."""
+    configure_logging(log_level)
+    METRICS.reset()
+    METRICS.profile_stages = set(profile_stages or ())
+    METRICS.profile_dir = profile_dir
+    start = time.perf_counter()
+    try:
+        yield METRICS
+    finally:
+        METRICS.observe('run_seconds', time.perf_counter() - start)
+        ratios = ', '.join(f"{name} {ratio:.0%}" for name, ratio in sorted(METRICS.cache_ratios().items()))
+        if ratios:
+            logger.debug(f"Доля попаданий в кэши: {ratios}")
+        if metrics_path:
+            METRICS.export(metrics_path)
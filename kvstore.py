@@ -0,0 +1,144 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+class KVStore:
+    """
+    Хранилище ключ-значение на SQLite в режиме WAL: пространства имён, время жизни
+    записей и пакетная запись одной транзакцией. Читатели не блокируют писателя,
+    а параллельные процессы ждут освобождения блокировки (busy_timeout), поэтому
+    одновременные запуски и падение посреди записи не портят файл.
+    Значения хранятся в JSON.
+
+    SQLite не допускает переноса открытых соединений через fork: перед запуском
+    процессов с fork хранилище нужно закрыть (close или with), либо запускать их через spawn.
+    """
+
+    def __init__(self, path, timeout=30.0):
+        self.path = path
+        self.timeout = timeout
+        self.local = threading.local()
+        self.connections = []  # Все соединения этого процесса (по одному на поток) для close
+        self.inherited = []
+        self.lock = threading.Lock()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._connection() as connection:
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS kv ('
+                ' namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL,'
+                ' updated REAL NOT NULL, expires REAL,'
+                ' PRIMARY KEY (namespace, key)) WITHOUT ROWID')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Закрывает соединения всех потоков этого процесса."""
+        with self.lock:
+            connections = [connection for connection, pid in self.connections if pid == os.getpid()]
+            self.inherited += [connection for connection, pid in self.connections if pid != os.getpid()]
+            self.connections = []
+        for connection in connections:
+            connection.close()
+        self.local = threading.local()
+
+    def _connection(self):
+        # Соединение на поток: sqlite3 не разрешает делить его между потоками
+        connection = getattr(self.local, 'connection', None)
+        if connection is not None and self.local.pid != os.getpid():
+            # Унаследованное через fork соединение не используется и не закрывается в потомке
+            self.inherited.append(connection)
+            connection = None
+        if connection is None:
+            # Используется только своим потоком; проверка потока отключена, чтобы close мог закрыть все соединения
+            connection = sqlite3.connect(self.path, timeout=self.timeout, check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute(f'PRAGMA busy_timeout={int(self.timeout * 1000)}')
+            self.local.connection = connection
+            self.local.pid = os.getpid()
+            with self.lock:
+                self.connections.append((connection, os.getpid()))
+        return connection
+
+    def get(self, namespace, key, default=None, max_age=None):
+        """
+        :param max_age: Дополнительно считать устаревшими записи старше max_age секунд
+        """
+        values = self.get_many(namespace, [key], max_age=max_age)
+        return values.get(key, default)
+
+    def get_many(self, namespace, keys=None, max_age=None):
+        """:return: Словарь {ключ: значение} живых записей (все записи пространства имён, если keys=None)"""
+        now = time.time()
+        query = 'SELECT key, value FROM kv WHERE namespace = ? AND (expires IS NULL OR expires > ?)'
+        params = [namespace, now]
+        if max_age is not None:
+            query += ' AND updated >= ?'
+            params.append(now - max_age)
+        if keys is None:
+            rows = self._connection().execute(query, params).fetchall()
+        else:
+            rows = []
+            keys = list(keys)
+            for i in range(0, len(keys), 500):  # Ограничение SQLite на число параметров
+                chunk = keys[i:i + 500]
+                rows += self._connection().execute(
+                    query + f" AND key IN ({','.join('?' * len(chunk))})", params + chunk).fetchall()
+        return {key: json.loads(value) for key, value in rows}
+
+    def set(self, namespace, key, value, ttl=None):
+        self.set_many(namespace, {key: value}, ttl=ttl)
+
+    def set_many(self, namespace, items, ttl=None, updated=None):
+        """
+        Записывает все пары одной транзакцией.
+        :param ttl: Время жизни в секундах (None — без срока)
+        :param updated: Время записи (по умолчанию — текущее), используется при переносе старых кэшей
+        """
+        now = time.time() if updated is None else updated
+        expires = now + ttl if ttl is not None else None
+        rows = [(namespace, key, json.dumps(value), now, expires) for key, value in items.items()]
+        with self._connection() as connection:
+            connection.executemany('INSERT OR REPLACE INTO kv VALUES (?, ?, ?, ?, ?)', rows)
+
+    def delete(self, namespace, key=None):
+        """Удаляет ключ или всё пространство имён."""
+        with self._connection() as connection:
+            if key is None:
+                connection.execute('DELETE FROM kv WHERE namespace = ?', (namespace,))
+            else:
+                connection.execute('DELETE FROM kv WHERE namespace = ? AND key = ?', (namespace, key))
+
+    def purge(self):
+        """Удаляет просроченные записи. :return: Число удалённых записей"""
+        with self._connection() as connection:
+            return connection.execute('DELETE FROM kv WHERE expires IS NOT NULL AND expires <= ?', (time.time(),)).rowcount
+
+    def import_json(self, namespace, path, timestamped=False, ttl=None):
+        """
+        Переносит старый JSON-кэш в пространство имён и переименовывает файл в *.migrated.
+        :param timestamped: Формат TTLCache {ключ: [время, значение]}, иначе {ключ: значение}
+        :return: Число перенесённых записей
+        """
+        if not os.path.exists(path):
+            return 0
+        try:
+            with open(path, 'r') as file:
+                data = json.load(file)
+        except ValueError:
+            data = {}  # Недописанный файл от прерванной записи: переносить нечего
+        if timestamped:
+            for key, (updated, value) in data.items():
+                self.set_many(namespace, {key: value}, ttl=ttl, updated=updated)
+        else:
+            self.set_many(namespace, data, ttl=ttl)
+        os.replace(path, f'{path}.migrated')
+        return len(data)
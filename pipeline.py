@@ -0,0 +1,301 @@
+import argparse
+import hashlib
+import json
+import logging
+import os
+
+from instrumentation import METRICS, run_session
+
+logger = logging.getLogger('finlogic.pipeline')
+
+STAGES = ['discover', 'filter', 'rank', 'load', 'solve', 'write']
+
+
+class StageOutput:
+    """Результат этапа: набор полей fields, сериализуемый в JSON для контрольной точки."""
+
+    fields = ()
+
+    def __init__(self, **values):
+        for name in self.fields:
+            setattr(self, name, values.get(name))
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.fields}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+
+
+class Discovery(StageOutput):
+    fields = ('tickers', 'conversion_rate')
+
+
+class Filtered(StageOutput):
+    fields = ('tickers',)
+
+
+class Ranking(StageOutput):
+    fields = ('tickers',)
+
+
+class AllocationInputs(StageOutput):
+    """
+    Тикеры в порядке «сначала акции», средние доходности, ковариация и текущие цены.
+    При ребалансировке — также текущие количества, маска тикеров, которые можно докупать,
+    и позиции без истории цен (тикер, сумма в $, количество): они не торгуются и переносятся в портфель как есть.
+    """
+    fields = ('tickers', 'n_stocks', 'mean_returns', 'cov_matrix', 'prices', 'holdings', 'can_buy', 'untraded')
+
+
+class Allocation(StageOutput):
+    fields = ('tickers', 'n_stocks', 'prices', 'quantities', 'holdings', 'untraded', 'status', 'solver', 'objective',
+              'bound', 'gap', 'leftover', 'timings')
+
+
+class PortfolioUpdate(StageOutput):
+    fields = ('allocations', 'written')
+
+
+OUTPUTS = {'discover': Discovery, 'filter': Filtered, 'rank': Ranking,
+           'load': AllocationInputs, 'solve': Allocation, 'write': PortfolioUpdate}
+
+
+class CheckpointStore:
+    """Контрольные точки этапов: по JSON-файлу на этап с ключом входных данных, запись атомарная."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def _file(self, stage):
+        return os.path.join(self.path, f'{stage}.json')
+
+    def load(self, stage):
+        if not os.path.exists(self._file(stage)):
+            return None
+        with open(self._file(stage), 'r') as file:
+            return json.load(file)
+
+    def save(self, stage, key, output):
+        os.makedirs(self.path, exist_ok=True)
+        tmp_path = f'{self._file(stage)}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as file:
+            json.dump({'key': key, 'output': output.to_dict()}, file)
+        os.replace(tmp_path, self._file(stage))
+
+    def invalidate(self, stage):
+        if os.path.exists(self._file(stage)):
+            os.remove(self._file(stage))
+
+
+class Pipeline:
+    """
+    optimize_portfolio как цепочка этапов discover → filter → rank → load → solve → write.
+    Ключ этапа — хэш его параметров, даты и ключа предыдущего этапа, поэтому повторный
+    запуск берёт готовые результаты из контрольных точек и продолжает с первого
+    устаревшего этапа: например, после ошибки решателя не нужно заново собирать тикеры.
+    """
+
+    def __init__(self, fin_logic, new_investment, checkpoint_dir=None, risk_tolerance=0.02):
+        self.fin_logic = fin_logic
+        self.new_investment = new_investment
+        self.risk_tolerance = risk_tolerance  # Примерное допустимое значение стандартного отклонения (2%)
+        self.checkpoints = CheckpointStore(checkpoint_dir or os.path.join(fin_logic.data_dir, 'pipeline'))
+        self.outputs = {}
+
+    def params(self, stage):
+        """Параметры, от которых зависит результат этапа (кроме результатов предыдущих этапов)."""
+        fin_logic = self.fin_logic
+        return {
+            'discover': {'date': fin_logic.end_date, 'currency': fin_logic.currency},
+            'filter': {'investment': self.new_investment, 'holdings': self.holdings_signature()},
+            'rank': {'date': fin_logic.end_date, 'allow': sorted(fin_logic.allow), 'deny': sorted(fin_logic.deny)},
+            'load': {'start': fin_logic.default_start_date, 'end': fin_logic.end_date, 'cov_method': fin_logic.cov_method},
+            'solve': {'investment': self.new_investment, 'min_lot': fin_logic.min_lot, 'solver': fin_logic.solver,
+                      'risk_tolerance': self.risk_tolerance, 'transaction_cost': fin_logic.transaction_cost,
+                      'turnover_penalty': fin_logic.turnover_penalty},
+            'write': {'portfolio_file': fin_logic.portfolio_file},
+        }[stage]
+
+    def holdings_signature(self):
+        """Текущие позиции, от которых зависит ребалансировка (None в обычном режиме)."""
+        fin_logic = self.fin_logic
+        if not fin_logic.rebalance:
+            return None
+        return sorted((ticker, fin_logic.current_quantities.get(ticker), value)
+                      for ticker, value in fin_logic.current_portfolio.items())
+
+    def keys(self):
+        keys, previous = {}, ''
+        for stage in STAGES:
+            payload = json.dumps({'stage': stage, 'params': self.params(stage), 'previous': previous}, sort_keys=True)
+            keys[stage] = previous = hashlib.md5(payload.encode()).hexdigest()
+        return keys
+
+    def status(self):
+        """:return: Список (этап, актуальна ли контрольная точка)"""
+        keys = self.keys()
+        result = []
+        for stage in STAGES:
+            checkpoint = self.checkpoints.load(stage)
+            result.append((stage, checkpoint is not None and checkpoint['key'] == keys[stage]))
+        return result
+
+    def invalidate(self, stage):
+        """Удаляет контрольные точки этапа и всех следующих за ним."""
+        for name in STAGES[STAGES.index(stage):]:
+            self.checkpoints.invalidate(name)
+
+    def run(self, until='write', resume=True):
+        """
+        :param until: Последний выполняемый этап
+        :param resume: Брать актуальные результаты из контрольных точек
+        :return: Результат последнего выполненного этапа или None, если цепочка остановилась раньше
+        """
+        keys = self.keys()
+        output = None
+        for stage in STAGES[:STAGES.index(until) + 1]:
+            checkpoint = self.checkpoints.load(stage) if resume else None
+            # Запись портфеля — побочный эффект, её результат не переиспользуется
+            if stage != 'write' and checkpoint is not None and checkpoint['key'] == keys[stage]:
+                METRICS.cache('checkpoint', True)
+                logger.info(f"Этап {stage}: результат взят из контрольной точки.")
+                output = OUTPUTS[stage].from_dict(checkpoint['output'])
+            else:
+                if stage != 'write':
+                    METRICS.cache('checkpoint', False)
+                logger.info(f"Этап {stage}...")
+                with METRICS.timer('stage_seconds', stage=stage), METRICS.profile(stage):
+                    output = getattr(self, f'_{stage}')()
+                # Неудачное решение не сохраняется: следующий запуск попробует решить заново
+                if stage != 'solve' or output.quantities is not None:
+                    self.checkpoints.save(stage, keys[stage], output)
+            self.outputs[stage] = output
+            if stage == 'discover':
+                self.fin_logic.conversion_rate = output.conversion_rate
+            if stage == 'rank' and not output.tickers:
+                logger.info("Нет доступных тикеров для оптимизации.")
+                return None
+            if stage == 'solve' and output.quantities is None:
+                logger.info("Не удалось найти допустимое распределение.")
+                return None
+        return output
+
+    def _discover(self):
+        conversion_rate = self.fin_logic.get_conversion_rate()
+        return Discovery(tickers=self.fin_logic.get_all_tickers(), conversion_rate=conversion_rate)
+
+    def _filter(self):
+        investment = self.new_investment
+        if self.fin_logic.rebalance:
+            # При ребалансировке распределяется весь капитал: текущие позиции плюс новые деньги
+            investment += sum(self.fin_logic.current_portfolio.values()) * self.fin_logic.conversion_rate
+        return Filtered(tickers=self.fin_logic.filter_tickers(self.outputs['discover'].tickers, investment))
+
+    def _rank(self):
+        return Ranking(tickers=self.fin_logic.get_top_4_by_sortino(self.outputs['filter'].tickers))
+
+    def _load(self):
+        top_tickers = self.outputs['rank'].tickers
+        universe = list(top_tickers)
+        if self.fin_logic.rebalance:
+            # Текущие позиции вне отбора остаются в задаче: их можно держать или продать
+            universe += [ticker for ticker in self.fin_logic.current_portfolio if ticker not in top_tickers]
+        self.fin_logic.load_data(universe)
+        # В задачу попадают только тикеры с историей цен
+        priced = [ticker for ticker in universe if ticker in self.fin_logic.data_store]
+        stock_tickers = [ticker for ticker in priced if not ticker.endswith("-USD")]
+        crypto_tickers = [ticker for ticker in priced if ticker.endswith("-USD")]
+        tickers, mean_returns, cov_matrix, prices = self.fin_logic.prepare_allocation_inputs(stock_tickers, crypto_tickers)
+        holdings = can_buy = untraded = None
+        if self.fin_logic.rebalance:
+            holdings = list(map(float, self.fin_logic.holding_quantities(tickers, prices)))
+            can_buy = [ticker in top_tickers for ticker in tickers]
+            untraded = [[ticker, self.fin_logic.current_portfolio[ticker], self.fin_logic.current_quantities.get(ticker)]
+                        for ticker in universe if ticker not in priced and ticker in self.fin_logic.current_portfolio]
+            if untraded:
+                logger.warning(f"Нет истории цен для позиций {[ticker for ticker, _, _ in untraded]}: "
+                               f"они не торгуются и сохраняются в портфеле без изменений")
+        return AllocationInputs(tickers=tickers, n_stocks=len(stock_tickers), mean_returns=list(map(float, mean_returns)),
+                                cov_matrix=[list(map(float, row)) for row in cov_matrix], prices=list(map(float, prices)),
+                                holdings=holdings, can_buy=can_buy, untraded=untraded)
+
+    def _solve(self):
+        from solvers import solve_allocation, solve_rebalance
+        inputs = self.outputs['load']
+        fin_logic = self.fin_logic
+        conversion_rate = fin_logic.conversion_rate
+        if inputs.holdings is not None:
+            # Решение только по сделкам относительно текущих позиций, старт — с них же
+            result = solve_rebalance(
+                inputs.mean_returns, inputs.cov_matrix, inputs.prices, inputs.n_stocks, inputs.holdings,
+                budget=self.new_investment / conversion_rate,
+                min_lot=fin_logic.min_lot / conversion_rate,
+                risk_tolerance=self.risk_tolerance,
+                can_buy=inputs.can_buy,
+                cost=fin_logic.transaction_cost,
+                turnover_penalty=fin_logic.turnover_penalty,
+                backend=fin_logic.solver,
+            )
+        else:
+            result = solve_allocation(
+                inputs.mean_returns, inputs.cov_matrix, inputs.prices, inputs.n_stocks,
+                budget=self.new_investment / conversion_rate,
+                min_lot=fin_logic.min_lot / conversion_rate,
+                risk_tolerance=self.risk_tolerance,
+                backend=fin_logic.solver,
+            )
+        gap = f"{result.gap:.2%}" if result.gap is not None else "н/д"
+        timings = ", ".join(f"{name} {seconds:.3f}s" for name, seconds in result.timings.items())
+        logger.info(f"Решатель: {result.solver}, статус: {result.status}, разрыв: {gap}, время: {timings}")
+        quantities = list(map(float, result.quantities)) if result.quantities is not None else None
+        return Allocation(tickers=inputs.tickers, n_stocks=inputs.n_stocks, prices=inputs.prices, quantities=quantities,
+                          holdings=inputs.holdings, untraded=inputs.untraded, status=result.status, solver=result.solver, objective=result.objective, bound=result.bound,
+                          gap=result.gap, leftover=result.leftover, timings=result.timings)
+
+    def _write(self):
+        allocation = self.outputs['solve']
+        allocations, written = self.fin_logic.write_allocation(
+            allocation.tickers, allocation.n_stocks, allocation.quantities, allocation.prices, holdings=allocation.holdings,
+            leftover=allocation.leftover, untraded=allocation.untraded)
+        return PortfolioUpdate(allocations=allocations, written=written)
+
+
+def main(argv=None):
+    from FinLogic import FinLogic, common_arguments
+
+    parser = argparse.ArgumentParser(description="Поэтапный запуск оптимизации портфеля")
+    commands = parser.add_subparsers(dest='command', required=True)
+    run = commands.add_parser('run', parents=[common_arguments()], help="Выполнить этапы, продолжая с первого устаревшего")
+    run.add_argument('investment', nargs='?', type=float, default=355800, help="Сумма новых инвестиций в тенге")
+    run.add_argument('--until', choices=STAGES, default='write', help="Последний выполняемый этап")
+    run.add_argument('--from', dest='from_stage', choices=STAGES, help="Пересчитать начиная с этого этапа")
+    run.add_argument('--fresh', action='store_true', help="Не использовать контрольные точки")
+    invalidate = commands.add_parser('invalidate', parents=[common_arguments()], help="Удалить контрольные точки этапов")
+    invalidate.add_argument('stages', nargs='+', choices=STAGES, help="Этапы (вместе со всеми последующими)")
+    stages = commands.add_parser('stages', parents=[common_arguments()], help="Показать состояние контрольных точек")
+    stages.add_argument('investment', nargs='?', type=float, default=355800, help="Сумма новых инвестиций в тенге")
+    args = parser.parse_args(argv)
+
+    with run_session(args.log_level, args.metrics, args.profile), FinLogic.from_args(args) as fin_logic:
+        pipeline = Pipeline(fin_logic, getattr(args, 'investment', 0))
+        return _run_command(pipeline, args)
+
+
+def _run_command(pipeline, args):
+    if args.command == 'invalidate':
+        for stage in args.stages:
+            pipeline.invalidate(stage)
+            logger.info(f"Контрольные точки начиная с этапа {stage} удалены.")
+    elif args.command == 'stages':
+        for stage, fresh in pipeline.status():
+            logger.info(f"{stage}: {'актуален' if fresh else 'устарел'}")
+    else:
+        if args.from_stage:
+            pipeline.invalidate(args.from_stage)
+        return pipeline.run(until=args.until, resume=not args.fresh)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,316 @@
+import glob
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+
+class PriceStore:
+    """
+    Колоночное хранилище цен закрытия.
+
+    Все тикеры лежат в одной memory-mapped матрице float64 (тикеры × дни) на общем
+    дневном календаре. Строки уже выровнены и заполнены (ffill/bfill), а маска
+    отмечает дни с реальными наблюдениями. Метаданные (календарь, индекс тикеров,
+    последняя сохранённая дата) хранятся в meta.json и заменяются атомарно.
+    """
+
+    META_FILE = 'meta.json'
+    DAY_SLACK = 366
+    MIN_TICKER_CAPACITY = 64
+    REWRITE_LOG = 256  # Сколько последних перезаписей уже сохранённых дней помнит rewritten_since
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self.meta = self._read_meta()
+        self.values = None
+        self.mask = None
+        self._stale_files = []
+        if self.meta is not None:
+            self._open(self.meta['generation'])
+        self._index = {ticker: i for i, ticker in enumerate(self.tickers)}
+
+    @property
+    def exists(self):
+        return self.meta is not None
+
+    @property
+    def tickers(self):
+        return self.meta['tickers'] if self.meta else []
+
+    @property
+    def start(self):
+        return pd.Timestamp(self.meta['start'])
+
+    @property
+    def n_days(self):
+        return self.meta['n_days'] if self.meta else 0
+
+    @property
+    def dates(self):
+        if not self.meta:
+            return pd.DatetimeIndex([])
+        return pd.date_range(start=self.start, periods=self.n_days)
+
+    def __contains__(self, ticker):
+        return ticker in self._index
+
+    def __len__(self):
+        return len(self._index)
+
+    def last_date(self, ticker):
+        date = self.meta['last_date'].get(ticker) if self.meta else None
+        return pd.Timestamp(date) if date else None
+
+    # --- файлы ---
+
+    def _file(self, name, generation):
+        return os.path.join(self.path, f'{name}-{generation}.bin')
+
+    def _read_meta(self):
+        meta_path = os.path.join(self.path, self.META_FILE)
+        if os.path.exists(meta_path):
+            with open(meta_path, 'r') as file:
+                return json.load(file)
+        return None
+
+    def _open(self, generation):
+        shape = (self.meta['ticker_capacity'], self.meta['day_capacity'])
+        self.values = np.memmap(self._file('prices', generation), dtype=np.float64, mode='r+', shape=shape)
+        self.mask = np.memmap(self._file('mask', generation), dtype=np.bool_, mode='r+', shape=shape)
+
+    def _allocate(self, start, n_days, day_capacity, ticker_capacity):
+        """Создаёт новое поколение файлов и переносит в него текущие данные."""
+        old_meta, old_values, old_mask = self.meta, self.values, self.mask
+        generation = old_meta['generation'] + 1 if old_meta else 0
+        shape = (ticker_capacity, day_capacity)
+        values = np.memmap(self._file('prices', generation), dtype=np.float64, mode='w+', shape=shape)
+        mask = np.memmap(self._file('mask', generation), dtype=np.bool_, mode='w+', shape=shape)
+        values[:] = np.nan
+        mask[:] = False
+
+        if old_meta:
+            n_tickers = len(old_meta['tickers'])
+            offset = (pd.Timestamp(old_meta['start']) - start).days
+            src_from = max(0, -offset)
+            src_to = min(old_meta['n_days'], n_days - offset)
+            if src_to > src_from:
+                dst = slice(src_from + offset, src_to + offset)
+                values[:n_tickers, dst] = old_values[:n_tickers, src_from:src_to]
+                mask[:n_tickers, dst] = old_mask[:n_tickers, src_from:src_to]
+            self._stale_files += [self._file('prices', old_meta['generation']),
+                                  self._file('mask', old_meta['generation'])]
+            meta = dict(old_meta)
+        else:
+            meta = {'tickers': [], 'last_date': {}}
+
+        meta.update({
+            'generation': generation,
+            'start': start.strftime('%Y-%m-%d'),
+            'n_days': n_days,
+            'day_capacity': day_capacity,
+            'ticker_capacity': ticker_capacity,
+        })
+        self.meta, self.values, self.mask = meta, values, mask
+        return old_meta
+
+    def commit(self):
+        """Сбрасывает матрицы на диск и атомарно публикует новые метаданные."""
+        if self.meta is None:
+            return
+        self.values.flush()
+        self.mask.flush()
+        meta_path = os.path.join(self.path, self.META_FILE)
+        tmp_path = meta_path + '.tmp'
+        with open(tmp_path, 'w') as file:
+            json.dump(self.meta, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, meta_path)
+        for path in self._stale_files:
+            if os.path.exists(path):
+                os.remove(path)
+        self._stale_files = []
+
+    # --- календарь ---
+
+    def _column(self, date):
+        return (pd.Timestamp(date).normalize() - self.start).days
+
+    def ensure_range(self, start, end):
+        """Расширяет календарь так, чтобы он покрывал [start, end]."""
+        start = pd.Timestamp(start).normalize()
+        end = pd.Timestamp(end).normalize()
+        if self.meta is None:
+            n_days = (end - start).days + 1
+            self._allocate(start, n_days, n_days + self.DAY_SLACK, self.MIN_TICKER_CAPACITY)
+            return
+
+        n_tickers = len(self.tickers)
+        if start < self.start:
+            n_days = self.n_days + (self.start - start).days
+            self._allocate(start, n_days, n_days + self.DAY_SLACK, self.meta['ticker_capacity'])
+            for i in range(n_tickers):
+                self._fill_row(i)
+
+        old_n_days = self.n_days
+        n_days = self._column(end) + 1
+        if n_days > old_n_days:
+            if n_days > self.meta['day_capacity']:
+                self._allocate(self.start, n_days, n_days + self.DAY_SLACK, self.meta['ticker_capacity'])
+            self.meta['n_days'] = n_days
+            # Новые дни заполняются последним известным значением (ffill)
+            self.values[:n_tickers, old_n_days:n_days] = self.values[:n_tickers, old_n_days - 1:old_n_days]
+
+    def trim(self, start):
+        """Удаляет дни до start, переписывая матрицу в новое поколение файлов."""
+        start = pd.Timestamp(start).normalize()
+        if self.meta is None or start <= self.start:
+            return
+        n_days = max(self.n_days - (start - self.start).days, 1)
+        self._allocate(start, n_days, n_days + self.DAY_SLACK, self.meta['ticker_capacity'])
+        for i in range(len(self.tickers)):
+            self._fill_row(i)
+
+    # --- запись ---
+
+    def _row(self, ticker):
+        if ticker in self._index:
+            return self._index[ticker]
+        i = len(self.meta['tickers'])
+        if i >= self.meta['ticker_capacity']:
+            self._allocate(self.start, self.n_days, self.meta['day_capacity'], 2 * self.meta['ticker_capacity'])
+        self.meta['tickers'].append(ticker)
+        self._index[ticker] = i
+        return i
+
+    def _fill_row(self, i):
+        n = self.n_days
+        row = self.values[i, :n]
+        observed = self.mask[i, :n]
+        if not observed.any():
+            row[:] = np.nan
+            return
+        idx = np.where(observed, np.arange(n), -1)
+        np.maximum.accumulate(idx, out=idx)
+        idx[idx < 0] = np.argmax(observed)
+        row[:] = row[idx]
+
+    def write(self, ticker, series):
+        """
+        Записывает наблюдения тикера в хранилище (новые значения перекрывают старые).
+        :param ticker: Тикер
+        :param series: pd.Series цен закрытия с датами в индексе
+        """
+        series = series.dropna()
+        if series.empty:
+            return
+        index = pd.DatetimeIndex(series.index)
+        if index.tz is not None:
+            index = index.tz_convert(None)
+        series = pd.Series(series.values, index=index.normalize())
+        series = series.loc[~series.index.duplicated(keep='first')].sort_index()
+
+        existed = ticker in self._index
+        calendar = (self.start, self.start + pd.Timedelta(days=self.n_days)) if self.exists else None
+        self.ensure_range(series.index[0], series.index[-1])
+
+        i = self._row(ticker)
+        columns = (series.index - self.start).days
+        rewritten = None
+        if existed and calendar is not None:
+            # Дни, уже бывшие в календаре, у которых меняется значение (в том числе заполненное ffill)
+            inside = (series.index >= calendar[0]) & (series.index < calendar[1])
+            before = self.values[i, columns[inside]]
+            changed = np.isnan(before) | (before != series.values[inside])
+            if changed.any():
+                rewritten = series.index[inside][changed][0]
+        self.values[i, columns] = series.values
+        self.mask[i, columns] = True
+        self._fill_row(i)
+
+        # Счётчик записей: правка цен за уже сохранённые даты тоже меняет содержимое хранилища
+        self.meta['revision'] = self.meta.get('revision', 0) + 1
+        if rewritten is not None:
+            log = self.meta.setdefault('rewrites', [])
+            log.append([self.meta['revision'], rewritten.strftime('%Y-%m-%d')])
+            if len(log) > self.REWRITE_LOG:
+                # Записи до этой версии забыты: для более старых версий rewritten_since не знает дат
+                self.meta['rewrites_from'] = log[-self.REWRITE_LOG - 1][0]
+                del log[:-self.REWRITE_LOG]
+        last = series.index[-1]
+        previous = self.last_date(ticker)
+        if previous is None or last > previous:
+            self.meta['last_date'][ticker] = last.strftime('%Y-%m-%d')
+
+    @property
+    def revision(self):
+        return (self.meta or {}).get('revision', 0)
+
+    def rewritten_since(self, revision):
+        """
+        Самая ранняя дата, значение которой изменилось после версии revision
+        (None — с тех пор только дописывались новые дни и тикеры).
+        """
+        meta = self.meta or {}
+        if revision < meta.get('rewrites_from', 0):
+            return self.start
+        dates = [date for logged, date in meta.get('rewrites', []) if logged > revision]
+        return pd.Timestamp(min(dates)) if dates else None
+
+    # --- чтение ---
+
+    def _window(self, start, end):
+        first = 0 if start is None else self._column(start)
+        last = self.n_days if end is None else self._column(end) + 1
+        if first < 0 or last > self.n_days:
+            raise KeyError(f"Диапазон {start} - {end} вне календаря хранилища")
+        return first, last
+
+    def frame(self, ticker, start=None, end=None):
+        """Возвращает DataFrame с колонкой Close без копирования данных (view на memmap)."""
+        i = self._index[ticker]
+        first, last = self._window(start, end)
+        view = self.values[i:i + 1, first:last].T.view(np.ndarray)
+        view.flags.writeable = False
+        return pd.DataFrame(view, index=self.dates[first:last], columns=['Close'], copy=False)
+
+    def matrix(self, tickers=None, start=None, end=None):
+        """
+        Возвращает выровненную матрицу цен (тикеры × дни), маску наблюдений и даты.
+        Для всех тикеров хранилища результат — view, для подмножества — копия.
+        """
+        first, last = self._window(start, end)
+        if tickers is None:
+            rows = slice(0, len(self.tickers))
+        else:
+            rows = [self._index[ticker] for ticker in tickers]
+        values = self.values[rows, first:last].view(np.ndarray)
+        mask = self.mask[rows, first:last].view(np.ndarray)
+        return values, mask, self.dates[first:last]
+
+
+def read_price_csv(data_path):
+    data = pd.read_csv(data_path, index_col='Date', parse_dates=True)
+    return data['Close'] if 'Close' in data.columns else data.iloc[:, 0]
+
+
+def import_csv_dir(store, data_dir, tickers=None):
+    """
+    Импортирует файлы data/<TICKER>.csv в хранилище одним проходом.
+    :param store: PriceStore
+    :param data_dir: Каталог с CSV
+    :param tickers: Список тикеров для импорта (по умолчанию все файлы каталога)
+    :return: Список импортированных тикеров
+    """
+    imported = []
+    for data_path in sorted(glob.glob(os.path.join(data_dir, '*.csv'))):
+        ticker = os.path.splitext(os.path.basename(data_path))[0]
+        if ticker in store or (tickers is not None and ticker not in tickers):
+            continue
+        store.write(ticker, read_price_csv(data_path))
+        imported.append(ticker)
+    store.commit()
+    return imported
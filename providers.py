@@ -0,0 +1,195 @@
+import logging
+import os
+
+import pandas as pd
+
+from instrumentation import METRICS
+from price_store import read_price_csv
+
+logger = logging.getLogger('finlogic.providers')
+
+
+class YFinanceProvider:
+    """Поставщик котировок через yfinance (импортируется при первом запросе)."""
+
+    def download(self, tickers, start, end=None):
+        """
+        Загружает цены закрытия.
+        :param tickers: Список тикеров
+        :param start: Начальная дата (включительно)
+        :param end: Конечная дата (не включительно, как в yf.download)
+        :return: DataFrame цен закрытия, колонки — тикеры
+        """
+        import yfinance as yf
+        METRICS.incr('provider_requests_total', method='download')
+        METRICS.incr('provider_tickers_total', len(tickers), method='download')
+        data = yf.download(tickers, start=start, end=end, progress=False)['Close']
+        if isinstance(data, pd.Series):
+            data = data.to_frame(tickers[0])
+        return data
+
+    def info(self, ticker):
+        import yfinance as yf
+        METRICS.incr('provider_requests_total', method='info')
+        info = yf.Ticker(ticker).info
+        return {'marketCap': info.get('marketCap'), 'volume': info.get('volume')}
+
+    def last_price(self, ticker):
+        import yfinance as yf
+        METRICS.incr('provider_requests_total', method='last_price')
+        return float(yf.Ticker(ticker).history(period="1d")['Close'].iloc[-1])
+
+
+class CSVProvider:
+    """Локальная замена yfinance: отдаёт котировки из каталога с файлами <TICKER>.csv."""
+
+    def __init__(self, data_dir, fundamentals=None):
+        self.data_dir = data_dir
+        self.fundamentals = fundamentals or {}
+        self.calls = []
+
+    def download(self, tickers, start, end=None):
+        self.calls.append((list(tickers), start, end))
+        columns = {}
+        for ticker in tickers:
+            data_path = os.path.join(self.data_dir, f'{ticker}.csv')
+            if not os.path.exists(data_path):
+                continue
+            series = read_price_csv(data_path)
+            series = series.loc[~series.index.duplicated(keep='first')]
+            series = series[series.index >= pd.Timestamp(start)]
+            if end is not None:
+                series = series[series.index < pd.Timestamp(end)]
+            columns[ticker] = series
+        if not columns:
+            return pd.DataFrame()
+        return pd.DataFrame(columns)
+
+    def info(self, ticker):
+        self.calls.append(('info', ticker))
+        if ticker not in self.fundamentals:
+            raise KeyError(f"Нет фундаментальных данных для {ticker}")
+        return dict(self.fundamentals[ticker])
+
+    def last_price(self, ticker):
+        self.calls.append(('price', ticker))
+        return float(read_price_csv(os.path.join(self.data_dir, f'{ticker}.csv')).iloc[-1])
+
+
+class FrameProvider:
+    """
+    Поставщик котировок из таблицы цен в памяти (даты × тикеры), например синтетической
+    вселенной для бенчмарков и офлайн-тестов. Как и CSVProvider, записывает вызовы.
+    """
+
+    def __init__(self, prices, fundamentals=None):
+        self.prices = prices.sort_index()
+        self.fundamentals = fundamentals or {}
+        self.calls = []
+
+    def download(self, tickers, start, end=None):
+        self.calls.append((list(tickers), start, end))
+        columns = [ticker for ticker in tickers if ticker in self.prices.columns]
+        index = self.prices.index
+        rows = index >= pd.Timestamp(start)
+        if end is not None:
+            rows &= index < pd.Timestamp(end)
+        return self.prices.loc[rows, columns].dropna(how='all')
+
+    def info(self, ticker):
+        self.calls.append(('info', ticker))
+        if ticker not in self.fundamentals:
+            raise KeyError(f"Нет фундаментальных данных для {ticker}")
+        return dict(self.fundamentals[ticker])
+
+    def last_price(self, ticker):
+        self.calls.append(('price', ticker))
+        return float(self.prices[ticker].dropna().iloc[-1])
+
+
+def fetch_batches(download, tickers, batch_size=50, retry_empty=True):
+    """
+    Загружает тикеры пакетами ограниченного размера и разбивает результат по тикерам.
+    Если пакет упал целиком или часть тикеров вернулась пустой, они загружаются повторно по одному.
+    :param download: Функция download(tickers) -> DataFrame цен закрытия
+    :param tickers: Список тикеров
+    :param batch_size: Максимальный размер пакета
+    :param retry_empty: Повторять ли по одному тикеры, вернувшиеся из пакета пустыми
+    :return: Словарь {тикер: pd.Series}
+    """
+    results = {}
+    retry = []
+    for i in range(0, len(tickers), batch_size):
+        batch = list(tickers[i:i + batch_size])
+        try:
+            with METRICS.timer('download_seconds', kind='batch'):
+                data = download(batch)
+        except Exception as e:
+            logger.warning(f"Ошибка пакетной загрузки {batch}: {e}")
+            if len(batch) > 1:
+                retry += batch
+            continue
+        for ticker in batch:
+            series = data[ticker].dropna() if ticker in data.columns else None
+            if series is not None and not series.empty:
+                results[ticker] = series
+            elif retry_empty and len(batch) > 1:
+                retry.append(ticker)
+
+    for ticker in retry:
+        logger.info(f"Повторная загрузка {ticker}...")
+        try:
+            with METRICS.timer('download_seconds', kind='retry'):
+                data = download([ticker])
+        except Exception as e:
+            logger.warning(f"Ошибка при загрузке тикера {ticker}: {e}")
+            continue
+        if ticker in data.columns and not data[ticker].dropna().empty:
+            results[ticker] = data[ticker].dropna()
+    return results
+
+
+def update_store(store, provider, tickers, end, keep_from=None, trim_slack=30, batch_size=50):
+    """
+    Дозагружает в хранилище только недостающий хвост истории каждого тикера.
+    Тикеры с одинаковой датой начала хвоста загружаются общими пакетами.
+    :param store: PriceStore
+    :param provider: Поставщик котировок с методом download
+    :param tickers: Тикеры, уже имеющиеся в хранилище
+    :param end: Конечная дата загрузки (не включительно)
+    :param keep_from: Дата, раньше которой строки удаляются из хранилища
+    :param trim_slack: Сколько устаревших дней допускается до перезаписи матрицы
+    :param batch_size: Максимальный размер пакета загрузки
+    :return: Словарь {тикер: число добавленных строк}
+    """
+    end = pd.Timestamp(end).normalize()
+    appended = {}
+    by_start = {}
+    for ticker in tickers:
+        last = store.last_date(ticker)
+        if last is None:
+            continue
+        start = last + pd.Timedelta(days=1)
+        if start >= end:
+            appended[ticker] = 0
+        else:
+            by_start.setdefault(start, []).append(ticker)
+
+    for start, group in sorted(by_start.items()):
+        logger.info(f"Дозагрузка {group} с {start.strftime('%Y-%m-%d')}...")
+        download = lambda batch, start=start: provider.download(
+            batch, start=start.strftime('%Y-%m-%d'), end=end.strftime('%Y-%m-%d'))
+        # Пустой хвост — нормальная ситуация (выходные), повторять его не нужно
+        fetched = fetch_batches(download, group, batch_size, retry_empty=False)
+        for ticker in group:
+            series = fetched.get(ticker, pd.Series(dtype=float))
+            series = series[series.index >= start]
+            store.write(ticker, series)
+            appended[ticker] = len(series)
+
+    if keep_from is not None and store.exists:
+        # Матрица переписывается целиком, поэтому обрезка выполняется не каждый день
+        if (pd.Timestamp(keep_from).normalize() - store.start).days > trim_slack:
+            store.trim(keep_from)
+    store.commit()
+    return appended
@@ -0,0 +1,130 @@
+import numpy as np
+import pandas as pd
+
+
+def right_align(prices, mask=None):
+    """
+    Сдвигает наблюдения каждой строки вправо с сохранением порядка, слева остаются NaN.
+    Так у всех тикеров последний столбец — последнее наблюдение, независимо от календаря торгов.
+    :param prices: Матрица цен (тикеры × дни), пропуски — NaN
+    :param mask: Маска реальных наблюдений (по умолчанию ~isnan)
+    """
+    prices = np.asarray(prices, dtype=np.float64)
+    observed = ~np.isnan(prices) if mask is None else (np.asarray(mask) & ~np.isnan(prices))
+    order = np.argsort(observed, axis=1, kind='stable')
+    aligned = np.take_along_axis(np.where(observed, prices, np.nan), order, axis=1)
+    return aligned, observed.sum(axis=1)
+
+
+def rolling_sma(prices, window):
+    """Скользящее среднее через кумулятивные суммы, NaN пока в окне меньше window наблюдений."""
+    valid = ~np.isnan(prices)
+    sums = np.cumsum(np.where(valid, prices, 0.0), axis=1)
+    counts = np.cumsum(valid, axis=1)
+    sums = np.concatenate([np.zeros((prices.shape[0], 1)), sums], axis=1)
+    counts = np.concatenate([np.zeros((prices.shape[0], 1), dtype=counts.dtype), counts], axis=1)
+    sma = np.full(prices.shape, np.nan)
+    if prices.shape[1] >= window:
+        window_sums = sums[:, window:] - sums[:, :-window]
+        window_counts = counts[:, window:] - counts[:, :-window]
+        sma[:, window - 1:] = np.where(window_counts == window, window_sums / window, np.nan)
+    return sma
+
+
+def wilder_rsi(prices, window=14):
+    """
+    RSI со сглаживанием Уайлдера (ewm с alpha=1/window, adjust=False), как ta.momentum.rsi.
+    Строки должны быть выровнены вправо (см. right_align).
+    """
+    n_tickers, n_days = prices.shape
+    diff = np.diff(prices, axis=1, prepend=np.nan)
+    diff = np.where(np.isnan(diff), 0.0, diff)
+    up = np.maximum(diff, 0.0)
+    down = np.maximum(-diff, 0.0)
+    counts = np.cumsum(~np.isnan(prices), axis=1)
+
+    alpha = 1.0 / window
+    avg_up = np.zeros(n_tickers)
+    avg_down = np.zeros(n_tickers)
+    rsi = np.full(prices.shape, np.nan)
+    for t in range(n_days):
+        avg_up = (1 - alpha) * avg_up + alpha * up[:, t]
+        avg_down = (1 - alpha) * avg_down + alpha * down[:, t]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            value = np.where(avg_down == 0, 100.0, 100.0 - 100.0 / (1.0 + avg_up / avg_down))
+        rsi[:, t] = np.where(counts[:, t] >= window, value, np.nan)
+    return rsi
+
+
+def wilder_rsi_last(prices, window=14):
+    """
+    Последнее значение wilder_rsi без прохода по времени: при нулевом начальном состоянии
+    ewm с adjust=False равен свёртке с весами alpha * (1 - alpha) ** (T - t).
+    """
+    n_days = prices.shape[1]
+    diff = np.diff(prices, axis=1, prepend=np.nan)
+    diff = np.where(np.isnan(diff), 0.0, diff)
+    weights = (1.0 / window) * (1 - 1.0 / window) ** np.arange(n_days - 1, -1, -1)
+    avg_up = np.maximum(diff, 0.0) @ weights
+    avg_down = np.maximum(-diff, 0.0) @ weights
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rsi = np.where(avg_down == 0, 100.0, 100.0 - 100.0 / (1.0 + avg_up / avg_down))
+    return np.where((~np.isnan(prices)).sum(axis=1) >= window, rsi, np.nan)
+
+
+def sortino_ratio(prices):
+    """
+    Коэффициент Сортино по каждой строке: средняя дневная доходность, делённая на
+    стандартное отклонение (ddof=1) отрицательных доходностей.
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        returns = prices[:, 1:] / prices[:, :-1] - 1
+        valid = ~np.isnan(returns)
+        returns[~valid] = 0.0
+        mean = returns.sum(axis=1) / valid.sum(axis=1)
+
+        # Маскированная нижняя полудисперсия: только отрицательные доходности
+        downside = np.minimum(returns, 0.0)
+        n_down = (downside < 0).sum(axis=1)
+        sum_down = downside.sum(axis=1)
+        squares = np.einsum('ij,ij->i', downside, downside) - sum_down ** 2 / n_down
+        downside_std = np.sqrt(np.maximum(squares, 0.0) / (n_down - 1))
+        ratio = mean / downside_std
+    return np.where((n_down > 1) & (downside_std > 0), ratio, np.nan)
+
+
+def screen(prices, mask=None, tickers=None, dates=None, sma_short=50, sma_long=200, rsi_window=14):
+    """
+    Считает Сортино, SMA_50, SMA_200 и RSI для всех тикеров за один проход.
+    :param prices: Выровненная матрица цен (тикеры × дни)
+    :param mask: Маска реальных наблюдений (например, из PriceStore.matrix)
+    :param tickers: Имена строк
+    :param dates: Даты столбцов, нужны для колонки first_date
+    :return: DataFrame с метриками по последнему наблюдению каждого тикера
+    """
+    aligned, n_obs = right_align(prices, mask)
+    metrics = pd.DataFrame({
+        'n_obs': n_obs,
+        'sortino': sortino_ratio(aligned),
+        f'SMA_{sma_short}': rolling_sma(aligned[:, -sma_short:], sma_short)[:, -1] if aligned.shape[1] else np.nan,
+        f'SMA_{sma_long}': rolling_sma(aligned[:, -sma_long:], sma_long)[:, -1] if aligned.shape[1] else np.nan,
+        'RSI': wilder_rsi_last(aligned, rsi_window) if aligned.shape[1] else np.nan,
+    }, index=tickers)
+    if dates is not None:
+        observed = ~np.isnan(prices) if mask is None else np.asarray(mask)
+        first = np.argmax(observed, axis=1)
+        metrics['first_date'] = pd.DatetimeIndex(dates)[first].where(n_obs > 0)
+    return metrics
+
+
+def select(metrics, start_date=None, rsi_limit=70):
+    """
+    Отбор по правилам get_top_4_by_sortino: история с начала окна, SMA_50 > SMA_200, RSI < 70.
+    :return: Отобранные строки, отсортированные по убыванию Сортино
+    """
+    keep = np.isfinite(metrics['sortino'].values)
+    keep &= (metrics['SMA_50'] > metrics['SMA_200']).values
+    keep &= (metrics['RSI'] < rsi_limit).values
+    if start_date is not None and 'first_date' in metrics:
+        keep &= (metrics['first_date'] <= pd.Timestamp(start_date) + pd.Timedelta(days=5)).values
+    return metrics[keep].sort_values('sortino', ascending=False)
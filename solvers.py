@@ -0,0 +1,434 @@
+import logging
+import time
+
+import cvxpy as cp
+import numpy as np
+
+from instrumentation import METRICS
+
+logger = logging.getLogger('finlogic.solvers')
+
+# Порядок выбора точного решателя для backend='auto': Gurobi при наличии лицензии,
+# иначе открытые решатели, умеющие целочисленные задачи с конусом второго порядка
+MIP_SOLVERS = ['GUROBI', 'SCIP', 'ECOS_BB']
+CONTINUOUS_SOLVERS = ['CLARABEL', 'ECOS', 'SCS']
+
+
+def risk_factor(cov_matrix):
+    """Матрица F, для которой ||F x||^2 = x' cov x (ковариация может быть вырожденной)."""
+    cov_matrix = (np.asarray(cov_matrix) + np.asarray(cov_matrix).T) / 2
+    eigenvalues, eigenvectors = np.linalg.eigh(cov_matrix)
+    return (eigenvectors * np.sqrt(np.clip(eigenvalues, 0, None))).T
+
+
+def pick_solver(candidates):
+    installed = cp.installed_solvers()
+    for solver in candidates:
+        if solver in installed:
+            return solver
+    raise RuntimeError(f"Не установлен ни один из решателей: {candidates}")
+
+
+class SolveResult:
+    def __init__(self, status, solver, quantities, objective, bound=None, timings=None, leftover=None):
+        self.status = status
+        self.solver = solver
+        self.quantities = quantities
+        self.objective = objective
+        self.bound = bound
+        self.timings = timings or {}
+        self.leftover = leftover  # Нераспределённый остаток бюджета, $
+
+    @property
+    def gap(self):
+        """Относительный разрыв до верхней оценки непрерывной релаксации."""
+        if self.bound is None or self.objective is None:
+            return None
+        return max(self.bound - self.objective, 0.0) / max(abs(self.bound), 1e-12)
+
+    @property
+    def optimal(self):
+        return self.status in (cp.OPTIMAL, cp.OPTIMAL_INACCURATE)
+
+    def to_dict(self):
+        return {'status': self.status, 'solver': self.solver, 'objective': self.objective,
+                'bound': self.bound, 'gap': self.gap, 'leftover': self.leftover, 'timings': dict(self.timings)}
+
+
+class AllocationProblem:
+    """
+    Задача распределения бюджета из optimize_portfolio: целое число акций, дробные
+    криптовалюты, минимальная сумма позиции и ограничение риска.
+
+    Модель строится один раз для размера (n_stocks, n_crypto), а цены, доходности,
+    ковариация, бюджет и минимальный лот передаются через cp.Parameter, поэтому
+    повторные решения не проходят канонизацию заново.
+    """
+
+    def __init__(self, n_stocks, n_crypto):
+        self.n_stocks = n_stocks
+        self.n_crypto = n_crypto
+        n = n_stocks + n_crypto
+        self.mean_returns = cp.Parameter(n)
+        self.prices = cp.Parameter(n, nonneg=True)
+        self.risk_factor = cp.Parameter((n, n))
+        self.budget = cp.Parameter(nonneg=True)
+        self.min_lot = cp.Parameter(nonneg=True)
+        self.risk_tolerance = cp.Parameter(nonneg=True)
+
+        start = time.perf_counter()
+        self.shares, self.problem = self._build(integer=True)
+        self.relaxed_shares, self.relaxed = self._build(integer=False)
+        self.repair = None  # Строится при первом вызове эвристики
+        self.solves = 0
+        self.build_time = time.perf_counter() - start
+
+    def _build(self, integer):
+        parts = []
+        if self.n_stocks:
+            parts.append(cp.Variable(self.n_stocks, integer=integer))
+        if self.n_crypto:
+            parts.append(cp.Variable(self.n_crypto))
+        shares = cp.hstack(parts) if len(parts) > 1 else parts[0]
+        n = self.n_stocks + self.n_crypto
+        if integer:
+            binary = cp.Variable(n, boolean=True)
+            binary_constraints = []
+        else:
+            binary = cp.Variable(n)
+            binary_constraints = [binary >= 0, binary <= 1]
+
+        constraints = binary_constraints + [
+            shares >= 0,
+            # Верхняя граница, если актив выбран: позиция не дороже бюджета (плотнее, чем big-M 1e6)
+            cp.multiply(self.prices, shares) <= self.budget * binary,
+            self.prices @ shares == self.budget,
+            cp.multiply(self.prices, shares) >= self.min_lot * binary,
+            cp.sum_squares(self.risk_factor @ shares) <= self.risk_tolerance,
+        ]
+        problem = cp.Problem(cp.Maximize(self.mean_returns @ shares), constraints)
+        return shares, problem
+
+    def set_data(self, mean_returns, cov_matrix, prices, budget, min_lot, risk_tolerance):
+        self.mean_returns.value = np.asarray(mean_returns, dtype=float)
+        self.prices.value = np.asarray(prices, dtype=float)
+        self.risk_factor.value = risk_factor(cov_matrix)
+        self.budget.value = float(budget)
+        self.min_lot.value = float(min_lot)
+        self.risk_tolerance.value = float(risk_tolerance)
+
+    def _solve_bound(self, timings):
+        start = time.perf_counter()
+        self.relaxed.solve(solver=pick_solver(CONTINUOUS_SOLVERS))
+        timings['bound'] = time.perf_counter() - start
+        return self.relaxed.value if self.relaxed.status in (cp.OPTIMAL, cp.OPTIMAL_INACCURATE) else None
+
+    def solve(self, backend='auto', warm_start=False, with_bound=True, **solver_options):
+        """
+        :param backend: 'auto' (Gurobi, SCIP, ECOS_BB, затем эвристика), 'heuristic'
+            или имя решателя cvxpy
+        :param warm_start: Начинать с предыдущего решения (если решатель это поддерживает)
+        :param with_bound: Считать верхнюю оценку релаксации для разрыва оптимальности
+        :return: SolveResult
+        """
+        if backend == 'heuristic':
+            return self._solve_heuristic(self._timings())
+        if backend != 'auto':
+            return self._solve_exact(backend, warm_start, with_bound, solver_options)
+
+        # Перебор установленных точных решателей, последний рубеж — эвристика
+        installed = cp.installed_solvers()
+        for solver in [solver for solver in MIP_SOLVERS if solver in installed]:
+            result = self._solve_exact(solver, warm_start, with_bound, solver_options)
+            if result.optimal:
+                return result
+            logger.warning(f"Решатель {solver} не нашёл решение ({result.status}), пробуем следующий...")
+        return self._solve_heuristic(self._timings())
+
+    def _timings(self):
+        # Время построения модели учитывается только в первом решении
+        timings = {'build': self.build_time if self.solves == 0 else 0.0}
+        self.solves += 1
+        return timings
+
+    def _solve_exact(self, solver, warm_start, with_bound, solver_options):
+        timings = self._timings()
+        start = time.perf_counter()
+        try:
+            self.problem.solve(solver=solver, warm_start=warm_start, **solver_options)
+            status = self.problem.status
+        except cp.SolverError as e:
+            logger.warning(f"Ошибка решателя {solver}: {e}")
+            status = 'solver_error'
+        timings['solve'] = time.perf_counter() - start
+
+        quantities = self.shares.value if status in (cp.OPTIMAL, cp.OPTIMAL_INACCURATE) else None
+        if quantities is not None:
+            quantities = self._clean(quantities)
+        objective = self._objective(quantities) if quantities is not None else None
+        bound = self._solve_bound(timings) if with_bound and quantities is not None else None
+        return self._record(SolveResult(status, solver, quantities, objective, bound, timings))
+
+    def _objective(self, quantities):
+        """Значение целевой функции модели на quantities (сравнимо с оценкой релаксации)."""
+        return float(self.mean_returns.value @ quantities)
+
+    def _clean(self, quantities):
+        quantities = np.clip(np.asarray(quantities, dtype=float), 0, None)
+        quantities[:self.n_stocks] = np.round(quantities[:self.n_stocks])
+        return quantities
+
+    def _build_repair(self):
+        n = self.n_stocks + self.n_crypto
+        self.lower = cp.Parameter(n, nonneg=True)
+        self.upper = cp.Parameter(n, nonneg=True)
+        shares = cp.Variable(n)
+        constraints = [
+            shares >= self.lower,
+            shares <= self.upper,
+            self.prices @ shares == self.budget,
+            cp.sum_squares(self.risk_factor @ shares) <= self.risk_tolerance,
+        ]
+        return shares, cp.Problem(cp.Maximize(self.mean_returns @ shares), constraints)
+
+    def _risk(self, quantities):
+        return float(np.sum((self.risk_factor.value @ quantities) ** 2))
+
+    def _solve_heuristic(self, timings):
+        """
+        Быстрый путь для больших вселенных: непрерывная релаксация, акции округляются
+        вниз, затем при зафиксированных акциях доли криптовалют пересчитываются
+        выпуклой задачей, а остаток бюджета докупается целыми акциями в пределах риска.
+        """
+        start = time.perf_counter()
+        bound = self._solve_bound(timings)
+        relaxed = self.relaxed_shares.value
+        if bound is None:
+            timings['solve'] = time.perf_counter() - start
+            return self._record(SolveResult(self.relaxed.status, 'heuristic', None, None, None, timings))
+
+        prices = self.prices.value
+        mean_returns = self.mean_returns.value
+        budget = self.budget.value
+        min_lot = self.min_lot.value
+        quantities = np.clip(relaxed, 0, None)
+        quantities[:self.n_stocks] = np.floor(quantities[:self.n_stocks] + 1e-9)
+        # Позиции меньше минимального лота не покупаются
+        quantities[quantities * prices < min_lot - 1e-9] = 0
+
+        if self.n_crypto:
+            if self.repair is None:
+                self.repair_shares, self.repair = self._build_repair()
+            crypto = slice(self.n_stocks, None)
+            held = quantities[crypto] > 0
+            self.lower.value = np.concatenate([quantities[:self.n_stocks], np.zeros(self.n_crypto)])
+            # Сначала только криптовалюты из релаксации, при неудаче — все
+            for allowed in ([held] if held.any() else []) + [np.ones(self.n_crypto, dtype=bool)]:
+                upper = budget / prices
+                upper[:self.n_stocks] = quantities[:self.n_stocks]
+                upper[crypto] = np.where(allowed, upper[crypto], 0.0)
+                self.upper.value = upper
+                self.repair.solve(solver=pick_solver(CONTINUOUS_SOLVERS))
+                if self.repair.status in (cp.OPTIMAL, cp.OPTIMAL_INACCURATE):
+                    quantities[crypto] = np.clip(self.repair_shares.value[crypto], 0, None)
+                    break
+            quantities[quantities * prices < min_lot - 1e-9] = 0
+
+        # Остаток бюджета — целыми акциями с лучшей доходностью, пока позволяет риск
+        leftover = budget - prices @ quantities
+        for i in np.argsort(-mean_returns[:self.n_stocks]):
+            while leftover >= prices[i] and mean_returns[i] > 0:
+                candidate = quantities.copy()
+                candidate[i] += 1
+                if candidate[i] * prices[i] < min_lot or self._risk(candidate) > self.risk_tolerance.value:
+                    break
+                quantities, leftover = candidate, leftover - prices[i]
+
+        timings['solve'] = time.perf_counter() - start
+        objective = self._objective(quantities)
+        if leftover > 1e-6 * budget:
+            logger.warning(f"Эвристика не распределила {leftover:.2f} из бюджета {budget:.2f}")
+        return self._record(SolveResult('heuristic', 'heuristic', quantities, objective, bound, timings))
+
+    def leftover(self, quantities):
+        """Часть бюджета, не потраченная на позиции quantities, $."""
+        return max(float(self.budget.value - self.prices.value @ quantities), 0.0)
+
+    def _record(self, result):
+        if result.quantities is not None:
+            result.leftover = self.leftover(result.quantities)
+        METRICS.incr('solver_solves_total', solver=result.solver, status=result.status)
+        for phase, seconds in result.timings.items():
+            METRICS.observe('solver_seconds', seconds, solver=result.solver, phase=phase)
+        if result.objective is not None:
+            METRICS.gauge('solver_objective', result.objective, solver=result.solver)
+        if result.gap is not None:
+            METRICS.gauge('solver_gap', result.gap, solver=result.solver)
+        return result
+
+
+class RebalanceProblem(AllocationProblem):
+    """
+    Ребалансировка от текущих позиций: переменные — итоговые количества, но бюджет,
+    комиссия и штраф за оборот считаются по сделкам (разнице с позициями holdings).
+    Новые деньги budget можно не тратить полностью: остаток остаётся в кэше, а
+    продажи пополняют его. Покупать можно только разрешённые активы (can_buy),
+    остальные позиции только держатся или продаются. Минимальный лот ограничивает
+    покупку, а не итоговую позицию: позиции меньше лота можно держать.
+    """
+
+    def __init__(self, n_stocks, n_crypto):
+        n = n_stocks + n_crypto
+        # Стоимость позиций задаётся параметром (а не prices * holdings), чтобы модель оставалась DPP
+        self.held_value = cp.Parameter(n, nonneg=True)
+        self.buy_limit = cp.Parameter(n, nonneg=True)
+        self.capital = cp.Parameter(nonneg=True)
+        self.cost = cp.Parameter(nonneg=True)
+        self.turnover_penalty = cp.Parameter(nonneg=True)
+        self.holdings = None
+        super().__init__(n_stocks, n_crypto)
+
+    def _build(self, integer):
+        parts = []
+        if self.n_stocks:
+            parts.append(cp.Variable(self.n_stocks, integer=integer))
+        if self.n_crypto:
+            parts.append(cp.Variable(self.n_crypto))
+        shares = cp.hstack(parts) if len(parts) > 1 else parts[0]
+        n = self.n_stocks + self.n_crypto
+        if integer:
+            binary = cp.Variable(n, boolean=True)
+            binary_constraints = []
+            self.start_parts, self.start_binary = parts, binary
+        else:
+            binary = cp.Variable(n)
+            binary_constraints = [binary >= 0, binary <= 1]
+
+        value = cp.multiply(self.prices, shares)
+        traded = cp.Variable(n, nonneg=True)  # Сумма сделки по активу, $
+        # binary — признак покупки: без него позицию можно только держать или уменьшать,
+        # с ним докупается не меньше минимального лота
+        constraints = binary_constraints + [
+            shares >= 0,
+            traded >= value - self.held_value,
+            traded >= self.held_value - value,
+            value - self.held_value <= self.buy_limit,
+            value - self.held_value <= self.capital * binary,
+            value - self.held_value >= self.min_lot * binary - cp.multiply(self.held_value, 1 - binary),
+            cp.sum(value) - cp.sum(self.held_value) + self.cost * cp.sum(traded) <= self.budget,
+            cp.sum_squares(self.risk_factor @ shares) <= self.risk_tolerance,
+        ]
+        objective = cp.Maximize(self.mean_returns @ shares - self.turnover_penalty * cp.sum(traded))
+        return shares, cp.Problem(objective, constraints)
+
+    def set_data(self, mean_returns, cov_matrix, prices, budget, min_lot, risk_tolerance,
+                 holdings=None, can_buy=None, cost=0.0, turnover_penalty=0.0):
+        """
+        :param holdings: Текущие количества (по умолчанию нули)
+        :param can_buy: Маска активов, которые можно докупать (по умолчанию все)
+        :param cost: Комиссия как доля суммы сделки
+        :param turnover_penalty: Штраф целевой функции за каждый $ оборота
+        """
+        super().set_data(mean_returns, cov_matrix, prices, budget, min_lot, risk_tolerance)
+        n = self.n_stocks + self.n_crypto
+        self.holdings = np.zeros(n) if holdings is None else np.asarray(holdings, dtype=float)
+        held_value = self.prices.value * self.holdings
+        self.held_value.value = held_value
+        self.capital.value = float(held_value.sum() + budget)
+        can_buy = np.ones(n, dtype=bool) if can_buy is None else np.asarray(can_buy, dtype=bool)
+        self.buy_limit.value = np.where(can_buy, self.capital.value, 0.0)
+        self.cost.value = float(cost)
+        self.turnover_penalty.value = float(turnover_penalty)
+
+    def start_from(self, quantities):
+        """Начальная точка для решателей с тёплым стартом (Gurobi): допустимые целые позиции."""
+        quantities = np.clip(np.asarray(quantities, dtype=float), 0, None)
+        quantities[:self.n_stocks] = np.round(quantities[:self.n_stocks])
+        offset = 0
+        for part in self.start_parts:
+            part.value = quantities[offset:offset + part.size]
+            offset += part.size
+        purchase = (quantities - self.holdings) * self.prices.value
+        self.start_binary.value = (purchase >= self.min_lot.value).astype(float)
+
+    def trades(self, quantities):
+        """:return: (сумма сделок в $, комиссия в $)"""
+        traded = float(np.abs(np.asarray(quantities) - self.holdings) @ self.prices.value)
+        return traded, traded * self.cost.value
+
+    def _objective(self, quantities):
+        # Как в модели: доходность за вычетом штрафа за оборот, иначе разрыв с релаксацией бессмыслен
+        traded, _ = self.trades(quantities)
+        return float(self.mean_returns.value @ quantities - self.turnover_penalty.value * traded)
+
+    def leftover(self, quantities):
+        """Новые деньги и выручка от продаж, оставшиеся в кэше после сделок и комиссии, $."""
+        _, commission = self.trades(quantities)
+        spent = float(self.prices.value @ quantities - self.held_value.value.sum())
+        return max(float(self.budget.value) - spent - commission, 0.0)
+
+    def _solve_heuristic(self, timings):
+        """
+        Непрерывная релаксация с округлением акций вниз: округление только уменьшает
+        покупки или увеличивает продажи, поэтому бюджет не нарушается. Покупки меньше
+        минимального лота отменяются (позиция остаётся прежней).
+        """
+        start = time.perf_counter()
+        bound = self._solve_bound(timings)
+        if bound is None:
+            timings['solve'] = time.perf_counter() - start
+            return self._record(SolveResult(self.relaxed.status, 'heuristic', None, None, None, timings))
+        quantities = np.clip(self.relaxed_shares.value, 0, None)
+        # Неизменные в релаксации позиции не должны теряться при округлении из-за точности решателя
+        unchanged = np.abs(quantities - self.holdings) < 1e-6
+        quantities[unchanged] = self.holdings[unchanged]
+        quantities[:self.n_stocks] = np.floor(quantities[:self.n_stocks] + 1e-9)
+        purchase = (quantities - self.holdings) * self.prices.value
+        small = (purchase > 0) & (purchase < self.min_lot.value - 1e-9)
+        quantities[small] = self.holdings[small]
+        timings['solve'] = time.perf_counter() - start
+        objective = self._objective(quantities)
+        return self._record(SolveResult('heuristic', 'heuristic', quantities, objective, bound, timings))
+
+
+_problems = {}
+
+
+def get_problem(n_stocks, n_crypto, rebalance=False):
+    """
+    Возвращает закэшированную модель нужного размера (строится один раз на процесс).
+    Без криптовалют равенство бюджета целыми акциями почти всегда недостижимо, поэтому
+    распределение решается моделью ребалансировки от пустого портфеля (бюджет «не больше»).
+    """
+    rebalance = rebalance or n_crypto == 0
+    key = (n_stocks, n_crypto, rebalance)
+    if key not in _problems:
+        _problems[key] = (RebalanceProblem if rebalance else AllocationProblem)(n_stocks, n_crypto)
+    return _problems[key]
+
+
+def solve_allocation(mean_returns, cov_matrix, prices, n_stocks, budget, min_lot, risk_tolerance,
+                     backend='auto', warm_start=False, with_bound=True):
+    """
+    Решает задачу распределения. Первые n_stocks активов — акции (целые лоты), остальные — криптовалюты.
+    Бюджет тратится полностью; если криптовалют нет — не больше бюджета (см. get_problem).
+    :return: SolveResult
+    """
+    problem = get_problem(n_stocks, len(prices) - n_stocks)
+    problem.set_data(mean_returns, cov_matrix, prices, budget, min_lot, risk_tolerance)
+    return problem.solve(backend, warm_start=warm_start, with_bound=with_bound)
+
+
+def solve_rebalance(mean_returns, cov_matrix, prices, n_stocks, holdings, budget, min_lot, risk_tolerance,
+                    can_buy=None, cost=0.0, turnover_penalty=0.0, backend='auto', warm_start=True, with_bound=True):
+    """
+    Ребалансировка: оптимизируются сделки относительно holdings, budget — новые деньги.
+    При warm_start решатель начинает с текущих позиций (предыдущего решения).
+    :return: SolveResult с итоговыми количествами
+    """
+    problem = get_problem(n_stocks, len(prices) - n_stocks, rebalance=True)
+    problem.set_data(mean_returns, cov_matrix, prices, budget, min_lot, risk_tolerance,
+                     holdings=holdings, can_buy=can_buy, cost=cost, turnover_penalty=turnover_penalty)
+    if warm_start:
+        problem.start_from(holdings)
+    return problem.solve(backend, warm_start=warm_start, with_bound=with_bound)
@@ -0,0 +1,127 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+
+from instrumentation import METRICS, record_response
+from ttl_cache import TTLCache
+
+logger = logging.getLogger('finlogic.sources')
+
+
+def parse_coinmarketcap(html):
+    """Тикеры из таблицы трендовых криптовалют CoinMarketCap (с суффиксом -USD)."""
+    soup = BeautifulSoup(html, 'html.parser')
+    table = soup.find('table')
+    if not table or not table.find('tbody'):
+        logger.warning("Error: Table not found.")
+        return []
+
+    tickers = []
+    for row in table.find('tbody').find_all('tr'):
+        ticker_element = row.select_one('td:nth-child(3) > a > div > div > div > p')
+        if ticker_element:
+            tickers.append(ticker_element.text.strip() + "-USD")
+    return tickers
+
+
+def parse_yahoo_table(html):
+    """Тикеры из колонки Symbol таблиц Yahoo Finance (trending, crypto, most-active)."""
+    soup = BeautifulSoup(html, 'html.parser')
+    table = soup.find('tbody')
+    if not table:
+        logger.warning("Error: Table with ID 'list-res-table' not found.")
+        return []
+
+    tickers = []
+    for row in table.find_all('tr'):
+        cell = row.find('td', {'aria-label': 'Symbol'})
+        if cell:
+            tickers.append(cell.text.strip())
+    return tickers
+
+
+class TickerSource:
+    def __init__(self, name, url, parser, title, timeout=10, retries=2):
+        self.name = name
+        self.url = url
+        self.parser = parser
+        self.title = title
+        self.timeout = timeout
+        self.retries = retries
+
+
+SOURCES = [
+    TickerSource('coinmarketcap', 'https://coinmarketcap.com/trending-cryptocurrencies/',
+                 parse_coinmarketcap, "трендовых криптовалют с CoinMarketCap"),
+    TickerSource('yahoo_trending', 'https://finance.yahoo.com/trending-tickers/',
+                 parse_yahoo_table, "трендовых акций с Yahoo Finance"),
+    TickerSource('yahoo_crypto', 'https://finance.yahoo.com/crypto?offset=0&count=100',
+                 parse_yahoo_table, "криптовалют с Yahoo Finance"),
+    TickerSource('yahoo_most_active', 'https://finance.yahoo.com/most-active?offset=0&count=100',
+                 parse_yahoo_table, "самых активных акций с Yahoo Finance"),
+]
+
+
+class SourceRegistry:
+    """
+    Реестр источников тикеров: общая сессия с пулом соединений, таймауты и повторы
+    для каждого источника и TTL-кэш разобранных списков. Ошибка одного источника
+    даёт пустой список и не мешает остальным.
+    """
+
+    USER_AGENT = 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36'
+
+    def __init__(self, sources=None, session=None, cache=None, ttl=3600):
+        self.sources = {source.name: source for source in (sources or SOURCES)}
+        self.session = session or self._make_session(len(self.sources))
+        self.cache = cache if cache is not None else TTLCache(ttl)
+
+    def _make_session(self, pool_size):
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        session.headers['User-Agent'] = self.USER_AGENT
+        session.hooks['response'].append(record_response)
+        return session
+
+    def fetch(self, name):
+        with METRICS.timer('source_seconds', source=name):
+            return self._fetch(name)
+
+    def _fetch(self, name):
+        source = self.sources[name]
+        cached = self.cache.get(f'tickers:{name}')
+        if cached is not None:
+            logger.debug(f"Тикеры {source.title} взяты из кэша.")
+            return cached
+
+        logger.info(f"Получение {source.title}...")
+        for attempt in range(source.retries + 1):
+            try:
+                response = self.session.get(source.url, timeout=source.timeout)
+                if response.status_code == 200:
+                    tickers = source.parser(response.content)
+                    logger.info(f"Тикеры {source.title}: {tickers}")
+                    # Пустой разбор (сбой вёрстки или страницы) не кэшируется, чтобы не скрыть источник на весь TTL
+                    if tickers:
+                        self.cache.set(f'tickers:{name}', tickers)
+                    return tickers
+                logger.warning(f"Error: Unable to fetch the page, status code: {response.status_code}")
+                if response.status_code < 500 and response.status_code != 429:
+                    return []
+            except requests.RequestException as e:
+                logger.warning(f"Ошибка запроса к {name}: {e}")
+            if attempt < source.retries:
+                time.sleep(0.5 * 2 ** attempt)
+        return []
+
+    def fetch_all(self, names=None):
+        """Загружает все источники параллельно, результат — словарь {имя: список тикеров}."""
+        names = list(names or self.sources)
+        with ThreadPoolExecutor(max_workers=len(names) or 1) as pool:
+            return dict(zip(names, pool.map(self.fetch, names)))
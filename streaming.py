@@ -0,0 +1,280 @@
+import argparse
+import asyncio
+import csv
+import inspect
+import logging
+import math
+from collections import deque
+from datetime import datetime
+
+from instrumentation import METRICS, run_session
+
+logger = logging.getLogger('finlogic.streaming')
+
+
+class RunningWindow:
+    """Сумма последних size значений: добавление за O(1)."""
+
+    def __init__(self, size):
+        self.values = deque(maxlen=size)
+        self.total = 0.0
+
+    def push(self, value):
+        if len(self.values) == self.values.maxlen:
+            self.total -= self.values[0]
+        self.values.append(value)
+        self.total += value
+
+    def __len__(self):
+        return len(self.values)
+
+
+class DownsideStats:
+    """
+    Суммы для коэффициента Сортино (как screening.sortino_ratio): число и сумма
+    доходностей, число, сумма и сумма квадратов отрицательных доходностей.
+    При заданном window старые доходности вычитаются при вытеснении.
+    """
+
+    def __init__(self, window=None):
+        self.returns = deque(maxlen=window) if window else None
+        self.n = 0
+        self.total = 0.0
+        self.n_down = 0
+        self.down = 0.0
+        self.down_squares = 0.0
+
+    def _apply(self, value, sign):
+        self.n += sign
+        self.total += sign * value
+        if value < 0:
+            self.n_down += sign
+            self.down += sign * value
+            self.down_squares += sign * value * value
+
+    def push(self, value):
+        if self.returns is not None:
+            if len(self.returns) == self.returns.maxlen:
+                self._apply(self.returns[0], -1)
+            self.returns.append(value)
+        self._apply(value, +1)
+
+    def ratio(self, extra=None):
+        """Сортино с учётом дополнительной (предварительной) доходности extra без её сохранения."""
+        n, total, n_down, down, squares = self.n, self.total, self.n_down, self.down, self.down_squares
+        if extra is not None:
+            if self.returns is not None and len(self.returns) == self.returns.maxlen:
+                oldest = self.returns[0]
+                n, total = n - 1, total - oldest
+                if oldest < 0:
+                    n_down, down, squares = n_down - 1, down - oldest, squares - oldest * oldest
+            n, total = n + 1, total + extra
+            if extra < 0:
+                n_down, down, squares = n_down + 1, down + extra, squares + extra * extra
+        if n == 0 or n_down < 2:
+            return math.nan
+        std = math.sqrt(max(squares - down * down / n_down, 0.0) / (n_down - 1))
+        return total / n / std if std > 0 else math.nan
+
+
+class TickerState:
+    """
+    Состояние индикаторов по тикеру: закрытые дневные бары хранятся в виде сумм окон
+    SMA, состояния EWM Уайлдера для RSI и сумм отрицательных доходностей. Текущий день —
+    предварительный бар: каждая котировка пересчитывает сигналы из закрытого состояния
+    и последней цены за O(1), а при смене дня цена закрытия фиксируется.
+    """
+
+    def __init__(self, ticker, sma_windows=(50, 200), rsi_window=14, sortino_window=None):
+        self.ticker = ticker
+        self.sma = {window: RunningWindow(window) for window in sma_windows}
+        self.rsi_window = rsi_window
+        self.alpha = 1.0 / rsi_window
+        self.avg_up = 0.0
+        self.avg_down = 0.0
+        self.downside = DownsideStats(sortino_window)
+        self.n_closes = 0
+        self.last_close = None
+        self.day = None
+        self.price = None
+        self.time = None
+
+    def commit(self, close):
+        """Фиксирует цену закрытия дня."""
+        if self.last_close is not None:
+            change = close - self.last_close
+            self.avg_up = (1 - self.alpha) * self.avg_up + self.alpha * max(change, 0.0)
+            self.avg_down = (1 - self.alpha) * self.avg_down + self.alpha * max(-change, 0.0)
+            self.downside.push(close / self.last_close - 1 if self.last_close else 0.0)
+        else:
+            self.avg_up *= 1 - self.alpha
+            self.avg_down *= 1 - self.alpha
+        for window in self.sma.values():
+            window.push(close)
+        self.n_closes += 1
+        self.last_close = close
+
+    def seed(self, closes, day=None):
+        """Начальное состояние по истории дневных закрытий (один проход при запуске)."""
+        for close in closes:
+            if close == close:  # Пропуски (NaN) не являются наблюдениями
+                self.commit(float(close))
+        self.day = day
+
+    def update(self, time, price):
+        """Котировка внутри дня; при переходе на новый день закрывает предыдущий."""
+        day = time.date()
+        if self.day is not None and day > self.day and self.price is not None:
+            self.commit(self.price)
+            self.price = None
+        if self.day is None or day >= self.day:
+            self.day = day
+            self.price = price
+            self.time = time
+
+    def signals(self):
+        """Сигналы с учётом предварительного бара (если котировки за день были)."""
+        price = self.price
+        n = self.n_closes + (price is not None)
+        result = {'ticker': self.ticker, 'time': self.time, 'price': price if price is not None else self.last_close,
+                  'provisional': price is not None}
+        for size, window in self.sma.items():
+            if price is None:
+                value = window.total / size if len(window) == size else math.nan
+            elif len(window) >= size - 1:
+                # Предварительная цена замещает самое старое закрытие окна
+                value = (window.total - (window.values[0] if len(window) == size else 0.0) + price) / size
+            else:
+                value = math.nan
+            result[f'SMA_{size}'] = value
+
+        avg_up, avg_down, extra = self.avg_up, self.avg_down, None
+        if price is not None:
+            change = price - self.last_close if self.last_close is not None else 0.0
+            avg_up = (1 - self.alpha) * avg_up + self.alpha * max(change, 0.0)
+            avg_down = (1 - self.alpha) * avg_down + self.alpha * max(-change, 0.0)
+            if self.last_close:
+                extra = price / self.last_close - 1
+        if n < self.rsi_window:
+            result['RSI'] = math.nan
+        else:
+            result['RSI'] = 100.0 if avg_down == 0 else 100.0 - 100.0 / (1.0 + avg_up / avg_down)
+        result['sortino'] = self.downside.ratio(extra)
+        return result
+
+
+class CSVReplayFeed:
+    """
+    Поток котировок из CSV (Timestamp, Ticker, Price) — замена реального источника
+    для тестов и отладки. delay — пауза между котировками в секундах.
+    """
+
+    def __init__(self, path, delay=0.0):
+        self.path = path
+        self.delay = delay
+
+    async def __aiter__(self):
+        with open(self.path, newline='') as file:
+            for row in csv.DictReader(file):
+                yield row['Ticker'], datetime.fromisoformat(row['Timestamp']), float(row['Price'])
+                await asyncio.sleep(self.delay)
+
+
+class PollingFeed:
+    """Опрос последних цен у поставщика котировок (provider.last_price) с интервалом interval секунд."""
+
+    def __init__(self, provider, tickers, interval=60.0, rounds=None):
+        self.provider = provider
+        self.tickers = list(tickers)
+        self.interval = interval
+        self.rounds = rounds  # None — бесконечно
+
+    async def __aiter__(self):
+        done = 0
+        while self.rounds is None or done < self.rounds:
+            for ticker in self.tickers:
+                try:
+                    price = await asyncio.to_thread(self.provider.last_price, ticker)
+                except Exception as e:
+                    logger.warning(f"Не удалось получить цену {ticker}: {e}")
+                    continue
+                yield ticker, datetime.now(), price
+            done += 1
+            await asyncio.sleep(self.interval)
+
+
+class SignalStream:
+    """
+    Асинхронный потребитель потока котировок: обновляет TickerState по каждой котировке
+    и рассылает подписчикам свежие сигналы. Подписчик — функция или корутина callback(signals).
+    """
+
+    def __init__(self, sma_windows=(50, 200), rsi_window=14, sortino_window=None):
+        self.options = dict(sma_windows=sma_windows, rsi_window=rsi_window, sortino_window=sortino_window)
+        self.states = {}
+        self.subscribers = []
+
+    def state(self, ticker):
+        if ticker not in self.states:
+            self.states[ticker] = TickerState(ticker, **self.options)
+        return self.states[ticker]
+
+    def seed(self, ticker, closes, day=None):
+        self.state(ticker).seed(closes, day)
+
+    def subscribe(self, callback):
+        self.subscribers.append(callback)
+        return callback
+
+    async def publish(self, signals):
+        for callback in self.subscribers:
+            result = callback(signals)
+            if inspect.isawaitable(result):
+                await result
+
+    async def consume(self, feed, tickers=None):
+        """
+        Читает поток до конца.
+        :param tickers: Обрабатывать только эти тикеры (по умолчанию все)
+        :return: Число обработанных котировок
+        """
+        count = 0
+        async for ticker, time, price in feed:
+            if tickers is not None and ticker not in tickers:
+                continue
+            state = self.state(ticker)
+            state.update(time, price)
+            METRICS.incr('stream_quotes_total', ticker=ticker)
+            await self.publish(state.signals())
+            count += 1
+        return count
+
+    def snapshot(self):
+        return {ticker: state.signals() for ticker, state in self.states.items()}
+
+
+def log_signals(signals):
+    logger.info(f"{signals['ticker']} {signals['price']}: SMA_50 {signals['SMA_50']:.2f}, SMA_200 {signals['SMA_200']:.2f}, "
+                f"RSI {signals['RSI']:.1f}, Sortino {signals['sortino']:.4f}")
+
+
+def main(argv=None):
+    from FinLogic import FinLogic, common_arguments
+
+    parser = argparse.ArgumentParser(description="Потоковое обновление SMA, RSI и Сортино по позициям портфеля",
+                                     parents=[common_arguments()])
+    parser.add_argument('--replay', metavar='CSV', help="Воспроизвести котировки из CSV (Timestamp, Ticker, Price)")
+    parser.add_argument('--interval', type=float, default=60.0, help="Интервал опроса цен в секундах")
+    parser.add_argument('--tickers', nargs='*', help="Тикеры (по умолчанию — позиции портфеля)")
+    args = parser.parse_args(argv)
+
+    with run_session(args.log_level, args.metrics, args.profile), FinLogic.from_args(args) as fin_logic:
+        tickers = args.tickers or list(fin_logic.current_portfolio)
+        feed = CSVReplayFeed(args.replay) if args.replay else PollingFeed(fin_logic.provider, tickers, args.interval)
+        stream = fin_logic.signal_stream(tickers)
+        stream.subscribe(log_signals)
+        return asyncio.run(stream.consume(feed, set(tickers)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+import threading
+import time
+
+from instrumentation import METRICS
+from kvstore import KVStore
+
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    Простой кэш ключ-значение со временем жизни записей.
+    Если задан path (или готовый store), записи хранятся в KVStore в пространстве имён
+    namespace и видны другим процессам, иначе — в памяти процесса.
+    ttl — наибольший срок жизни: get может требовать более свежие записи, но в
+    хранилище запись истекает через ttl и удаляется KVStore.purge.
+    """
+
+    def __init__(self, ttl, path=None, namespace='cache', store=None):
+        self.ttl = ttl
+        self.namespace = namespace
+        self.store = store if store is not None else (KVStore(path) if path else None)
+        self.name = namespace if self.store is not None else 'memory'  # Метка в метриках
+        self.entries = {}
+        self.lock = threading.Lock()
+
+    def get(self, key, ttl=None, default=None):
+        max_age = self.ttl if ttl is None else ttl
+        if self.store is not None:
+            value = self.store.get(self.namespace, key, default=_MISSING, max_age=max_age)
+        else:
+            with self.lock:
+                entry = self.entries.get(key)
+            value = entry[1] if entry is not None and time.time() - entry[0] <= max_age else _MISSING
+        if value is _MISSING:
+            METRICS.cache(self.name, False)
+            return default
+        METRICS.cache(self.name, True)
+        return value
+
+    def set(self, key, value):
+        self.set_many({key: value})
+
+    def set_many(self, items):
+        if self.store is not None:
+            # Одна транзакция на пакет; более короткий срок для отдельных ключей проверяется при чтении
+            self.store.set_many(self.namespace, items, ttl=self.ttl)
+            return
+        now = time.time()
+        with self.lock:
+            for key, value in items.items():
+                self.entries[key] = [now, value]
@@ -0,0 +1,70 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from solvers import get_problem
+
+
+def _scenario_order(budgets, risk_tolerances):
+    """Змейка по сетке: соседние решения отличаются одним параметром, что помогает тёплому старту."""
+    order = []
+    for i, risk_tolerance in enumerate(risk_tolerances):
+        row = budgets if i % 2 == 0 else list(reversed(budgets))
+        order.append([(budget, risk_tolerance) for budget in row])
+    return order
+
+
+def _solve_scenarios(mean_returns, cov_matrix, prices, n_stocks, scenarios, min_lot, backend):
+    problem = get_problem(n_stocks, len(prices) - n_stocks)
+    results = []
+    for i, (budget, risk_tolerance) in enumerate(scenarios):
+        problem.set_data(mean_returns, cov_matrix, prices, budget, min_lot, risk_tolerance)
+        result = problem.solve(backend, warm_start=i > 0)
+        results.append((budget, risk_tolerance, result))
+    return results
+
+
+def solve_grid(mean_returns, cov_matrix, prices, n_stocks, budgets, risk_tolerances, min_lot,
+               backend='auto', processes=None):
+    """
+    Решает сетку сценариев бюджет × допустимый риск на одних и тех же доходностях и ковариации.
+    :param budgets: Бюджеты в валюте цен
+    :param risk_tolerances: Допустимые значения риска
+    :param processes: Число процессов; None — последовательно в текущем процессе
+    :return: Список (budget, risk_tolerance, SolveResult)
+    """
+    rows = _scenario_order(list(budgets), list(risk_tolerances))
+    if not processes or processes <= 1 or len(rows) == 1:
+        scenarios = [scenario for row in rows for scenario in row]
+        return _solve_scenarios(mean_returns, cov_matrix, prices, n_stocks, scenarios, min_lot, backend)
+
+    # Каждый процесс строит модель один раз и проходит свою строку сетки с тёплым стартом
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        futures = [pool.submit(_solve_scenarios, mean_returns, cov_matrix, prices, n_stocks, row, min_lot, backend)
+                   for row in rows]
+        return [item for future in futures for item in future.result()]
+
+
+def grid_to_frame(results, tickers, prices, conversion_rate=1.0):
+    """
+    Аккуратная таблица: одна строка на сценарий и тикер.
+    Бюджет и суммы в базовой валюте пересчитываются по conversion_rate.
+    """
+    records = []
+    for budget, risk_tolerance, result in results:
+        quantities = result.quantities if result.quantities is not None else [0.0] * len(tickers)
+        for ticker, price, quantity in zip(tickers, prices, quantities):
+            records.append({
+                'investment': round(budget * conversion_rate, 2),
+                'risk_tolerance': risk_tolerance,
+                'ticker': ticker,
+                'quantity': quantity,
+                'value_usd': quantity * price,
+                'value_local': quantity * price * conversion_rate,
+                'status': result.status,
+                'solver': result.solver,
+                'objective': result.objective,
+                'gap': result.gap,
+            })
+    frame = pd.DataFrame(records)
+    return frame.sort_values(['risk_tolerance', 'investment', 'ticker']).reset_index(drop=True)